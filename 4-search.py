@@ -1,28 +1,75 @@
 # 4-search.py
 import argparse
-from sentence_transformers import SentenceTransformer
-import lancedb
 import numpy as np
+from embed_and_store import build_where, search_chunks
+from mmap_index import build_filters
+from table_index import search_index, table_search
+from utils.tracing import span, format_trace
 
 DB_PATH = "lancedb_db"
 TABLE_NAME = "sp_blocks_vectors"
 EMBED_MODEL = "all-MiniLM-L6-v2"
 
-def search(query, top_k=5):
-    embedder = SentenceTransformer(EMBED_MODEL)
-    qvec = embedder.encode([query])[0].astype(np.float32).tolist()
-    db = lancedb.connect(DB_PATH)
-    tbl = db.open_table(TABLE_NAME)
-    results = tbl.search(qvec).limit(top_k).to_pandas()
+def search(query, top_k=5, where=None, backend="lancedb", filters=None, tables=None, writes=False):
+    """
+    `where` filters the lancedb backend, `filters` (mmap_index.build_filters)
+    the mmap one. `tables` keeps only chunks that reference (with `writes`,
+    write) those tables; without it, tables named in the query are boosted.
+    """
+    # Heavy imports stay here so `--help` doesn't load torch
+    from sentence_transformers import SentenceTransformer
+
+    with span("embed.load_model"):
+        embedder = SentenceTransformer(EMBED_MODEL)
+    with span("embed.query"):
+        qvec = embedder.encode([query])[0].astype(np.float32).tolist()
+    if backend == "mmap":
+        from mmap_index import open_index
+
+        with span("mmap.open"):
+            index = open_index(DB_PATH, TABLE_NAME)
+        run, base = (lambda restriction, k: index.search_chunks(qvec, top_k=k, filters=restriction)), filters
+    else:
+        import lancedb
+
+        with span("lancedb.open"):
+            db = lancedb.connect(DB_PATH)
+            tbl = db.open_table(TABLE_NAME)
+        run, base = (lambda restriction, k: search_chunks(tbl, qvec, top_k=k, where=restriction)), where
+
+    tables_index = search_index(DB_PATH, TABLE_NAME, required=bool(tables))
+    results, names = table_search(run, tables_index, query, tables, writes, base, top_k, backend)
+    if names:
+        print(f"TABLES → {', '.join(names)}" + ("" if tables else " (boosted)"))
+    elif tables:
+        print(f"⚠️  No chunk references {', '.join(tables)}")
     return results
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--query", type=str, required=True)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--object", type=str, help="Only search blocks of this object (e.g. a procedure name)")
+    parser.add_argument("--schema", type=str, help="Only search blocks from this schema")
+    parser.add_argument("--domain", type=str, help="Only search this object domain (PROCEDURE, VIEW, ...)")
+    parser.add_argument("--block-type", type=str, help="Only search blocks of this type (SELECT, MERGE, ...)")
+    parser.add_argument("--table", type=str, action="append",
+                        help="Only search blocks that reference this table (repeatable; VBAK or SAPABAP1.VBAK)")
+    parser.add_argument("--writes", action="store_true", help="With --table: only blocks that write the table")
+    parser.add_argument("--backend", choices=["lancedb", "mmap"], default="lancedb",
+                        help="mmap: exact search over a memory-mapped export of the table")
     args = parser.parse_args()
+    where = build_where(args.object, args.schema, args.domain, args.block_type)
+    filters = build_filters(args.object, args.schema, args.domain, args.block_type)
     print("USER QUERY →", args.query)
-    results = search(args.query, top_k=5)
+    if where:
+        print("FILTER →", where)
+    with span("search.query", top_k=args.top_k) as root:
+        results = search(args.query, top_k=args.top_k, where=where, backend=args.backend, filters=filters,
+                         tables=args.table, writes=args.writes)
     print(f"✅ Found {len(results)} results\n")
     for i, r in results.iterrows():
         score = r.get("score") or r.get("_distance") or r.get("_dist") or r.get("vector_score") or 0
-        print(f"[{i+1}] Score={float(score):.4f}\n{r['block_text'][:600]}\n")
+        location = f" {r['object_name']} [{r['start_block']}-{r['end_block']}]" if "object_name" in r else ""
+        print(f"[{i+1}] Score={float(score):.4f}{location}\n{str(r['text'])[:600]}\n")
+    print(format_trace(root))
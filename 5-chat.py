@@ -1,77 +1,297 @@
 # 5-chat.py
-import os
 from dotenv import load_dotenv
-from groq import Groq
-from sentence_transformers import SentenceTransformer
-import lancedb
 import numpy as np
 import argparse
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from embed_and_store import build_where, search_chunks
+from mmap_index import build_filters
+from table_index import search_index, table_search
+from context_assembler import assemble_context
+from sql_minify import MINIFY_MIN_TOKENS
+from llm_client import LLM_MAX_RETRIES, LLM_MODEL, LLM_RPS, ask
+from llm_stream import stream_chat, format_metrics
+from batch_chat import read_questions, write_jsonl, complete_all
+from utils.tracing import span, format_trace
 
 load_dotenv()
 
-GROQ_KEY = os.getenv("GROQ_API_KEY")
 DB_PATH = "lancedb_db"
 TABLE_NAME = "sp_blocks_vectors"
 
 # Must match what you stored earlier
 EMBED_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
-LLM_MODEL = "llama-3.3-70b-versatile"   # recommended Groq model
+MAX_CONTEXT_TOKENS = 2000
 
-def retrieve_context(query, top_k=5):
-    """Vector search over LanceDB."""
-    embedder = SentenceTransformer(EMBED_MODEL)
-    qvec = embedder.encode([query])[0].astype(np.float32).tolist()
+# Contexts whose raw SQL is over this many tokens are minified (--no-minify: never)
+MINIFY_OVER = MINIFY_MIN_TOKENS
 
-    db = lancedb.connect(DB_PATH)
-    tbl = db.open_table(TABLE_NAME)
 
-    # Important: specify correct vector column
-    results = tbl.search(qvec, vector_column="embedding").limit(top_k).to_pandas()
+# torch / lancedb / groq are imported only on the paths that use them, so
+# `--help` and argument errors return immediately
+def _load_embedder():
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(EMBED_MODEL)
 
+
+def _open_table():
+    import lancedb
+    return lancedb.connect(DB_PATH).open_table(TABLE_NAME)
+
+
+def _open_index():
+    from mmap_index import open_index
+    return open_index(DB_PATH, TABLE_NAME)
+
+
+def _open_table_index(required=False):
+    return search_index(DB_PATH, TABLE_NAME, required)
+
+
+def _pack_context(results, max_tokens, minify_over=MINIFY_OVER):
     if results.empty:
+        return "", {"chunks_in": 0, "spans_packed": 0, "context_tokens": 0}
+    with span("context.assemble", chunks=len(results)) as s:
+        context, stats = assemble_context(results.to_dict("records"), max_tokens=max_tokens,
+                                          minify_over=minify_over)
+        s.set(tokens=stats["context_tokens"], raw_tokens=stats["context_tokens_raw"])
+    return context, stats
+
+
+def retrieve_context(query, top_k=5, where=None, max_tokens=MAX_CONTEXT_TOKENS, backend="lancedb", filters=None,
+                     tables=None, writes=False, minify_over=MINIFY_OVER):
+    """
+    Vector search over LanceDB (or its memory-mapped export with
+    backend="mmap"), optionally prefiltered on chunk metadata and on the
+    `tables` the chunks reference (with `writes`, write); without
+    `tables`, chunks of tables named in the query are ranked first.
+    Hits are deduplicated, merged into contiguous spans and packed into
+    a `max_tokens` budget, minified first when the SQL is over
+    `minify_over` tokens (None: never).
+    """
+    with span("embed.load_model"):
+        embedder = _load_embedder()
+    with span("embed.query"):
+        qvec = embedder.encode([query])[0].astype(np.float32).tolist()
+
+    if backend == "mmap":
+        with span("mmap.open"):
+            index = _open_index()
+        run, base = (lambda restriction, k: index.search_chunks(qvec, top_k=k, filters=restriction)), filters
+    else:
+        with span("lancedb.open"):
+            tbl = _open_table()
+        run, base = (lambda restriction, k: search_chunks(tbl, qvec, top_k=k, where=restriction)), where
+    results, names = table_search(run, _open_table_index(required=bool(tables)), query, tables, writes, base,
+                                  top_k, backend)
+    if names:
+        print(f"📋 Tables: {', '.join(names)}" + ("" if tables else " (boosted)"))
+    context, stats = _pack_context(results, max_tokens, minify_over)
+    if not context:
         return ""
 
-    # Use `text` column, not block_text
-    context = "\n\n---\n\n".join(results["text"].tolist())
+    minified = f" (minified from {stats['context_tokens_raw']})" if stats.get("minified") else ""
+    print(
+        f"🧩 Context: {stats['chunks_in']} chunks → {stats['spans_packed']} spans, "
+        f"{stats['context_tokens']} tokens{minified}"
+    )
     return context
 
 
+SYSTEM_PROMPT = (
+    "You are an expert SQL lineage and ETL logic assistant. "
+    "Always answer strictly based on the provided context. "
+    "If the answer is not in context, say so."
+)
+
+
 def call_groq(prompt):
-    client = Groq(api_key=GROQ_KEY)
-    resp = client.chat.completions.create(
-        model=LLM_MODEL,
-        temperature=0.1,
-        messages=[
-            {
-                "role": "system",
-                "content": (
-                    "You are an expert SQL lineage and ETL logic assistant. "
-                    "Always answer strictly based on the provided context. "
-                    "If the answer is not in context, say so."
-                )
-            },
+    return ask(prompt, SYSTEM_PROMPT, model=LLM_MODEL)
+
+
+def stream_groq(prompt, metrics=None):
+    """Yield the answer incrementally; `metrics` gets TTFT, latency and token counts."""
+    return stream_chat(
+        [
+            {"role": "system", "content": SYSTEM_PROMPT},
             {"role": "user", "content": prompt}
         ],
+        model=LLM_MODEL,
+        temperature=0.1,
+        metrics=metrics,
     )
-    return resp.choices[0].message.content
+
+
+def _question_tables(q):
+    # "table" in a .jsonl question may be one name or a list, like repeated --table
+    tables = q.get("table")
+    return [tables] if isinstance(tables, str) else tables or None
+
+
+def _retrieve_batch_mmap(questions, vectors, top_k, max_tokens, table_index=None, minify_over=MINIFY_OVER):
+    """
+    Questions sharing the same filters are searched together, one matmul
+    per group; those restricted to or mentioning tables go through
+    table_search one by one.
+    """
+    index = _open_index()
+    groups = {}
+    retrieved = [None] * len(questions)
+    for i, q in enumerate(questions):
+        filters = build_filters(q.get("object"), q.get("schema"), q.get("domain"), q.get("block_type"))
+        tables = _question_tables(q)
+        if table_index is not None and (tables or table_index.mentions(q["question"])):
+            start = time.perf_counter()
+            qvec = vectors[i].tolist()
+            found, _ = table_search(lambda restriction, k: index.search_chunks(qvec, top_k=k, filters=restriction),
+                                    table_index, q["question"], tables, q.get("writes", False), filters, top_k,
+                                    "mmap")
+            retrieved[i] = (*_pack_context(found, max_tokens, minify_over), time.perf_counter() - start)
+            continue
+        groups.setdefault(tuple(sorted((filters or {}).items())), []).append(i)
+    for key, members in groups.items():
+        start = time.perf_counter()
+        results = index.search_many(vectors[members], top_k=top_k, filters=dict(key))
+        search_s = (time.perf_counter() - start) / len(members)
+        for i, found in zip(members, results):
+            retrieved[i] = (*_pack_context(found, max_tokens, minify_over), search_s)
+    return retrieved
+
+
+def run_batch(questions_file, out_path, concurrency=8, rps=LLM_RPS, retries=LLM_MAX_RETRIES,
+              top_k=5, max_tokens=MAX_CONTEXT_TOKENS, backend="lancedb", defaults=None, minify_over=MINIFY_OVER):
+    """
+    Answer every question in `questions_file` and write one JSONL row per
+    question with the answer, context and per-stage timings. `defaults`
+    (object, schema, domain, block_type, table, writes) apply to every
+    question that doesn't set its own. `minify_over` as in retrieve_context.
+    """
+    defaults = {k: v for k, v in (defaults or {}).items() if v}
+    questions = [{**defaults, **q} for q in read_questions(questions_file)]
+    print(f"📄 Loaded {len(questions)} questions from {questions_file}")
+    if not questions:
+        return
+
+    # One batched encode call for all questions
+    t0 = time.perf_counter()
+    embedder = _load_embedder()
+    vectors = embedder.encode([q["question"] for q in questions], batch_size=64,
+                              convert_to_numpy=True).astype(np.float32)
+    embed_s = time.perf_counter() - t0
+    print(f"🧠 Embedded {len(questions)} questions in {embed_s:.2f}s")
+
+    t0 = time.perf_counter()
+    table_index = _open_table_index(required=any(_question_tables(q) for q in questions))
+    if backend == "mmap":
+        retrieved = _retrieve_batch_mmap(questions, vectors, top_k, max_tokens, table_index, minify_over)
+    else:
+        tbl = _open_table()
+
+        def search_one(i):
+            q = questions[i]
+            where = build_where(q.get("object"), q.get("schema"), q.get("domain"), q.get("block_type"))
+            qvec = vectors[i].tolist()
+            start = time.perf_counter()
+            # Same table restriction / boost as retrieve_context
+            results, _ = table_search(lambda restriction, k: search_chunks(tbl, qvec, top_k=k, where=restriction),
+                                      table_index, q["question"], _question_tables(q), q.get("writes", False),
+                                      where, top_k)
+            context, stats = _pack_context(results, max_tokens, minify_over)
+            return context, stats, time.perf_counter() - start
+
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            retrieved = list(pool.map(search_one, range(len(questions))))
+    print(f"🔍 Retrieved contexts in {time.perf_counter() - t0:.2f}s")
+
+    prompts = [f"CONTEXT:\n{ctx}\n\nQUESTION: {q['question']}" for q, (ctx, _, _) in zip(questions, retrieved)]
+    t0 = time.perf_counter()
+    answers = asyncio.run(complete_all(
+        prompts, LLM_MODEL, SYSTEM_PROMPT,
+        concurrency=concurrency, rps=rps, retries=retries,
+    ))
+    llm_wall_s = time.perf_counter() - t0
+
+    rows = []
+    for q, (context, stats, search_s), answer in zip(questions, retrieved, answers):
+        rows.append({
+            **q,
+            **answer,
+            "context": context,
+            "context_tokens": stats.get("context_tokens"),
+            "context_tokens_raw": stats.get("context_tokens_raw"),
+            "embed_s": embed_s / len(questions),
+            "search_s": search_s,
+        })
+    write_jsonl(out_path, rows)
+
+    failed = sum(1 for r in rows if r.get("error"))
+    print(f"🤖 {len(rows) - failed}/{len(rows)} answered in {llm_wall_s:.2f}s "
+          f"({len(rows) / llm_wall_s:.1f} q/s), {failed} failed")
+    print(f"💾 Wrote {out_path}")
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
-    parser.add_argument("--query", type=str, required=True)
+    mode = parser.add_mutually_exclusive_group(required=True)
+    mode.add_argument("--query", type=str)
+    mode.add_argument("--questions-file", type=str, help="Batch mode: .txt (one per line) or .jsonl questions")
+    parser.add_argument("--object", type=str, help="Only use blocks of this object (e.g. a procedure name)")
+    parser.add_argument("--schema", type=str, help="Only use blocks from this schema")
+    parser.add_argument("--domain", type=str, help="Only use this object domain (PROCEDURE, VIEW, ...)")
+    parser.add_argument("--block-type", type=str, help="Only use blocks of this type (SELECT, MERGE, ...)")
+    parser.add_argument("--top-k", type=int, default=5, help="Blocks retrieved per question")
+    parser.add_argument("--max-context-tokens", type=int, default=MAX_CONTEXT_TOKENS)
+    parser.add_argument("--no-stream", action="store_true", help="Wait for the full answer instead of streaming")
+    parser.add_argument("--out", type=str, default="batch_answers.jsonl", help="Batch mode output JSONL")
+    parser.add_argument("--concurrency", type=int, default=8, help="Batch mode: parallel searches / LLM calls")
+    parser.add_argument("--rps", type=float, default=LLM_RPS,
+                        help="Batch mode: max LLM requests per second (0 = unlimited; default LLM_RPS)")
+    parser.add_argument("--retries", type=int, default=LLM_MAX_RETRIES,
+                        help="Batch mode: retries per LLM call (default LLM_MAX_RETRIES)")
+    parser.add_argument("--backend", choices=["lancedb", "mmap"], default="lancedb",
+                        help="mmap: exact search over a memory-mapped export of the table")
+    parser.add_argument("--no-minify", action="store_true", help="Send the retrieved SQL as is")
+    parser.add_argument("--table", type=str, action="append",
+                        help="Only use blocks that reference this table (repeatable; VBAK or SAPABAP1.VBAK)")
+    parser.add_argument("--writes", action="store_true", help="With --table: only blocks that write the table")
     args = parser.parse_args()
+    minify_over = None if args.no_minify else MINIFY_OVER
+
+    if args.questions_file:
+        # The filters given on the command line are defaults for every question
+        run_batch(args.questions_file, args.out, concurrency=args.concurrency, rps=args.rps,
+                  retries=args.retries, top_k=args.top_k, max_tokens=args.max_context_tokens, backend=args.backend,
+                  defaults={"object": args.object, "schema": args.schema, "domain": args.domain,
+                            "block_type": args.block_type, "table": args.table, "writes": args.writes},
+                  minify_over=minify_over)
+        exit()
 
     query = args.query
     print("USER QUERY →", query)
 
-    context = retrieve_context(query)
+    where = build_where(args.object, args.schema, args.domain, args.block_type)
+    with span("chat.query", where=where or "") as root:
+        context = retrieve_context(query, top_k=args.top_k, where=where, max_tokens=args.max_context_tokens,
+                                   backend=args.backend,
+                                   filters=build_filters(args.object, args.schema, args.domain, args.block_type),
+                                   tables=args.table, writes=args.writes, minify_over=minify_over)
 
-    if not context.strip():
-        print("❌ No relevant context found in LanceDB.")
-        exit()
+        if not context.strip():
+            print("❌ No relevant context found in LanceDB.")
+            exit()
 
-    prompt = f"CONTEXT:\n{context}\n\nQUESTION: {query}"
+        prompt = f"CONTEXT:\n{context}\n\nQUESTION: {query}"
 
-    answer = call_groq(prompt)
-    print("\n========================\nFINAL ANSWER:\n")
-    print(answer)
+        print("\n========================\nFINAL ANSWER:\n")
+        if args.no_stream:
+            with span("llm.complete"):
+                print(call_groq(prompt))
+        else:
+            metrics = {}
+            with span("llm.stream") as llm:
+                for delta in stream_groq(prompt, metrics):
+                    print(delta, end="", flush=True)
+                llm.set(**metrics)
+            print(f"\n\n⏱️  {format_metrics(metrics)}")
+    print(f"\n{format_trace(root)}")
@@ -1,4 +1,5 @@
 import os
+import re
 import textwrap
 from dotenv import load_dotenv
 from utils.snowflake_connection import get_connection
@@ -7,6 +8,14 @@ from utils.snowflake_connection import get_connection
 load_dotenv()
 
 
+# Leading keywords recognised as a chunk's block_type
+BLOCK_KEYWORDS = {
+    "ALTER", "BEGIN", "CALL", "CREATE", "DECLARE", "DELETE", "DROP", "ELSE", "END",
+    "EXCEPTION", "FOR", "IF", "INSERT", "LET", "MERGE", "RETURN", "RETURNS", "SELECT",
+    "SET", "TRUNCATE", "UPDATE", "WITH",
+}
+
+
 class MappingExtractorAgent:
     def __init__(self):
         """
@@ -46,21 +55,41 @@ class MappingExtractorAgent:
     # CHUNKING METHOD (REQUIRED)
     # ------------------------------
     def chunk_sql_text(self, ddl_text, max_len=500):
+        """
+        Split DDL into ~max_len character blocks on line boundaries.
+        Each chunk carries its block range (1-based line numbers) and the
+        leading SQL keyword as block_type, matching chunks/chunks.json.
+        """
         lines = ddl_text.split("\n")
         chunks = []
         buffer = []
+        start_line = 1
 
-        for line in lines:
+        for line_no, line in enumerate(lines, start=1):
             buffer.append(line)
             if sum(len(l) for l in buffer) > max_len:
-                chunks.append({"text": "\n".join(buffer)})
+                chunks.append(self._make_chunk(len(chunks), buffer, start_line, line_no))
                 buffer = []
+                start_line = line_no + 1
 
         if buffer:
-            chunks.append({"text": "\n".join(buffer)})
+            chunks.append(self._make_chunk(len(chunks), buffer, start_line, len(lines)))
 
         return chunks
 
+    @staticmethod
+    def _make_chunk(index, buffer, start_line, end_line):
+        text = "\n".join(buffer)
+        match = re.search(r"^\s*(?:--[^\n]*\n\s*)*([A-Za-z]+)", text)
+        keyword = match.group(1).upper() if match else ""
+        return {
+            "block_id": str(index + 1),
+            "block_type": keyword if keyword in BLOCK_KEYWORDS else "",
+            "start_block": start_line,
+            "end_block": end_line,
+            "text": text,
+        }
+
 
 # ------------------------------
 # QUICK TEST
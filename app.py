@@ -1,16 +1,22 @@
 # app.py
-import os, re
+import os
+import uuid
 import streamlit as st
 import pandas as pd
-import networkx as nx
-from pyvis.network import Network
 from agents.mapping_extractor import MappingExtractorAgent
+from lineage import fetch_objects, fetch_query_templates, crud_from_templates, template_summary, LineageGraph
 from dotenv import load_dotenv
 from datetime import datetime, timedelta
 import streamlit.components.v1 as components
-import numpy as np
-from sentence_transformers import SentenceTransformer
-from groq import Groq
+from llm_client import LLM_MODEL, ask
+from llm_stream import stream_chat, format_metrics
+from utils.tracing import span, recent_traces, latency_percentiles
+from utils.shared_cache import shared_cache
+from utils.jobs import jobs
+from graph_retrieval import NodeIndex, retrieve, DEFAULT_HOPS
+from sql_minify import minify_context
+from graph_layout import compute_layout, network_html
+from lineage_batch import OUT_DIR as LINEAGE_BATCH_DIR, load_snapshot as load_batch_snapshot
 
 st.set_page_config(page_title="SQL Object Lineage & CRUD", layout="wide")
 st.title("💬 SQL Object Lineage & CRUD Assistant")
@@ -27,7 +33,14 @@ DEFAULT_DATABASE = os.getenv("SNOWFLAKE_DATABASE", "")
 DEFAULT_SCHEMA = os.getenv("SNOWFLAKE_SCHEMA", "")
 DEFAULT_PRIVATE_KEY_FILE = os.getenv("SNOWFLAKE_PRIVATE_KEY_FILE", "")
 DEFAULT_PRIVATE_KEY_PASSPHRASE = os.getenv("SNOWFLAKE_PRIVATE_KEY_PASSPHRASE", "")
-GROQ_KEY = os.getenv("GROQ_API_KEY")
+CRUD_LOOKBACK_DAYS = 30
+EMBED_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+# Seconds between refreshes of a running background job's progress
+JOB_POLL_SECONDS = 1.0
+
+# Objects parsed into the graph between progress updates / cancellation checks
+GRAPH_BATCH = 200
 
 # -----------------------------
 # Sidebar - Snowflake Config
@@ -46,16 +59,152 @@ st.sidebar.markdown("---")
 st.sidebar.header("Options")
 show_lineage = st.sidebar.checkbox("Show Lineage Graph", True)
 show_usage_matrix = st.sidebar.checkbox("Show CRUD Usage Matrix", True)
-physics_strength = st.sidebar.slider("Graph Physics Strength", 0.5, 5.0, 1.0)
+# Positions are computed server-side; physics only re-settles them in the browser
+graph_physics = st.sidebar.checkbox("Graph Physics", False)
+show_diagnostics = st.sidebar.checkbox("Show Diagnostics", False)
+retrieval_mode = st.sidebar.radio("Retrieval", ["Graph neighborhood", "Whole schema"])
+retrieval_hops = st.sidebar.slider("Neighborhood hops", 1, 5, DEFAULT_HOPS)
 
 # -----------------------------
 # Session state
 # -----------------------------
 if "agent" not in st.session_state: st.session_state.agent = None
 if "global_graph" not in st.session_state: st.session_state.global_graph = None
+if "lineage" not in st.session_state: st.session_state.lineage = None
 if "node_sql_map" not in st.session_state: st.session_state.node_sql_map = {}
 if "crud_matrix" not in st.session_state: st.session_state.crud_matrix = {}
 if "objects" not in st.session_state: st.session_state.objects = {"PROCEDURE": [], "VIEW": [], "TABLE": []}
+if "cache_key" not in st.session_state: st.session_state.cache_key = None
+if "query_templates" not in st.session_state: st.session_state.query_templates = None
+# slot ("graph", "ask") -> key of the background job this session is following
+if "jobs" not in st.session_state: st.session_state.jobs = {}
+# Owner id of this session on shared background jobs
+if "session_id" not in st.session_state: st.session_state.session_id = uuid.uuid4().hex
+if "last_answer" not in st.session_state: st.session_state.last_answer = None
+
+# Loaded schemas live in the process-wide shared_cache, not per session:
+# sessions hold references to the same read-only snapshot.
+def schema_cache_key(account, database, schema, lookback_days):
+    return (account.upper(), database.upper(), schema.upper(), lookback_days)
+
+def _step(job, stage, fraction, message="", **partials):
+    # Background jobs (see utils/jobs.py) can be cancelled between any two steps
+    if job is None:
+        return
+    job.check()
+    job.progress(stage, fraction, message)
+    for name, value in partials.items():
+        job.partial(name, value)
+
+def load_schema_snapshot(agent, database, schema, lookback_days, job=None):
+    fetched = {}
+    for i, domain in enumerate(("PROCEDURE", "VIEW", "TABLE")):
+        _step(job, "fetch", 0.1 * i, f"{domain} DDL")
+        with span("snowflake.fetch_objects", domain=domain):
+            fetched[domain] = fetch_objects(agent, database, schema, domain)
+    procs, views, tables = fetched["PROCEDURE"], fetched["VIEW"], fetched["TABLE"]
+    all_objects = procs + views + tables
+    with span("lineage.build_graph", objects=len(all_objects)):
+        lineage = LineageGraph()
+        for start in range(0, len(all_objects), GRAPH_BATCH):
+            _step(job, "parse", 0.3 + 0.5 * start / len(all_objects), f"{start}/{len(all_objects)} objects",
+                  objects={d: len(o) for d, o in fetched.items()}, graph_nodes=len(lineage.graph))
+            lineage.apply(all_objects[start:start + GRAPH_BATCH])
+    _step(job, "crud", 0.8, f"{lookback_days} days of QUERY_HISTORY", graph_nodes=len(lineage.graph))
+    with span("snowflake.fetch_crud_usage") as s:
+        templates = fetch_query_templates(agent, database, schema, lookback_days)
+        crud_matrix = crud_from_templates(templates)
+        s.set(templates=len(templates))
+    return {
+        "lineage": lineage,
+        "objects": {"PROCEDURE": procs, "VIEW": views, "TABLE": tables},
+        "crud_matrix": crud_matrix,
+        "query_templates": template_summary(templates),
+    }
+
+def use_snapshot(key, snapshot):
+    st.session_state.cache_key = key
+    st.session_state.lineage = snapshot["lineage"]
+    st.session_state.global_graph = snapshot["lineage"].graph
+    st.session_state.node_sql_map = snapshot["lineage"].node_sql_map
+    st.session_state.objects = snapshot["objects"]
+    st.session_state.crud_matrix = snapshot["crud_matrix"]
+    st.session_state.query_templates = snapshot.get("query_templates")
+
+# Loads and answers run as background jobs so the page stays usable and a
+# rerun re-attaches to the running job instead of aborting or repeating it
+def load_job(job, agent, key, database, schema, lookback_days):
+    with span("app.load_graph", schema=schema) as s:
+        snapshot, source = shared_cache.get_or_load(
+            key, lambda: load_schema_snapshot(agent, database, schema, lookback_days, job))
+        s.set(cache=source)
+    return {"key": key, "snapshot": snapshot, "source": source}
+
+# Only re-extract objects whose DDL changed since the last load. The
+# cached graph is shared, so the deltas go to a copy that replaces it.
+def refresh_job(job, agent, key, snapshot, database, schema):
+    _step(job, "refresh", 0.1, "changed DDL")
+    with span("app.refresh_graph", schema=schema) as s:
+        lineage = snapshot["lineage"].copy()
+        delta = lineage.refresh(agent, database, schema)
+        s.set(**delta)
+    snapshot = {**snapshot, "lineage": lineage, "objects": lineage.objects_by_domain()}
+    shared_cache.put(key, snapshot)
+    return {"key": key, "snapshot": snapshot, "delta": delta}
+
+def submit_job(slot, key, name, fn, *args):
+    owner = st.session_state.session_id
+    previous = st.session_state.jobs.get(slot)
+    if previous is not None and previous != key:
+        # Following another job lets go of the old one
+        jobs.cancel(previous, owner=owner)
+    job, started = jobs.submit(key, name, fn, *args, owner=owner)
+    st.session_state.jobs[slot] = job.key
+    if not started:
+        st.info(f"⏳ {name} is already running; showing its progress.")
+
+def finished_job(slot):
+    """This session's `slot` job once it stopped running (the slot is cleared), else None."""
+    key = st.session_state.jobs.get(slot)
+    job = jobs.get(key) if key else None
+    if key and (job is None or not job.active):
+        del st.session_state.jobs[slot]
+    return job if job is not None and not job.active else None
+
+def _job_progress(slot, render_partials):
+    key = st.session_state.jobs.get(slot)
+    job = jobs.get(key) if key else None
+    if job is None or not job.active:
+        # The full run picks up the result
+        st.rerun()
+    info = job.snapshot()
+    st.progress(info["fraction"], text=f"⏳ {info['name']} · {info['stage']} {info['message']} "
+                                        f"({info['elapsed_s']:.0f}s)")
+    render_partials(info["partials"])
+    if job.cancel_requested:
+        st.caption("Cancelling after the current step...")
+    elif st.button("Cancel", key=f"cancel_{slot}"):
+        # The job is shared: it only stops once every session following it cancelled
+        if not job.cancel(owner=st.session_state.session_id):
+            del st.session_state.jobs[slot]
+            st.session_state[f"detached_{slot}"] = job.name
+            st.rerun()
+
+def job_panel(slot, render_partials):
+    """Progress, partial results and Cancel for this session's `slot` job, refreshed while it runs."""
+    detached = st.session_state.pop(f"detached_{slot}", None)
+    if detached:
+        st.info(f"⏹️ Stopped following {detached}; other sessions still use it, so it keeps running.")
+    key = st.session_state.jobs.get(slot)
+    job = jobs.get(key) if key else None
+    if job is not None and job.active:
+        st.fragment(_job_progress, run_every=JOB_POLL_SECONDS)(slot, render_partials)
+
+def _graph_partials(partials):
+    objects = partials.get("objects") or {}
+    if objects:
+        st.caption(" · ".join(f"{n} {domain.lower()}s" for domain, n in objects.items())
+                   + f" · {partials.get('graph_nodes', 0)} graph nodes so far")
 
 # -----------------------------
 # Connect to Snowflake
@@ -89,102 +238,61 @@ if agent and agent.conn:
     except Exception as e:
         st.sidebar.error(f"Error fetching Snowflake info: {e}")
 
-# -----------------------------
-# Fetch objects from DB
-# -----------------------------
-def fetch_objects(agent, database, schema, obj_type):
-    if not agent or not agent.conn:
-        return []
-    query = f"""
-        SELECT OBJECT_NAME, DDL_TEXT
-        FROM "{database}"."{schema}"."DDL_METADATA"
-        WHERE OBJECT_DOMAIN = '{obj_type}'
-    """
-    cur = agent.conn.cursor()
-    cur.execute(query)
-    rows = cur.fetchall()
-    cur.close()
-    return [{"name": r[0].upper(), "ddl": r[1]} for r in rows]
-
-def extract_objects_from_ddl(ddl_text):
-    if not ddl_text:
-        return []
-    ddl_text = re.sub(r"--.*", "", ddl_text)
-    ddl_text = re.sub(r"\s+", " ", ddl_text)
-    return [t.upper() for t in re.findall(r"(?:FROM|JOIN|INSERT INTO|UPDATE|DELETE FROM)\s+([^\s(]+)", ddl_text, re.IGNORECASE)]
-
-# -----------------------------
-# Build object-level graph
-# -----------------------------
-def build_graph(objects_list):
-    G = nx.DiGraph()
-    node_sql_map = {}
-    for obj in objects_list:
-        obj_name = obj["name"]
-        ddl_text = obj["ddl"]
-        refs = extract_objects_from_ddl(ddl_text)
-        for ref in refs:
-            G.add_edge(obj_name, ref)
-            node_sql_map.setdefault(ref, []).append(ddl_text)
-            node_sql_map.setdefault(obj_name, []).append(ddl_text)
-    return G, node_sql_map
-
-# -----------------------------
-# Fetch CRUD usage with timestamps
-# -----------------------------
-def fetch_crud_usage(agent, database, schema, lookback_days=30):
-    if not agent or not agent.conn:
-        return {}
-    start_time = datetime.utcnow() - timedelta(days=lookback_days)
-    query = f"""
-        SELECT QUERY_TEXT, START_TIME
-        FROM SNOWFLAKE.ACCOUNT_USAGE.QUERY_HISTORY
-        WHERE DATABASE_NAME = '{database}'
-          AND SCHEMA_NAME = '{schema}'
-          AND START_TIME >= '{start_time.strftime('%Y-%m-%d %H:%M:%S')}'
-        ORDER BY START_TIME DESC
-    """
-    cur = agent.conn.cursor()
-    cur.execute(query)
-    rows = cur.fetchall()
-    cur.close()
-
-    crud_matrix = {}
-    for query_text, ts in rows:
-        q = query_text.upper()
-        for t in re.findall(r"INSERT INTO\s+([^\s(]+)", q): crud_matrix.setdefault(t, {}).setdefault("C", []).append(ts)
-        for t in re.findall(r"UPDATE\s+([^\s,]+)", q): crud_matrix.setdefault(t, {}).setdefault("U", []).append(ts)
-        for t in re.findall(r"DELETE FROM\s+([^\s,]+)", q): crud_matrix.setdefault(t, {}).setdefault("D", []).append(ts)
-        for t in re.findall(r"FROM\s+([^\s,;]+)", q) + re.findall(r"JOIN\s+([^\s,;]+)", q): crud_matrix.setdefault(t, {}).setdefault("R", []).append(ts)
-
-    result = {}
-    for obj, ops in crud_matrix.items():
-        result[obj] = {
-            "Object": obj,
-            "C": len(ops.get("C", [])),
-            "U": len(ops.get("U", [])),
-            "D": len(ops.get("D", [])),
-            "R": len(ops.get("R", [])),
-            "Execution Timestamps": {k: ops[k] for k in ops},
-            "Total CRUD": sum(len(v) for v in ops.values())
-        }
-    return result
-
 # -----------------------------
 # Load DB objects, graph, and CRUD
 # -----------------------------
 if agent and agent.conn:
     if st.sidebar.button("Load Graph & CRUD"):
-        procs = fetch_objects(agent, sf_database, sf_schema, "PROCEDURE")
-        views = fetch_objects(agent, sf_database, sf_schema, "VIEW")
-        tables = fetch_objects(agent, sf_database, sf_schema, "TABLE")
-        all_objects = procs + views + tables
-        G, node_sql_map = build_graph(all_objects)
-        st.session_state.global_graph = G
-        st.session_state.node_sql_map = node_sql_map
-        st.session_state.objects = {"PROCEDURE": procs, "VIEW": views, "TABLE": tables}
-        st.session_state.crud_matrix = fetch_crud_usage(agent, sf_database, sf_schema)
-        st.success(f"✅ Graph loaded with {len(G.nodes)} objects. CRUD fetched for {len(st.session_state.crud_matrix)} objects.")
+        key = schema_cache_key(sf_account, sf_database, sf_schema, CRUD_LOOKBACK_DAYS)
+        submit_job("graph", ("load",) + key, "Load Graph & CRUD", load_job,
+                   agent, key, sf_database, sf_schema, CRUD_LOOKBACK_DAYS)
+
+    if st.session_state.lineage and st.sidebar.button("Refresh Changed Objects"):
+        snapshot = {"lineage": st.session_state.lineage, "objects": st.session_state.objects,
+                    "crud_matrix": st.session_state.crud_matrix,
+                    "query_templates": st.session_state.query_templates}
+        submit_job("graph", ("refresh",) + st.session_state.cache_key + (st.session_state.lineage.version,),
+                   "Refresh Changed Objects", refresh_job,
+                   agent, st.session_state.cache_key, snapshot, sf_database, sf_schema)
+
+job = finished_job("graph")
+if job is not None and job.status == "done":
+    use_snapshot(job.result["key"], job.result["snapshot"])
+    delta = job.result.get("delta")
+    if delta:
+        st.success(f"🔄 {delta['added']} added, {delta['changed']} changed, {delta['dropped']} dropped "
+                   f"({delta['objects']} objects tracked).")
+    else:
+        note = {"hit": " (shared cache)", "coalesced": " (shared with a concurrent load)"}.get(job.result["source"], "")
+        st.success(f"✅ Graph loaded with {len(st.session_state.global_graph.nodes)} objects. "
+                   f"CRUD fetched for {len(st.session_state.crud_matrix)} objects{note}.")
+elif job is not None and job.status == "cancelled":
+    st.warning(f"⏹️ {job.name} cancelled.")
+elif job is not None:
+    st.error(f"❌ {job.name} failed: {job.error}")
+job_panel("graph", _graph_partials)
+
+# Nightly lineage_batch output; needs no Snowflake connection
+st.sidebar.markdown("---")
+st.sidebar.header("Precomputed Lineage")
+batch_dir = st.sidebar.text_input("Batch Output Dir", value=LINEAGE_BATCH_DIR)
+if st.sidebar.button("Open Precomputed"):
+    manifest = os.path.join(batch_dir, "manifest.json")
+    # A newer batch run changes the key, so it is read instead of the cached one
+    key = (f"batch:{os.path.abspath(batch_dir)}", sf_database.upper(), sf_schema.upper(),
+           os.path.getmtime(manifest) if os.path.exists(manifest) else None)
+    try:
+        with span("app.open_batch", schema=sf_schema) as s:
+            snapshot, source = shared_cache.get_or_load(
+                key, lambda: load_batch_snapshot(batch_dir, sf_database, sf_schema))
+            s.set(cache=source)
+    except ValueError as e:
+        st.error(f"❌ {e}")
+    else:
+        use_snapshot(key, snapshot)
+        st.success(f"✅ {sf_database}.{sf_schema} from the {snapshot['run_at']} batch run: "
+                   f"{len(st.session_state.global_graph.nodes)} objects in the graph, "
+                   f"CRUD for {len(st.session_state.crud_matrix)} objects.")
 
 # -----------------------------
 # Sidebar - Display DB Objects
@@ -204,30 +312,18 @@ if show_lineage and st.session_state.global_graph:
     obj_list = [o["name"] for o in st.session_state.objects.get(obj_type, [])]
     selected_obj = st.selectbox(f"Select {obj_type}", [""] + obj_list)
 
-    if selected_obj:
-        G = st.session_state.global_graph
-        node_sql_map = st.session_state.node_sql_map
-        net = Network(height="650px", width="100%", directed=True)
-        net.from_nx(G)
-        net.show_buttons(filter_=['physics'])
-
-        for node in net.nodes:
-            if node["id"] == selected_obj:
-                node["color"] = "orange"
-                node["size"] = 25
-        for edge in net.edges:
-            if edge["from"] == selected_obj or edge["to"] == selected_obj:
-                edge["color"] = "red"
-                edge["width"] = 3
-
-        for node in net.nodes:
-            sql_snippets = node_sql_map.get(node["id"], [])
-            node["title"] = "\n\n".join(sql_snippets[:3])
-
-        tmp_path = "temp_graph.html"
-        net.save_graph(tmp_path)
-        HtmlFile = open(tmp_path, 'r', encoding='utf-8').read()
-        components.html(HtmlFile, height=650, scrolling=True)
+    # Laid out once per graph content and shared by every session on the schema;
+    # not per version, which restarts at every load and would return a stale layout
+    lineage = st.session_state.lineage
+    with span("graph.layout", nodes=len(lineage.graph)) as s:
+        layout, source = shared_cache.get_or_load(
+            st.session_state.cache_key + ("graph_layout", lineage.fingerprint()),
+            lambda: compute_layout(lineage, default_schema=st.session_state.cache_key[2]))
+        s.set(cache=source, clusters=len(layout["clusters"]))
+    components.html(network_html(lineage, layout, selected=selected_obj or None, physics=graph_physics),
+                    height=650, scrolling=True)
+    st.caption(f"{len(layout['positions'])} objects in {len(layout['clusters'])} schema / domain groups. "
+               "Click a group to expand it, double-click an object to collapse its group.")
 
 # -----------------------------
 # Dynamic CRUD Matrix
@@ -277,46 +373,191 @@ if st.session_state.crud_matrix and show_usage_matrix:
     else:
         st.info("No CRUD activity found for selected filters.")
 
+    # QUERY_HISTORY is classified once per distinct statement template
+    templates = st.session_state.query_templates
+    if templates:
+        with st.expander(f"🔁 Query templates ({templates['templates']} distinct across {templates['queries']} queries)"):
+            st.markdown("**Most frequent**")
+            st.dataframe(pd.DataFrame(templates["frequent"]))
+            st.markdown("**Most expensive (total elapsed time)**")
+            st.dataframe(pd.DataFrame(templates["expensive"]))
+
 # -----------------------------
 # ChatGPT-style Q&A
 # -----------------------------
 st.subheader("💬 Ask Questions about SQL Lineage / CRUD")
 question = st.text_area("Enter your question:")
 
+SYSTEM_PROMPT = "You are a SQL lineage and CRUD expert. Answer based strictly on provided context."
+
+RETRIEVAL_TOP_K = 5
+
+def get_embedder():
+    def load():
+        with span("embed.load_model"):
+            from sentence_transformers import SentenceTransformer
+            return SentenceTransformer(EMBED_MODEL)
+    return shared_cache.get_or_load(("embedder", EMBED_MODEL), load, size_fn=lambda _: 0, ttl_seconds=float("inf"))[0]
+
 def call_groq_llm(prompt):
-    client = Groq(api_key=GROQ_KEY)
-    resp = client.chat.completions.create(
-        model="llama-3.3-70b-versatile",
-        temperature=0.1,
-        messages=[
-            {"role": "system",
-             "content": "You are a SQL lineage and CRUD expert. Answer based strictly on provided context."},
+    return ask(prompt, SYSTEM_PROMPT, model=LLM_MODEL)
+
+def stream_groq_llm(prompt, metrics=None):
+    return stream_chat(
+        [
+            {"role": "system", "content": SYSTEM_PROMPT},
             {"role": "user", "content": prompt}
-        ]
+        ],
+        model=LLM_MODEL,
+        temperature=0.1,
+        metrics=metrics,
     )
-    return resp.choices[0].message.content
+
+def ask_job(job, question, mode, hops, cache_key, fingerprint, objects, crud_matrix, graph):
+    with span("app.ask", mode=mode) as ask_span:
+        _step(job, "embed", 0.05, "loading the embedder")
+        embedder = get_embedder()
+        _step(job, "index", 0.1, "DDL + CRUD lines")
+        # DDL + CRUD line embeddings are computed once per graph content and shared;
+        # a session still on an older graph gets its own entry, never replaces the current one
+        index, _ = shared_cache.get_or_load(
+            cache_key + ("node_index", fingerprint),
+            lambda: NodeIndex.build(objects, crud_matrix, embedder.encode))
+        _step(job, "retrieve", 0.3)
+        with span("embed.encode", texts=1):
+            query_vec = embedder.encode([question])[0]
+        with span("retrieve.similarity") as r:
+            if mode == "Graph neighborhood":
+                result = retrieve(question, query_vec, index, graph, hops=hops, top_k=RETRIEVAL_TOP_K)
+            else:
+                # Whole-schema mode keeps the original single best match
+                result = retrieve("", query_vec, index, None, top_k=1)
+            r.set(mode=result["mode"], seeds=len(result["seeds"]),
+                  candidates=result["candidates"], total=result["total"])
+        ask_span.set(context_lines=result["total"])
+        # Only the DDL hits are SQL; CRUD summaries go in as they are
+        texts = [hit["text"] for hit in result["hits"]]
+        ddl = [i for i, text in enumerate(texts) if " DDL:\n" in text]
+        with span("context.minify", parts=len(ddl)) as m:
+            minified, minify_stats = minify_context([texts[i] for i in ddl], keep_header=True)
+            m.set(tokens_before=minify_stats["tokens_before"], tokens_after=minify_stats["tokens_after"])
+        for i, text in zip(ddl, minified):
+            texts[i] = text
+        top_context = "\n".join(texts)
+
+        prompt = f"CONTEXT:\n{top_context}\n\nQUESTION: {question}"
+        _step(job, "answer", 0.5, "streaming")
+        metrics, answer = {}, ""
+        stream = stream_groq_llm(prompt, metrics)
+        try:
+            with span("llm.stream") as llm:
+                for delta in stream:
+                    job.check()
+                    answer += delta
+                    job.partial("answer", answer)
+                llm.set(**metrics)
+        finally:
+            # Cancelling mid-answer closes the HTTP stream
+            stream.close()
+    return {"answer": answer, "metrics": metrics, "minify_stats": minify_stats, "result": result, "hops": hops}
+
+def _answer_partials(partials):
+    if partials.get("answer"):
+        st.markdown("**Answer:**")
+        st.markdown(partials["answer"])
 
 if st.button("Ask"):
     if not agent or not agent.conn:
         st.warning("Connect to Snowflake first")
     else:
-        # Combine DDL + CRUD context
-        context_lines = []
-        for obj_type in ["PROCEDURE", "VIEW", "TABLE"]:
-            for obj in st.session_state.objects.get(obj_type, []):
-                context_lines.append(f"{obj_type} {obj['name']} DDL:\n{obj['ddl']}\n")
-        for obj_name, ops in st.session_state.crud_matrix.items():
-            context_lines.append(f"Object {obj_name} CRUD:\n{ops}\n")
-        context = "\n".join(context_lines)
-
-        # Embed + retrieve top-k relevant context
-        embedder = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
-        query_vec = embedder.encode([question])[0]
-        vecs = embedder.encode(context_lines)
-        sims = np.dot(vecs, query_vec)
-        best_idx = int(np.argmax(sims))
-        top_context = context_lines[best_idx]
+        # Without a loaded schema the objects are this session's own, so is the cached index
+        graph_key = st.session_state.cache_key or ("session", st.session_state.session_id)
+        lineage = st.session_state.lineage
+        fingerprint = lineage.fingerprint() if lineage else None
+        submit_job("ask", ("ask", graph_key, fingerprint, question, retrieval_mode, retrieval_hops), "Ask",
+                   ask_job, question, retrieval_mode, retrieval_hops, graph_key, fingerprint,
+                   st.session_state.objects, st.session_state.crud_matrix, st.session_state.global_graph)
+
+job = finished_job("ask")
+if job is not None and job.status == "done":
+    st.session_state.last_answer = job.result
+elif job is not None and job.status == "cancelled":
+    st.warning("⏹️ Answer cancelled.")
+    st.session_state.last_answer = None
+elif job is not None:
+    st.error(f"❌ Ask failed: {job.error}")
+    st.session_state.last_answer = None
+job_panel("ask", _answer_partials)
+
+# The last answer stays on the page until the next question is asked
+answered = st.session_state.last_answer
+if answered and "ask" not in st.session_state.jobs:
+    result, minify_stats = answered["result"], answered["minify_stats"]
+    st.markdown("**Answer:**")
+    st.markdown(answered["answer"])
+    st.caption(f"⏱️ {format_metrics(answered['metrics'])}")
+    if minify_stats["minified"]:
+        st.caption(f"🗜️ DDL context minified from {minify_stats['tokens_before']} "
+                   f"to {minify_stats['tokens_after']} tokens")
+    if result["mode"] == "neighborhood":
+        st.caption(f"🧭 {', '.join(result['seeds'])} · searched {result['candidates']} of "
+                   f"{result['total']} context lines within {answered['hops']} hops")
+    with st.expander("Retrieved context"):
+        st.dataframe(pd.DataFrame([{k: h[k] for k in ("node", "hops", "score")} for h in result["hits"]]))
 
-        prompt = f"CONTEXT:\n{top_context}\n\nQUESTION: {question}"
-        answer = call_groq_llm(prompt)
-        st.markdown(f"**Answer:**\n{answer}")
+# -----------------------------
+# Diagnostics - per-request waterfall + rolling latency percentiles
+# -----------------------------
+if show_diagnostics:
+    st.subheader("🩺 Diagnostics")
+    traces = recent_traces()
+    if not traces:
+        st.info("No traces recorded yet. Load the graph or ask a question first.")
+    else:
+        labels = [
+            f"{t['root'].name} · {datetime.fromtimestamp(t['root'].start_ns / 1e9):%H:%M:%S} · "
+            f"{t['root'].duration_ms:.0f} ms"
+            for t in traces
+        ]
+        choice = st.selectbox("Request", range(len(traces)), format_func=lambda i: labels[i])
+        trace = traces[choice]
+        origin = trace["root"].start_ns
+        waterfall = pd.DataFrame([
+            {
+                "span": f"{i:02d} {s.name}",
+                "start_ms": (s.start_ns - origin) / 1e6,
+                "end_ms": (s.end_ns - origin) / 1e6,
+                "duration_ms": s.duration_ms,
+                "status": s.status,
+                "attributes": str(s.attributes),
+            }
+            for i, s in enumerate(trace["spans"])
+        ])
+        st.vega_lite_chart(waterfall, {
+            "mark": {"type": "bar", "tooltip": True},
+            "encoding": {
+                "y": {"field": "span", "type": "nominal", "sort": None, "title": None},
+                "x": {"field": "start_ms", "type": "quantitative", "title": "ms since request start"},
+                "x2": {"field": "end_ms"},
+                "color": {"field": "status", "type": "nominal"},
+            },
+        }, use_container_width=True)
+        with st.expander("Span details"):
+            st.dataframe(waterfall)
+
+        st.markdown("**Rolling latency by stage**")
+        st.dataframe(pd.DataFrame(latency_percentiles()))
+
+    cache = shared_cache.info()
+    st.markdown(f"**Shared schema cache** · {cache['entries']} entries · "
+                f"{cache['bytes'] / 1024 / 1024:.1f} / {cache['max_bytes'] / 1024 / 1024:.0f} MB · "
+                f"{cache['hits']} hits · {cache['misses']} loads · {cache['coalesced']} coalesced · "
+                f"{cache['evictions']} evicted")
+    if cache["keys"]:
+        st.dataframe(pd.DataFrame(cache["keys"]).astype({"key": str}))
+
+    background = jobs.info()
+    if background:
+        st.markdown("**Background jobs**")
+        st.dataframe(pd.DataFrame([{k: j[k] for k in ("name", "status", "stage", "fraction", "elapsed_s", "error")}
+                                   for j in background]))
@@ -0,0 +1,105 @@
+import asyncio
+import json
+import time
+
+from llm_client import (
+    LLM_BACKEND, LLM_MAX_RETRIES, LLM_RETRY_BASE_DELAY_S, LLM_RPS, RateLimiter, backoff_delay, make_async_client,
+    retryable_errors,
+)
+
+
+def read_questions(path):
+    """
+    Read questions from a .txt file (one per line) or a .jsonl file with a
+    "question" field plus optional "id", "object", "schema", "domain",
+    "block_type", "table" (a name or a list) and "writes" prefilters.
+    """
+    questions = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if path.endswith(".jsonl"):
+                item = json.loads(line)
+            else:
+                item = {"question": line}
+            item.setdefault("id", str(line_no))
+            questions.append(item)
+    return questions
+
+
+def write_jsonl(path, rows):
+    with open(path, "w", encoding="utf-8") as f:
+        for row in rows:
+            f.write(json.dumps(row, default=str) + "\n")
+
+
+async def _with_retries(make_call, limiter, retries, base_delay, retryable):
+    attempt = 0
+    while True:
+        await limiter.wait_async()
+        try:
+            return await make_call(), attempt
+        except retryable as e:
+            if attempt >= retries:
+                raise
+            await asyncio.sleep(backoff_delay(attempt, base_delay, error=e))
+            attempt += 1
+
+
+async def complete_all(prompts, model, system_prompt, api_key=None, base_url=None,
+                       concurrency=8, rps=LLM_RPS, retries=LLM_MAX_RETRIES, base_delay=LLM_RETRY_BASE_DELAY_S,
+                       temperature=0.1, backend=LLM_BACKEND):
+    """
+    Send every prompt to the LLM through a pool of `concurrency` workers
+    sharing one async client (llm_client timeouts, `concurrency` pooled
+    connections) and llm_client's rate limit and retry settings. Returns
+    one result dict per prompt, in order, with the answer (or error),
+    attempts, token usage and latency.
+    """
+    client = make_async_client(backend, api_key, base_url, max_connections=concurrency)
+    retryable = retryable_errors(backend)
+    limiter = RateLimiter(rps)
+    queue = asyncio.Queue()
+    for i, prompt in enumerate(prompts):
+        queue.put_nowait((i, prompt))
+    results = [None] * len(prompts)
+
+    async def worker():
+        while True:
+            try:
+                i, prompt = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+
+            async def make_call():
+                return await client.chat.completions.create(
+                    model=model,
+                    temperature=temperature,
+                    messages=[
+                        {"role": "system", "content": system_prompt},
+                        {"role": "user", "content": prompt},
+                    ],
+                )
+
+            start = time.perf_counter()
+            try:
+                resp, retried = await _with_retries(make_call, limiter, retries, base_delay, retryable)
+                usage = resp.usage
+                results[i] = {
+                    "answer": resp.choices[0].message.content,
+                    "attempts": retried + 1,
+                    "prompt_tokens": usage.prompt_tokens if usage else None,
+                    "completion_tokens": usage.completion_tokens if usage else None,
+                    "llm_s": time.perf_counter() - start,
+                }
+            except Exception as e:
+                results[i] = {"answer": None, "error": f"{type(e).__name__}: {e}",
+                              "llm_s": time.perf_counter() - start}
+
+    try:
+        await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+    finally:
+        await client.close()
+    return results
@@ -0,0 +1,106 @@
+import argparse
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that must only load on the code path that needs them
+HEAVY_MODULES = ("torch", "sentence_transformers", "transformers", "lancedb", "groq",
+                 "networkx", "pyvis", "snowflake", "streamlit")
+
+# entry point -> (python args, import-time budget in ms)
+ENTRY_POINTS = {
+    "cli.py --help": (["cli.py", "--help"], 150),
+    "cli.py search --help": (["cli.py", "search", "--help"], 400),
+    "4-search.py --help": (["4-search.py", "--help"], 400),
+    "5-chat.py --help": (["5-chat.py", "--help"], 400),
+    "search_lancedb.py --help": (["search_lancedb.py", "--help"], 400),
+    "run_proc_to_lancedb.py --help": (["run_proc_to_lancedb.py", "--help"], 400),
+    "inspect_lancedb.py --help": (["inspect_lancedb.py", "--help"], 150),
+    "import embed_and_store": (["-c", "import embed_and_store"], 400),
+    "import context_assembler": (["-c", "import context_assembler"], 100),
+    "import lineage": (["-c", "import lineage"], 100),
+    "import table_index": (["-c", "import table_index"], 100),
+    "import llm_client": (["-c", "import llm_client"], 100),
+    "import llm_stream": (["-c", "import llm_stream"], 100),
+    "import batch_chat": (["-c", "import batch_chat"], 100),
+    # app.py itself imports streamlit at the top and can't be run outside `streamlit run`;
+    # its project imports are checked instead
+    "app.py imports": (["-c", "import lineage, graph_retrieval, graph_layout, lineage_batch, utils.shared_cache, "
+                               "utils.jobs, llm_stream, sql_minify"], 250),
+}
+
+
+def parse_importtime(stderr):
+    """
+    Parse `-X importtime` output into (total ms, {module: cumulative ms}).
+    The total sums the cumulative time of top-level imports only.
+    """
+    total_us, modules = 0, {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        modules[name.strip()] = int(cumulative) / 1000
+        if not name[1:].startswith(" "):
+            total_us += int(cumulative)
+    return total_us / 1000, modules
+
+
+def measure(args, repeats=3):
+    """Best-of-`repeats` import time for `python -X importtime <args>`."""
+    best = None
+    for _ in range(repeats):
+        proc = subprocess.run([sys.executable, "-X", "importtime"] + args, cwd=ROOT,
+                              stdin=subprocess.DEVNULL, capture_output=True, text=True)
+        if proc.returncode != 0:
+            tail = "\n".join(proc.stderr.strip().splitlines()[-3:])
+            raise RuntimeError(f"exit code {proc.returncode}: {tail}")
+        total_ms, modules = parse_importtime(proc.stderr)
+        if best is None or total_ms < best[0]:
+            best = (total_ms, modules)
+    return best
+
+
+def check(entry_points=ENTRY_POINTS, repeats=3, budget_scale=1.0, top=5):
+    failures = []
+    print(f"{'entry point':<32}{'import ms':>10}{'budget':>9}  slowest imports")
+    for label, (args, budget_ms) in entry_points.items():
+        try:
+            total_ms, modules = measure(args, repeats)
+        except RuntimeError as e:
+            failures.append(f"{label}: {e}")
+            print(f"{label:<32}{'error':>10}")
+            continue
+        budget_ms *= budget_scale
+        heavy = sorted({m.split(".")[0] for m in modules} & set(HEAVY_MODULES))
+        slowest = sorted(((ms, m) for m, ms in modules.items() if "." not in m), reverse=True)[:top]
+        mark = "✅" if total_ms <= budget_ms and not heavy else "❌"
+        print(f"{label:<32}{total_ms:>10.1f}{budget_ms:>9.0f}  {mark} "
+              + ", ".join(f"{m} {ms:.0f}" for ms, m in slowest))
+        if total_ms > budget_ms:
+            failures.append(f"{label}: {total_ms:.1f} ms of imports, budget {budget_ms:.0f} ms")
+        if heavy:
+            failures.append(f"{label}: eagerly imports {', '.join(heavy)}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fail if entry points import too much at startup.")
+    parser.add_argument("--repeats", type=int, default=3, help="Runs per entry point; the fastest counts")
+    parser.add_argument("--budget-scale", type=float, default=1.0,
+                        help="Multiply every budget, e.g. 2.0 on a slow CI runner")
+    args = parser.parse_args()
+
+    failures = check(repeats=args.repeats, budget_scale=args.budget_scale)
+    if failures:
+        print(f"\n❌ {len(failures)} import-time budget violation(s):")
+        for failure in failures:
+            print(f"   - {failure}")
+        sys.exit(1)
+    print("\n✅ All entry points within their import-time budget")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,378 @@
+import argparse
+import glob
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+# Retrieval quality vs latency over golden question sets.
+#
+# A golden set (benchmarks/golden/*.json) names a corpus and, per question,
+# the blocks a good retrieval returns:
+#   {"name": ..., "corpus": "chunks/chunks.json" | "docs/sample.sql",
+#    "object_name": ..., "schema_name": ..., "object_domain": "PROCEDURE",
+#    "questions": [{"question": ..., "expected": [anchor, ...], "block_type": optional}]}
+# An anchor is a snippet from one line of an expected block. A retrieved
+# chunk is relevant when it contains an anchor (case and whitespace are
+# ignored), so a set stays valid when chunk sizes change.
+GOLDEN_DIR = os.path.join(ROOT, "benchmarks", "golden")
+
+DEFAULT_TOP_K = 5
+
+# Same budget 5-chat.py packs retrieved chunks into
+MAX_CONTEXT_TOKENS = 2000
+
+# Chunk length for .sql corpora when no --chunk-sizes are given
+DEFAULT_CHUNK_LEN = 500
+
+# Every configuration starts from this and overrides some of it:
+#   chunk_size  None = a chunk JSON as stored (DEFAULT_CHUNK_LEN for .sql)
+#   storage     fp32 | fp16 | int8 | binary (quantized_store.py)
+#   search      vector | hybrid (vector + full-text, embed_and_store.hybrid_search_chunks)
+#   filtered    prefilter on the set's object (and the question's block_type)
+#   index       None (flat scan) or a LanceDB vector index type
+#   backend     lancedb | mmap (mmap_index.py)
+BASE_CONFIG = {"chunk_size": None, "storage": "fp32", "search": "vector", "filtered": False,
+               "index": None, "backend": "lancedb"}
+
+CONFIGS = {
+    "vector": {},
+    "vector_filtered": {"filtered": True},
+    "hybrid": {"search": "hybrid"},
+    "hybrid_filtered": {"search": "hybrid", "filtered": True},
+    "fp16": {"storage": "fp16"},
+    "int8": {"storage": "int8"},
+    "binary": {"storage": "binary"},
+    "ivf_pq": {"index": "IVF_PQ"},
+    "ivf_hnsw_sq": {"index": "IVF_HNSW_SQ"},
+    "mmap": {"backend": "mmap"},
+    "mmap_filtered": {"backend": "mmap", "filtered": True},
+}
+
+
+def _normalize(text):
+    return " ".join(str(text).split()).upper()
+
+
+def _corpus_text(path):
+    if path.endswith(".json"):
+        with open(path, "r", encoding="utf-8") as f:
+            return "\n".join(c["text"] for c in json.load(f))
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def check_anchors(golden):
+    """Anchors that appear nowhere in the set's corpus (a broken golden set)."""
+    corpus = _normalize(_corpus_text(os.path.join(ROOT, golden["corpus"])))
+    return [a for q in golden["questions"] for a in q["expected"] if _normalize(a) not in corpus]
+
+
+def load_golden(paths):
+    sets = []
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            golden = json.load(f)
+        missing = check_anchors(golden)
+        if missing:
+            raise ValueError(f"{path}: anchors not found in {golden['corpus']}: {missing}")
+        golden.setdefault("name", os.path.splitext(os.path.basename(path))[0])
+        sets.append(golden)
+    return sets
+
+
+def add_question(path, question, expected, block_type=None, corpus=None, object_name=None, schema_name=None):
+    """Append a question to a golden set, creating the set when `path` doesn't exist yet."""
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            golden = json.load(f)
+    else:
+        if not corpus or not object_name:
+            raise ValueError(f"{path} doesn't exist yet: --corpus and --object are needed to create it")
+        golden = {"name": os.path.splitext(os.path.basename(path))[0], "corpus": corpus,
+                  "object_name": object_name, "schema_name": schema_name or "", "questions": []}
+    entry = {"question": question, "expected": list(expected)}
+    if block_type:
+        entry["block_type"] = block_type
+    missing = check_anchors({**golden, "questions": [entry]})
+    if missing:
+        raise ValueError(f"Anchors not found in {golden['corpus']}: {missing}")
+    golden["questions"].append(entry)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(golden, f, indent=2)
+        f.write("\n")
+    print(f"✅ {path}: {len(golden['questions'])} questions")
+
+
+def chunk_corpus(path, chunk_size=None):
+    """A chunk JSON as stored, otherwise MappingExtractorAgent.chunk_sql_text at `chunk_size`."""
+    from agents.mapping_extractor import MappingExtractorAgent
+
+    if path.endswith(".json") and chunk_size is None:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    agent = MappingExtractorAgent.__new__(MappingExtractorAgent)  # chunking needs no connection
+    return agent.chunk_sql_text(_corpus_text(path), chunk_size or DEFAULT_CHUNK_LEN)
+
+
+class EvalTables:
+    """
+    Scratch LanceDB tables holding every golden set's corpus, one per
+    (chunk size, storage, index), built on first use. Embeddings are
+    computed once per chunk size and shared across storage modes.
+    """
+
+    def __init__(self, golden_sets, work_dir):
+        self.work_dir = work_dir
+        self.corpora = {}
+        for golden in golden_sets:
+            key = (golden["corpus"], golden["object_name"].upper())
+            self.corpora.setdefault(key, golden)
+        self._chunks, self._vectors, self._tables, self._mmap = {}, {}, {}, {}
+        self._created = 0
+
+    def chunks(self, chunk_size):
+        if chunk_size not in self._chunks:
+            self._chunks[chunk_size] = [
+                (golden, chunk_corpus(os.path.join(ROOT, corpus), chunk_size))
+                for (corpus, _), golden in self.corpora.items()
+            ]
+        return self._chunks[chunk_size]
+
+    def vectors(self, chunk_size):
+        from embed_and_store import embed_texts
+
+        if chunk_size not in self._vectors:
+            texts = [c["text"] for _, chunks in self.chunks(chunk_size) for c in chunks]
+            self._vectors[chunk_size] = embed_texts(texts)
+        return self._vectors[chunk_size]
+
+    def rows(self, chunk_size):
+        return sum(len(chunks) for _, chunks in self.chunks(chunk_size))
+
+    def table(self, config):
+        import lancedb
+        from embed_and_store import ensure_fts_index, store_embeddings_lancedb
+
+        key = (config["chunk_size"], config["storage"], config["index"])
+        if key not in self._tables:
+            # Numbered per attempt, so a table whose index failed to build is never reused
+            name = f"eval_{self._created}"
+            self._created += 1
+            vectors, offset = self.vectors(config["chunk_size"]), 0
+            for golden, chunks in self.chunks(config["chunk_size"]):
+                store_embeddings_lancedb(
+                    self.work_dir, name, chunks, vectors[offset:offset + len(chunks)],
+                    object_name=golden["object_name"], schema_name=golden.get("schema_name", ""),
+                    object_domain=golden.get("object_domain", "PROCEDURE"), storage=config["storage"])
+                offset += len(chunks)
+            tbl = lancedb.connect(self.work_dir).open_table(name)
+            if config["index"]:
+                print(f"🗂️  Building {config['index']} vector index on '{name}'...")
+                tbl.create_index(vector_column_name="embedding", index_type=config["index"])
+            self._tables[key] = tbl
+        tbl = self._tables[key]
+        if config["search"] == "hybrid":
+            ensure_fts_index(tbl)
+        return tbl
+
+    def mmap(self, config):
+        from mmap_index import open_index
+
+        key = config["chunk_size"]
+        if key not in self._mmap:
+            tbl = self.table({**config, "storage": "fp32", "index": None, "search": "vector"})
+            self._mmap[key] = open_index(self.work_dir, tbl.name)
+        return self._mmap[key]
+
+
+def _searcher(config, tables, top_k):
+    """search(golden, question, query_vector) -> results DataFrame for one configuration."""
+    from embed_and_store import build_where, hybrid_search_chunks, search_chunks
+    from mmap_index import build_filters
+
+    def scope(golden, question):
+        if not config["filtered"]:
+            return None, None
+        args = (golden["object_name"], None, None, question.get("block_type"))
+        return build_where(*args), build_filters(*args)
+
+    if config["backend"] == "mmap":
+        index = tables.mmap(config)
+        return lambda golden, q, vec: index.search_chunks(vec, top_k=top_k, filters=scope(golden, q)[1])
+    tbl = tables.table(config)
+    if config["search"] == "hybrid":
+        return lambda golden, q, vec: hybrid_search_chunks(tbl, vec, q["question"], top_k=top_k,
+                                                           where=scope(golden, q)[0])
+    return lambda golden, q, vec: search_chunks(tbl, vec, top_k=top_k, where=scope(golden, q)[0])
+
+
+def score(records, anchors):
+    """(recall, reciprocal rank) of one result list against a question's anchors."""
+    anchors = [_normalize(a) for a in anchors]
+    texts = [_normalize(r["text"]) for r in records]
+    found = sum(any(a in t for t in texts) for a in anchors)
+    rank = next((i for i, t in enumerate(texts, start=1) if any(a in t for a in anchors)), None)
+    return found / len(anchors), (1.0 / rank if rank else 0.0)
+
+
+def evaluate(name, config, golden_sets, query_vectors, tables, top_k=DEFAULT_TOP_K, repeats=3,
+             max_tokens=MAX_CONTEXT_TOKENS):
+    from context_assembler import assemble_context
+
+    search = _searcher(config, tables, top_k)
+    questions = [(golden, q, vec) for golden in golden_sets
+                 for q, vec in zip(golden["questions"], query_vectors[golden["name"]])]
+    search(*questions[0])  # warm-up: opens files / loads indexes outside the timing
+
+    latencies, recalls, reciprocal_ranks, tokens, misses = [], [], [], [], []
+    for golden, q, vec in questions:
+        for _ in range(repeats):
+            t0 = time.perf_counter()
+            results = search(golden, q, vec)
+            latencies.append(time.perf_counter() - t0)
+        records = results.to_dict("records")
+        recall, rr = score(records, q["expected"])
+        recalls.append(recall)
+        reciprocal_ranks.append(rr)
+        tokens.append(assemble_context(records, max_tokens=max_tokens)[1]["context_tokens"] if records else 0)
+        if recall < 1.0:
+            misses.append(f"{golden['name']}: {q['question']}")
+
+    return {
+        "config": name,
+        **config,
+        "chunks": tables.rows(config["chunk_size"]),
+        "questions": len(questions),
+        f"recall@{top_k}": float(np.mean(recalls)),
+        "mrr": float(np.mean(reciprocal_ranks)),
+        "p50_ms": 1000 * float(np.percentile(latencies, 50)),
+        "p95_ms": 1000 * float(np.percentile(latencies, 95)),
+        "p99_ms": 1000 * float(np.percentile(latencies, 99)),
+        "context_tokens": float(np.mean(tokens)),
+        "misses": misses,
+    }
+
+
+def expand_configs(names, chunk_sizes=()):
+    """{name: config} for the named configurations, plus each at every extra chunk size ("vector@250")."""
+    configs = {}
+    for size in [None] + list(chunk_sizes):
+        for name in names:
+            label = name if size is None else f"{name}@{size}"
+            configs[label] = {**BASE_CONFIG, **CONFIGS[name], "chunk_size": size}
+    return configs
+
+
+def run_eval(golden_paths, configs, top_k=DEFAULT_TOP_K, repeats=3):
+    from embed_and_store import embed_texts
+
+    golden_sets = load_golden(golden_paths)
+    n = sum(len(g["questions"]) for g in golden_sets)
+    print(f"📋 {len(golden_sets)} golden set(s), {n} questions, {len(configs)} configurations")
+
+    questions = [q["question"] for g in golden_sets for q in g["questions"]]
+    t0 = time.perf_counter()
+    vectors = embed_texts(questions)
+    embed_ms = 1000 * (time.perf_counter() - t0) / max(len(questions), 1)
+    query_vectors, offset = {}, 0
+    for golden in golden_sets:
+        query_vectors[golden["name"]] = vectors[offset:offset + len(golden["questions"])]
+        offset += len(golden["questions"])
+
+    work_dir = tempfile.mkdtemp(prefix="retrieval_eval_")
+    rows = []
+    try:
+        tables = EvalTables(golden_sets, work_dir)
+        for name, config in configs.items():
+            print(f"\n🔎 {name}")
+            try:
+                rows.append(evaluate(name, config, golden_sets, query_vectors, tables, top_k, repeats))
+            except Exception as e:
+                # e.g. a vector index that can't train on a corpus this small
+                print(f"⚠️ Skipping {name}: {e}")
+                rows.append({"config": name, **config, "error": str(e)})
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return {"top_k": top_k, "questions": n, "query_embed_ms": embed_ms, "results": rows}
+
+
+def fastest_passing(report, min_recall, min_mrr=0.0):
+    """The lowest-p50 configuration with recall@k and MRR at or above the bar, or None."""
+    key = f"recall@{report['top_k']}"
+    passing = [r for r in report["results"]
+               if "error" not in r and r[key] >= min_recall and r["mrr"] >= min_mrr]
+    return min(passing, key=lambda r: r["p50_ms"]) if passing else None
+
+
+def print_report(report, min_recall, min_mrr=0.0):
+    key = f"recall@{report['top_k']}"
+    print(f"\n📊 Retrieval evaluation ({report['questions']} questions, top {report['top_k']}; "
+          f"query embedding {report['query_embed_ms']:.1f} ms/question, not included below)")
+    print(f"{'config':<24}{'chunks':>8}{key:>11}{'MRR':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'ctx tokens':>12}")
+    for r in report["results"]:
+        if "error" in r:
+            print(f"{r['config']:<24}  skipped: {r['error'][:80]}")
+            continue
+        print(f"{r['config']:<24}{r['chunks']:>8}{r[key]:>11.3f}{r['mrr']:>8.3f}{r['p50_ms']:>9.2f}"
+              f"{r['p95_ms']:>9.2f}{r['p99_ms']:>9.2f}{r['context_tokens']:>12.0f}")
+
+    best = fastest_passing(report, min_recall, min_mrr)
+    bar = f"{key} >= {min_recall}" + (f", MRR >= {min_mrr}" if min_mrr else "")
+    if best:
+        print(f"\n🏁 Fastest configuration with {bar}: {best['config']} ({best['p50_ms']:.2f} ms p50)")
+    else:
+        print(f"\n❌ No configuration reaches {bar}")
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Retrieval quality vs latency over golden question sets.")
+    parser.add_argument("job", choices=["run", "add"])
+    parser.add_argument("--golden", nargs="+", default=None,
+                        help="Golden set files (run: default benchmarks/golden/*.json; add: the set to extend)")
+    parser.add_argument("--configs", nargs="+", choices=list(CONFIGS), default=list(CONFIGS))
+    parser.add_argument("--chunk-sizes", type=int, nargs="+", default=[],
+                        help="run: also evaluate every config re-chunked at these lengths")
+    parser.add_argument("--top-k", type=int, default=DEFAULT_TOP_K)
+    parser.add_argument("--repeats", type=int, default=3, help="run: timed searches per question")
+    parser.add_argument("--min-recall", type=float, default=0.8, help="run: quality bar for the recommendation")
+    parser.add_argument("--min-mrr", type=float, default=0.0)
+    parser.add_argument("--out", default=None, help="run: write the report JSON here")
+    parser.add_argument("--question", help="add: the question")
+    parser.add_argument("--expected", nargs="+", help="add: anchor snippet(s) from the expected block(s)")
+    parser.add_argument("--block-type", help="add: block_type used when the search is filtered")
+    parser.add_argument("--corpus", help="add: corpus path (relative to the repo root) for a new set")
+    parser.add_argument("--object", help="add: object_name for a new set")
+    parser.add_argument("--schema", help="add: schema_name for a new set")
+    args = parser.parse_args()
+
+    if args.job == "add":
+        if not args.golden or len(args.golden) != 1 or not args.question or not args.expected:
+            parser.error("add needs one --golden file, --question and --expected")
+        try:
+            add_question(args.golden[0], args.question, args.expected, args.block_type,
+                         args.corpus, args.object, args.schema)
+        except ValueError as e:
+            print(f"❌ {e}")
+            sys.exit(1)
+        return
+
+    golden = args.golden or sorted(glob.glob(os.path.join(GOLDEN_DIR, "*.json")))
+    report = run_eval(golden, expand_configs(args.configs, args.chunk_sizes), args.top_k, args.repeats)
+    print_report(report, args.min_recall, args.min_mrr)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
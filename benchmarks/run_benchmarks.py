@@ -0,0 +1,349 @@
+import argparse
+import gc
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+import psutil
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from benchmarks.synthetic_corpus import SCALES, generate_corpus  # noqa: E402
+
+BASELINE_DIR = os.path.join(ROOT, "benchmarks", "baselines")
+STAGES = ["chunking", "extract_all", "build_graph", "graph_update", "graph_layout", "graph_retrieval",
+          "crud_aggregation", "embed", "embed_scaling", "ingest", "search"]
+
+# Allowed relative slowdown before --check fails
+DEFAULT_THRESHOLD = 0.20
+
+
+class PeakRSS:
+    """Samples this process's RSS on a background thread while the block runs."""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.process = psutil.Process()
+        self.peak = 0
+        self._stop = threading.Event()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self.process.memory_info().rss)
+            time.sleep(self.interval)
+
+    def __enter__(self):
+        gc.collect()
+        self.start_rss = self.process.memory_info().rss
+        self.peak = self.start_rss
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self.process.memory_info().rss)
+
+
+def _measure(fn, items, repeats=1):
+    """
+    Call `fn()` `repeats` times. `fn` returns a list of per-item latencies
+    (seconds) or None, in which case each call counts as one sample.
+    """
+    samples = []
+    with PeakRSS() as rss:
+        start = time.perf_counter()
+        for _ in range(repeats):
+            t0 = time.perf_counter()
+            per_item = fn()
+            samples.extend(per_item if per_item else [time.perf_counter() - t0])
+        total = time.perf_counter() - start
+    return {
+        "items": items * repeats,
+        "seconds": total,
+        "throughput_per_s": items * repeats / total if total else 0.0,
+        "p50_ms": 1000 * float(np.percentile(samples, 50)),
+        "p99_ms": 1000 * float(np.percentile(samples, 99)),
+        "peak_rss_mb": rss.peak / 2 ** 20,
+        "rss_growth_mb": (rss.peak - rss.start_rss) / 2 ** 20,
+    }
+
+
+def _timed_each(fn, inputs):
+    latencies = []
+    for item in inputs:
+        t0 = time.perf_counter()
+        fn(item)
+        latencies.append(time.perf_counter() - t0)
+    return latencies
+
+
+def core_counts(max_cores=None):
+    """1, 2, 4, ... up to and including the machine's core count."""
+    max_cores = max_cores or os.cpu_count() or 1
+    counts, n = [], 1
+    while n < max_cores:
+        counts.append(n)
+        n *= 2
+    return counts + [max_cores]
+
+
+def _embed_scaling(texts):
+    """
+    Chunks/s against core count: one process with n torch threads, and an
+    EncodePool of n single-threaded workers; plus one unbucketed encode()
+    call for the padding comparison.
+    """
+    from embed_and_store import EncodePool, embed_texts, load_model
+
+    results = {}
+    model = load_model()
+    results["embed_unbucketed"] = _measure(
+        lambda: model.encode(texts, convert_to_numpy=True).shape and None, len(texts), 1)
+    for n in core_counts():
+        results[f"embed_threads_{n}"] = {**_measure(lambda: embed_texts(texts, threads=n).shape and None,
+                                                    len(texts), 1), "cores": n}
+        if n > 1:
+            with EncodePool(n, threads_per_worker=1) as pool:
+                embed_texts(texts[:n], pool=pool)  # workers load the model outside the timing
+                results[f"embed_pool_{n}"] = {**_measure(lambda: embed_texts(texts, pool=pool).shape and None,
+                                                         len(texts), 1), "cores": n}
+    return results
+
+
+def run_suite(scale="small", stages=STAGES, repeats=3, n_search_queries=200, seed=42):
+    from agents.mapping_extractor import MappingExtractorAgent
+    from sql_extractor import SQLExtractor
+    from lineage import build_graph, aggregate_crud, fingerprint_rows, LineageGraph
+
+    n_procs, n_views, n_tables, n_queries = SCALES[scale]
+    print(f"🏗️  Generating '{scale}' corpus: {n_procs} procedures, {n_views} views, "
+          f"{n_tables} tables, {n_queries} QUERY_HISTORY rows")
+    corpus = generate_corpus(n_procs, n_views, n_tables, n_queries, seed=seed)
+    objects = corpus["PROCEDURE"] + corpus["VIEW"] + corpus["TABLE"]
+    procedures = corpus["PROCEDURE"]
+
+    # Chunking needs no Snowflake connection
+    agent = MappingExtractorAgent.__new__(MappingExtractorAgent)
+    chunks_by_proc = [(p, agent.chunk_sql_text(p["ddl"])) for p in procedures]
+    all_chunks = [c for _, chunks in chunks_by_proc for c in chunks]
+    results = {}
+
+    if "chunking" in stages:
+        results["chunking"] = _measure(
+            lambda: _timed_each(agent.chunk_sql_text, [p["ddl"] for p in procedures]),
+            len(procedures), repeats)
+
+    if "extract_all" in stages:
+        extractor = SQLExtractor()
+        results["extract_all"] = _measure(
+            lambda: _timed_each(extractor.extract_all, [p["ddl"] for p in procedures]),
+            len(procedures), 1)
+
+    if "build_graph" in stages:
+        results["build_graph"] = _measure(lambda: build_graph(objects) and None, len(objects), repeats)
+
+    if "graph_update" in stages:
+        # One view edited at a time, applied to an already built graph
+        lineage = LineageGraph()
+        lineage.apply(objects)
+        views = corpus["VIEW"]
+        edits = [{**v, "ddl": v["ddl"] + f"\nJOIN {v['name'].split('.')[0]}.TBL_EDIT_{i} E ON 1 = 1"}
+                 for i, v in enumerate(views)]
+        results["graph_update"] = _measure(
+            lambda: _timed_each(lambda obj: lineage.apply([obj]), edits), len(edits), 1)
+
+    if "graph_layout" in stages:
+        # Server-side positions for the whole graph; items are nodes
+        from graph_layout import compute_layout, initial_expanded
+
+        lineage = LineageGraph()
+        lineage.apply([{**o, "domain": d} for d in ("PROCEDURE", "VIEW", "TABLE") for o in corpus[d]])
+        holder = {}
+        results["graph_layout"] = _measure(lambda: holder.update(layout=compute_layout(lineage)),
+                                           len(lineage.graph), repeats)
+        layout = holder["layout"]
+        expanded = initial_expanded(layout, corpus["VIEW"][0]["name"])
+        results["graph_layout"]["clusters"] = len(layout["clusters"])
+        results["graph_layout"]["visible_nodes"] = (len(layout["clusters"]) - len(expanded)
+                                                    + sum(layout["clusters"][c]["size"] for c in expanded))
+
+    if "graph_retrieval" in stages:
+        # Neighborhood-restricted search vs the whole schema; random vectors
+        # stand in for embeddings, only the candidate set size matters here
+        from graph_retrieval import NodeIndex, retrieve
+
+        lineage = LineageGraph()
+        lineage.apply(objects)
+        rng = np.random.default_rng(seed)
+        index = NodeIndex.build(lineage.objects_by_domain(), aggregate_crud(corpus["query_history"]),
+                                lambda texts: rng.standard_normal((len(texts), 384)).astype(np.float32))
+        names = [o["name"] for o in objects]
+        picks = rng.choice(len(names), size=min(n_search_queries, len(names)), replace=False)
+        questions = [(f"Which objects feed {names[i].split('.')[-1]}?", rng.standard_normal(384)) for i in picks]
+        candidates = []
+        results["graph_retrieval"] = _measure(
+            lambda: _timed_each(lambda q: candidates.append(
+                retrieve(q[0], q[1], index, lineage.graph)["candidates"]), questions),
+            len(questions), 1)
+        results["graph_retrieval"]["mean_candidates"] = float(np.mean(candidates))
+        results["graph_retrieval"]["total_candidates"] = len(index.texts)
+        results["graph_retrieval_full"] = _measure(
+            lambda: _timed_each(lambda q: retrieve("", q[1], index, None), questions), len(questions), 1)
+
+    if "crud_aggregation" in stages:
+        rows = corpus["query_history"]
+        results["crud_aggregation"] = _measure(lambda: aggregate_crud(rows) and None, len(rows), repeats)
+        results["crud_aggregation"]["templates"] = len(fingerprint_rows(rows))
+
+    vectors = None
+    if {"embed", "ingest", "search"} & set(stages):
+        from embed_and_store import embed_texts
+        texts = [c["text"] for c in all_chunks]
+        if "embed" in stages:
+            holder = {}
+            results["embed"] = _measure(lambda: holder.update(v=embed_texts(texts)), len(texts), 1)
+            vectors = holder["v"]
+        else:
+            vectors = embed_texts(texts)
+
+    if "embed_scaling" in stages:
+        results.update(_embed_scaling([c["text"] for c in all_chunks]))
+
+    if {"ingest", "search"} & set(stages):
+        import lancedb
+        from embed_and_store import store_embeddings_lancedb, search_chunks, build_where
+
+        tmp = tempfile.mkdtemp(prefix="bench_lancedb_")
+        try:
+            offsets = np.cumsum([0] + [len(chunks) for _, chunks in chunks_by_proc])
+
+            def ingest():
+                return _timed_each(
+                    lambda i: store_embeddings_lancedb(
+                        tmp, "bench", chunks_by_proc[i][1], vectors[offsets[i]:offsets[i + 1]],
+                        object_name=chunks_by_proc[i][0]["name"], schema_name="BENCH"),
+                    range(len(chunks_by_proc)))
+
+            ingest_result = _measure(ingest, len(all_chunks), 1)
+            if "ingest" in stages:
+                results["ingest"] = ingest_result
+
+            if "search" in stages:
+                tbl = lancedb.connect(tmp).open_table("bench")
+                rng = np.random.default_rng(seed)
+                picks = rng.choice(len(vectors), size=min(n_search_queries, len(vectors)), replace=False)
+                results["search"] = _measure(
+                    lambda: _timed_each(lambda i: search_chunks(tbl, vectors[i], top_k=5), picks),
+                    len(picks), 1)
+                scoped = build_where(object_name=procedures[0]["name"])
+                results["search_prefiltered"] = _measure(
+                    lambda: _timed_each(lambda i: search_chunks(tbl, vectors[i], top_k=5, where=scoped), picks),
+                    len(picks), 1)
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    return {
+        "meta": {
+            "scale": scale,
+            "seed": seed,
+            "created": datetime.utcnow().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "chunks": len(all_chunks),
+        },
+        "stages": results,
+    }
+
+
+def check_regressions(current, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    Compare stage throughput and p99 against a baseline. A stage regresses
+    when throughput drops, or p99 grows, by more than `threshold`.
+    """
+    failures = []
+    for stage, now in current["stages"].items():
+        before = baseline["stages"].get(stage)
+        if not before:
+            continue
+        if before["throughput_per_s"] and now["throughput_per_s"] < before["throughput_per_s"] * (1 - threshold):
+            failures.append(f"{stage}: throughput {now['throughput_per_s']:.1f}/s "
+                            f"vs baseline {before['throughput_per_s']:.1f}/s")
+        if before["p99_ms"] and now["p99_ms"] > before["p99_ms"] * (1 + threshold):
+            failures.append(f"{stage}: p99 {now['p99_ms']:.2f}ms vs baseline {before['p99_ms']:.2f}ms")
+    return failures
+
+
+def print_report(report):
+    print(f"\n📊 Benchmark results ({report['meta']['scale']})")
+    print(f"{'stage':<20}{'items':>10}{'items/s':>12}{'p50 ms':>10}{'p99 ms':>10}{'peak RSS MB':>14}")
+    for stage, r in report["stages"].items():
+        print(f"{stage:<20}{r['items']:>10}{r['throughput_per_s']:>12.1f}{r['p50_ms']:>10.2f}"
+              f"{r['p99_ms']:>10.2f}{r['peak_rss_mb']:>14.1f}")
+        if "cores" in r:
+            print(f"{'':<20}{r['throughput_per_s'] / r['cores']:.1f} chunks/s per core on {r['cores']} cores")
+        if "templates" in r:
+            print(f"{'':<20}{r['items']} queries classified as {r['templates']} distinct templates")
+        if "visible_nodes" in r:
+            print(f"{'':<20}{r['items']} nodes in {r['clusters']} clusters, {r['visible_nodes']} rendered at first")
+        if "mean_candidates" in r:
+            print(f"{'':<20}searched {r['mean_candidates']:.0f} of {r['total_candidates']} context lines per query")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end performance benchmarks on a synthetic corpus.")
+    parser.add_argument("--scale", choices=SCALES, default="small")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=STAGES)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", default=None, help="Write the results JSON here")
+    parser.add_argument("--save-baseline", action="store_true", help="Store results as the baseline for this scale")
+    parser.add_argument("--check", action="store_true",
+                        help="Fail if slower than the stored baseline (skipped when there is none)")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    args = parser.parse_args()
+
+    report = run_suite(args.scale, args.stages, args.repeats, seed=args.seed)
+    print_report(report)
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    baseline_path = os.path.join(BASELINE_DIR, f"{args.scale}.json")
+    if args.save_baseline:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        with open(baseline_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\n💾 Baseline saved to {baseline_path}")
+
+    if args.check:
+        # Baselines are machine-specific, so a fresh checkout has none to compare with
+        if not os.path.exists(baseline_path):
+            print(f"\n⏭️  No baseline at {baseline_path}; regression check skipped. "
+                  "Run with --save-baseline on this machine to record one.")
+            return
+        with open(baseline_path, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        failures = check_regressions(report, baseline, args.threshold)
+        if failures:
+            print(f"\n❌ {len(failures)} regression(s) beyond {args.threshold:.0%}:")
+            for failure in failures:
+                print(f"   - {failure}")
+            sys.exit(1)
+        print(f"\n✅ No regressions beyond {args.threshold:.0%} against {baseline_path}")
+
+
+if __name__ == "__main__":
+    main()
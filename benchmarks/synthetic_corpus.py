@@ -0,0 +1,205 @@
+import argparse
+import json
+import os
+import random
+import re
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Seed vocabulary, resolved against the repo root so the suite runs from any directory
+CHUNKS_PATH = os.path.join(ROOT, "chunks", "chunks.json")
+SAMPLE_SQL_PATH = os.path.join(ROOT, "docs", "sample.sql")
+
+# Scale presets: (procedures, views, tables, QUERY_HISTORY rows)
+SCALES = {
+    "small": (20, 40, 60, 2_000),
+    "medium": (200, 400, 600, 20_000),
+    "large": (2_000, 4_000, 6_000, 200_000),
+}
+
+_QUALIFIED = re.compile(r"\b([A-Z][A-Z0-9_]*\.[A-Z][A-Z0-9_]*(?:\.[A-Z][A-Z0-9_]*)?)\b")
+_COLUMN = re.compile(r"\b[A-Z][A-Z0-9_]*\.([A-Z][A-Z0-9_]{2,})\b")
+_CREATE_TABLE = re.compile(r"CREATE TABLE\s+(\w+)\s*\((.*?)\);", re.S | re.I)
+
+
+def load_seed(chunks_path=CHUNKS_PATH, sample_sql_path=SAMPLE_SQL_PATH):
+    """
+    Collect vocabulary from the repo's sample SQL: schema names, column
+    names and comment lines, so generated DDL looks like ours.
+    """
+    with open(chunks_path, "r", encoding="utf-8") as f:
+        chunks = json.load(f)
+    with open(sample_sql_path, "r", encoding="utf-8") as f:
+        sample_sql = f.read()
+
+    schemas, columns, comments = set(), set(), []
+    for chunk in chunks:
+        text = chunk["text"].upper()
+        for name in _QUALIFIED.findall(text):
+            parts = name.split(".")
+            if len(parts) >= 2:
+                schemas.add(parts[-2])
+        columns.update(_COLUMN.findall(text))
+        comments.extend(line.strip() for line in chunk["text"].split("\n") if line.strip().startswith("--"))
+
+    for _, body in _CREATE_TABLE.findall(sample_sql):
+        for line in body.split("\n"):
+            word = line.strip().split(" ")[0]
+            if word and word.isidentifier() and word.upper() not in ("FOREIGN", "PRIMARY"):
+                columns.add(word.upper())
+    comments.extend(line.strip() for line in sample_sql.split("\n") if line.strip().startswith("--"))
+
+    return {
+        "schemas": sorted(schemas) or ["CORE"],
+        "columns": sorted(columns),
+        "comments": [c for c in comments if len(c) > 4] or ["-- generated"],
+    }
+
+
+class _Generator:
+    def __init__(self, seed_vocab, rng, database, schema):
+        self.v = seed_vocab
+        self.rng = rng
+        self.database = database
+        self.schema = schema
+
+    def cols(self, lo=3, hi=12):
+        return self.rng.sample(self.v["columns"], min(len(self.v["columns"]), self.rng.randint(lo, hi)))
+
+    def literal(self):
+        r = self.rng.random()
+        if r < 0.4:
+            return str(self.rng.randint(1, 100_000))
+        if r < 0.8:
+            return f"'{self.rng.choice(['A', 'B', 'C', 'VA02', 'ZOR', 'VBAK', 'RESTOCK'])}{self.rng.randint(0, 99)}'"
+        day = datetime(2025, 1, 1) + timedelta(days=self.rng.randint(0, 365))
+        return f"'{day:%Y-%m-%d}'"
+
+    def comment(self):
+        return self.rng.choice(self.v["comments"])
+
+    def select(self, sources, cols):
+        a, b = self.rng.sample(sources, 2) if len(sources) > 1 else (sources[0], sources[0])
+        key = self.rng.choice(self.v["columns"])
+        lines = [f"SELECT {', '.join(f'A.{c}' for c in cols)}",
+                 f"FROM {a} A {self.comment()}",
+                 f"LEFT JOIN {b} B ON A.{key} = B.{key}",
+                 f"WHERE A.{self.rng.choice(cols)} = {self.literal()}"]
+        if self.rng.random() < 0.3:
+            values = ", ".join(self.literal() for _ in range(self.rng.randint(5, 40)))
+            lines.append(f"  AND B.{self.rng.choice(cols)} IN ({values})")
+        return "\n".join(lines)
+
+    def statement(self, targets, sources):
+        tgt = self.rng.choice(targets)
+        cols = self.cols()
+        kind = self.rng.choices(["INSERT", "UPDATE", "DELETE", "MERGE", "CTAS"], [4, 2, 1, 2, 1])[0]
+        if kind == "INSERT":
+            return f"INSERT INTO {tgt} ({', '.join(cols)})\n{self.select(sources, cols)};"
+        if kind == "UPDATE":
+            src = self.rng.choice(sources)
+            return (f"UPDATE {tgt} T\nSET {cols[0]} = S.{cols[0]}, {cols[1]} = {self.literal()}\n"
+                    f"FROM {src} S\nWHERE T.{cols[2]} = S.{cols[2]};")
+        if kind == "DELETE":
+            return f"DELETE FROM {tgt} WHERE {cols[0]} < {self.literal()};"
+        if kind == "MERGE":
+            key = cols[0]
+            sets = ", ".join(f"T.{c} = S.{c}" for c in cols[1:])
+            return (f"MERGE INTO {tgt} T\nUSING (\n{self.select(sources, cols)}\n) S\nON T.{key} = S.{key}\n"
+                    f"WHEN MATCHED THEN UPDATE SET {sets}\n"
+                    f"WHEN NOT MATCHED THEN INSERT ({', '.join(cols)}) VALUES ({', '.join(f'S.{c}' for c in cols)});")
+        return f"CREATE OR REPLACE TEMPORARY TABLE {tgt}_TMP AS\n{self.select(sources, cols)};"
+
+    def procedure(self, name, targets, sources, n_statements):
+        body = [f"{self.comment()}\n{self.statement(targets, sources)}" for _ in range(n_statements)]
+        return (
+            f"CREATE OR REPLACE PROCEDURE {self.database}.{self.schema}.{name}()\n"
+            "RETURNS VARCHAR(16777216)\nLANGUAGE SQL\nEXECUTE AS OWNER\nAS\n$$\n"
+            f"DECLARE\n      PROCEDURE_NAME VARCHAR DEFAULT '{name}';\nBEGIN\n"
+            + "\n\n".join(body)
+            + "\nRETURN 'SUCCESS';\nEND;\n$$;"
+        )
+
+    def view(self, name, sources):
+        return f"CREATE OR REPLACE VIEW {self.database}.{self.schema}.{name} AS\n{self.select(sources, self.cols())};"
+
+    def table(self, name):
+        cols = ",\n    ".join(f"{c} VARCHAR" for c in self.cols(4, 20))
+        return f"CREATE OR REPLACE TABLE {self.database}.{self.schema}.{name} (\n    {cols}\n);"
+
+
+def generate_corpus(n_procedures=20, n_views=40, n_tables=60, n_queries=2_000,
+                    statements_per_procedure=(3, 12), seed=42, database="BENCH_DB", schema="BENCH",
+                    seed_vocab=None):
+    """
+    Generate DDL_METADATA-style objects and QUERY_HISTORY rows.
+
+    Returns {"PROCEDURE": [...], "VIEW": [...], "TABLE": [...]} lists of
+    {"name", "ddl"} dicts (the shape fetch_objects returns) plus
+    "query_history": [(QUERY_TEXT, START_TIME), ...].
+    """
+    rng = random.Random(seed)
+    gen = _Generator(seed_vocab or load_seed(), rng, database, schema)
+
+    def qualified(prefix, i):
+        return f"{schema}.{prefix}_{i:05d}"
+
+    table_names = [qualified("TBL", i) for i in range(n_tables)]
+    external = [f"{s}.EXT_{i:03d}" for i, s in enumerate(gen.v["schemas"][:20])]
+    tables = [{"name": n, "ddl": gen.table(n.split(".")[-1])} for n in table_names]
+    views = []
+    for i in range(n_views):
+        name = qualified("V", i)
+        views.append({"name": name, "ddl": gen.view(name.split(".")[-1], table_names + external)})
+    view_names = [v["name"] for v in views]
+
+    procedures = []
+    proc_statements = []
+    for i in range(n_procedures):
+        name = qualified("SP", i)
+        n_stmt = rng.randint(*statements_per_procedure)
+        ddl = gen.procedure(name.split(".")[-1], table_names, table_names + view_names + external, n_stmt)
+        procedures.append({"name": name, "ddl": ddl})
+        proc_statements.extend(re.findall(r"^(?:INSERT|UPDATE|DELETE|MERGE)[^;]*;", ddl, re.M))
+
+    # QUERY_HISTORY: scheduled procedure statements with fresh literals, plus ad-hoc reads
+    end = datetime(2025, 6, 30)
+    history = []
+    for _ in range(n_queries):
+        ts = end - timedelta(seconds=rng.randint(0, 30 * 86400))
+        if proc_statements and rng.random() < 0.7:
+            text = re.sub(r"'[^']*'", lambda _: gen.literal(), rng.choice(proc_statements))
+        else:
+            text = gen.select(view_names or table_names, gen.cols(2, 6)) + ";"
+        history.append((text, ts))
+    history.sort(key=lambda r: r[1], reverse=True)
+
+    return {"PROCEDURE": procedures, "VIEW": views, "TABLE": tables, "query_history": history}
+
+
+def write_corpus(corpus, out_dir):
+    """Write one .sql file per object and query_history.jsonl."""
+    os.makedirs(out_dir, exist_ok=True)
+    for domain in ("PROCEDURE", "VIEW", "TABLE"):
+        for obj in corpus[domain]:
+            path = os.path.join(out_dir, f"{domain.lower()}_{obj['name'].split('.')[-1]}.sql")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(obj["ddl"])
+    with open(os.path.join(out_dir, "query_history.jsonl"), "w", encoding="utf-8") as f:
+        for text, ts in corpus["query_history"]:
+            f.write(json.dumps({"QUERY_TEXT": text, "START_TIME": ts.isoformat()}) + "\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic Snowflake DDL / QUERY_HISTORY corpus.")
+    parser.add_argument("--scale", choices=SCALES, default="small")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", default="bench_corpus")
+    args = parser.parse_args()
+
+    n_procs, n_views, n_tables, n_queries = SCALES[args.scale]
+    corpus = generate_corpus(n_procs, n_views, n_tables, n_queries, seed=args.seed)
+    write_corpus(corpus, args.out)
+    print(f"✅ Wrote {n_procs} procedures, {n_views} views, {n_tables} tables, "
+          f"{n_queries} QUERY_HISTORY rows to {args.out}/")
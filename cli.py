@@ -0,0 +1,68 @@
+"""
+Single entry point for the project's tools:
+
+    python cli.py <command> [command args...]
+    python cli.py search --query "where is VBAK loaded?" --object SP_LOAD_ORDERS
+
+Each command's module is imported only when that command runs, so
+`python cli.py --help` (and every command's own `--help`) starts without
+loading torch, lancedb, groq or the Snowflake connector.
+"""
+import argparse
+import os
+import runpy
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# command -> (script relative to the repo root, one-line help)
+COMMANDS = {
+    "ingest": ("run_proc_to_lancedb.py", "Chunk, embed and store one stored procedure"),
+    "search": ("4-search.py", "Vector search over the stored SQL blocks"),
+    "search-interactive": ("search_lancedb.py", "Prompted vector search with text normalization"),
+    "chat": ("5-chat.py", "Answer questions (single or batch) with retrieved SQL context"),
+    "column-lineage": ("column_lineage.py", "Build and query the column-level lineage edge table"),
+    "lineage-batch": ("lineage_batch.py", "Precompute lineage and CRUD for many schemas as Parquet"),
+    "inspect": ("inspect_lancedb.py", "Preview, stats and maintenance jobs for LanceDB tables"),
+    "table-index": ("table_index.py", "Build / query the table name -> chunk lookup index"),
+    "mmap-index": ("mmap_index.py", "Export / benchmark the memory-mapped exact-search index"),
+    "quant-bench": ("quantized_store.py", "Compare fp32/fp16/int8/binary embedding storage"),
+    "bench": ("benchmarks/run_benchmarks.py", "End-to-end benchmarks on a synthetic corpus"),
+    "eval": ("benchmarks/retrieval_eval.py", "Retrieval quality vs latency over golden question sets"),
+    "corpus": ("benchmarks/synthetic_corpus.py", "Generate a synthetic DDL / QUERY_HISTORY corpus"),
+    "import-budget": ("benchmarks/import_time.py", "Check entry-point import time against the budget"),
+    "mock-llm": ("mock_llm_server.py", "Local Groq/OpenAI-compatible streaming mock server"),
+}
+
+
+def run_script(script, argv):
+    """Run `script` as __main__ with `argv`, the way `python script ...` would."""
+    path = os.path.join(ROOT, script)
+    sys.argv = [path] + list(argv)
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+    runpy.run_path(path, run_name="__main__")
+
+
+def main(argv=None):
+    commands = "\n".join(f"  {name:<20}{text}" for name, (_, text) in COMMANDS.items())
+    parser = argparse.ArgumentParser(
+        prog="cli.py",
+        description="SQL lineage RAG tools.",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=f"commands:\n{commands}\n  {'app':<20}Launch the Streamlit UI\n\n"
+               "Run `cli.py <command> --help` for a command's options.",
+    )
+    parser.add_argument("command", choices=list(COMMANDS) + ["app"], metavar="command")
+    parser.add_argument("args", nargs=argparse.REMAINDER, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.command == "app":
+        sys.exit(subprocess.call([sys.executable, "-m", "streamlit", "run",
+                                  os.path.join(ROOT, "app.py")] + args.args))
+    run_script(COMMANDS[args.command][0], args.args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,465 @@
+import argparse
+import json
+import os
+import time
+import sqlglot
+from sqlglot import exp
+from sqlglot.errors import SqlglotError
+from sqlglot.optimizer.qualify import qualify
+from sqlglot.optimizer.scope import Scope, build_scope
+from sqlglot.schema import MappingSchema
+
+DB_PATH = "lancedb_db"
+TABLE_NAME = "column_lineage"
+CACHE_DIR = "cache"
+
+# INFORMATION_SCHEMA.COLUMNS snapshots older than this are refetched
+SCHEMA_MAX_AGE_HOURS = 24
+
+# Strength order when a value passes through several layers (CTEs, subqueries)
+TRANSFORMS = ("direct", "expression", "aggregate", "constant")
+
+EDGE_FIELDS = [
+    "object_name", "statement_index",
+    "target_database", "target_schema", "target_table", "target_column",
+    "source_database", "source_schema", "source_table", "source_column",
+    "transform", "expression",
+]
+
+# column -> LanceDB scalar index type for the edge table
+EDGE_INDEXES = {
+    "target_table": "BTREE",
+    "target_column": "BTREE",
+    "source_table": "BTREE",
+    "source_column": "BTREE",
+    "object_name": "BTREE",
+}
+
+# Longest expression text kept per edge
+MAX_EXPRESSION_CHARS = 300
+
+
+# -----------------------------
+# Schema: one bulk INFORMATION_SCHEMA.COLUMNS fetch, cached locally
+# -----------------------------
+def fetch_column_schema(agent, database, schemas=None, cache_dir=CACHE_DIR,
+                        max_age_hours=SCHEMA_MAX_AGE_HOURS, refresh=False):
+    """
+    Return {database: {schema: {table: {column: type}}}} for `database`.
+    Served from the local cache unless it is missing, stale or `refresh`
+    is set, in which case every column is read in one query.
+    """
+    cache_path = os.path.join(cache_dir, f"columns_{database.upper()}.json")
+    if not refresh and os.path.exists(cache_path):
+        with open(cache_path, "r", encoding="utf-8") as f:
+            cached = json.load(f)
+        fresh = time.time() - cached["fetched_at"] < max_age_hours * 3600
+        covered = cached["schemas"] is None or {s.upper() for s in schemas or []} <= set(cached["schemas"])
+        if fresh and covered:
+            return cached["mapping"]
+
+    if not agent or not agent.conn:
+        return {}
+
+    query = f"""
+        SELECT TABLE_SCHEMA, TABLE_NAME, COLUMN_NAME, DATA_TYPE
+        FROM "{database}".INFORMATION_SCHEMA.COLUMNS
+        WHERE TABLE_SCHEMA <> 'INFORMATION_SCHEMA'
+    """
+    if schemas:
+        in_list = ", ".join(f"'{s.upper()}'" for s in schemas)
+        query += f" AND TABLE_SCHEMA IN ({in_list})"
+    query += " ORDER BY TABLE_SCHEMA, TABLE_NAME, ORDINAL_POSITION"
+
+    print(f"📥 Fetching column metadata for {database}...")
+    cur = agent.conn.cursor()
+    cur.execute(query)
+    rows = cur.fetchall()
+    cur.close()
+
+    tables = {}
+    for schema, table, column, data_type in rows:
+        tables.setdefault(schema.upper(), {}).setdefault(table.upper(), {})[column.upper()] = data_type
+    mapping = {database.upper(): tables}
+
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(cache_path, "w", encoding="utf-8") as f:
+        json.dump({"fetched_at": time.time(),
+                   "schemas": sorted(s.upper() for s in schemas) if schemas else None,
+                   "mapping": mapping}, f)
+    print(f"✅ Cached {len(rows)} columns in {cache_path}")
+    return mapping
+
+
+def make_schema(mapping):
+    """Build the sqlglot schema once and share it across statements."""
+    return MappingSchema(mapping or None, dialect="snowflake")
+
+
+# -----------------------------
+# Lineage engine
+# -----------------------------
+def _table_parts(table, database=None, default_schema=None):
+    return (
+        (table.catalog or database or "").upper(),
+        (table.db or default_schema or "").upper(),
+        table.name.upper(),
+    )
+
+
+def _strongest(a, b):
+    return a if TRANSFORMS.index(a) >= TRANSFORMS.index(b) else b
+
+
+def _transform_of(expression):
+    node = expression.this if isinstance(expression, exp.Alias) else expression
+    if isinstance(node, exp.Column):
+        return "direct"
+    if node.find(exp.AggFunc):
+        return "aggregate"
+    if not node.find(exp.Column):
+        return "constant"
+    return "expression"
+
+
+def _find_source(scope, alias):
+    """Resolve a column's table alias to a Table or Scope, looking into nested scopes too."""
+    if alias in scope.sources:
+        return scope.sources[alias]
+    for child in scope.traverse():
+        if alias in child.sources:
+            return child.sources[alias]
+    return None
+
+
+def _projection_index(scope, name):
+    expression = scope.expression
+    selects = expression.selects if not isinstance(expression, exp.SetOperation) else \
+        scope.union_scopes[0].expression.selects
+    for i, projection in enumerate(selects):
+        if projection.alias_or_name.upper() == name.upper():
+            return i
+    return None
+
+
+def _trace(scope, index, database, default_schema, depth=0):
+    """
+    Follow projection `index` of `scope` down to base-table columns.
+    Returns [(source (db, schema, table) or None, source column, transform,
+    expression)], where expression is the outermost non-passthrough step.
+    """
+    if depth > 32:
+        return []
+    if isinstance(scope.expression, exp.SetOperation):
+        found = []
+        for branch in scope.union_scopes:
+            found.extend(_trace(branch, index, database, default_schema, depth + 1))
+        return found
+
+    selects = scope.expression.selects
+    if index >= len(selects):
+        return []
+    projection = selects[index]
+    transform = _transform_of(projection)
+    node = projection.this if isinstance(projection, exp.Alias) else projection
+    text = node.sql(dialect="snowflake")[:MAX_EXPRESSION_CHARS]
+    columns = list(projection.find_all(exp.Column))
+    if not columns:
+        return [(None, "", "constant", text)]
+
+    found = []
+    for column in columns:
+        source = _find_source(scope, column.table) if column.table else None
+        if source is None and len(scope.sources) == 1:
+            source = next(iter(scope.sources.values()))
+        if isinstance(source, exp.Table):
+            found.append((_table_parts(source, database, default_schema), column.name.upper(), transform, text))
+        elif isinstance(source, Scope):
+            inner = _projection_index(source, column.name)
+            if inner is None:
+                continue
+            for table, name, inner_transform, inner_text in _trace(source, inner, database,
+                                                                   default_schema, depth + 1):
+                found.append((table, name, _strongest(transform, inner_transform),
+                              inner_text if transform == "direct" else text))
+        else:
+            # Ambiguous or unknown table: keep the column so the edge isn't lost
+            found.append((None, column.name.upper(), transform, text))
+    return found
+
+
+def _select_lineage(select, target_columns, schema, database, default_schema):
+    """Map the i-th projection of `select` to `target_columns[i]`."""
+    try:
+        qualified = qualify(select.copy(), schema=schema, dialect="snowflake", catalog=database,
+                            db=default_schema, validate_qualify_columns=False, quote_identifiers=False)
+    except SqlglotError:
+        return []
+    scope = build_scope(qualified)
+    if scope is None:
+        return []
+
+    selects = qualified.selects if not isinstance(qualified, exp.SetOperation) else \
+        scope.union_scopes[0].expression.selects
+    if not target_columns:
+        target_columns = [p.alias_or_name.upper() for p in selects]
+
+    mappings = []
+    for i, target in enumerate(target_columns[:len(selects)]):
+        for source, source_column, transform, text in _trace(scope, i, database, default_schema):
+            mappings.append((target.upper(), source, source_column, transform, text))
+    return mappings
+
+
+def _assignments_select(assignments, sources):
+    """
+    UPDATE / MERGE assignments as one SELECT over the same sources, so they
+    go through the same scope-based tracing as INSERT ... SELECT.
+    """
+    items = ", ".join(f"{value.sql(dialect='snowflake')} AS {name}" for name, value in assignments)
+    from_sql = ", ".join(s.sql(dialect="snowflake") for s in sources)
+    return sqlglot.parse_one(f"SELECT {items} FROM {from_sql}", read="snowflake")
+
+
+def _target_columns(table, schema, explicit=None):
+    if explicit:
+        return [c.name.upper() for c in explicit]
+    if schema is not None:
+        try:
+            return [c.upper() for c in schema.column_names(table, dialect="snowflake")]
+        except SqlglotError:
+            return []
+    return []
+
+
+def statement_lineage(statement, schema=None, database=None, default_schema=None):
+    """
+    Column-level lineage of one INSERT / CREATE ... AS / UPDATE / MERGE.
+
+    `statement` is SQL text or an already parsed sqlglot expression. Returns
+    edge dicts mapping each written target column to the base-table columns
+    it is computed from, with the transform kind (direct, expression,
+    aggregate, constant) and the projecting expression.
+    """
+    if isinstance(statement, str):
+        try:
+            statement = sqlglot.parse_one(statement, read="snowflake")
+        except SqlglotError:
+            return []
+    if statement is None:
+        return []
+    if schema is not None and not isinstance(schema, MappingSchema):
+        schema = make_schema(schema)
+
+    target, mappings = None, []
+    try:
+        if isinstance(statement, exp.Insert) and isinstance(statement.expression, (exp.Query)):
+            target_node = statement.this
+            explicit = target_node.expressions if isinstance(target_node, exp.Schema) else None
+            target = target_node.this if isinstance(target_node, exp.Schema) else target_node
+            columns = _target_columns(target, schema, explicit)
+            mappings = _select_lineage(statement.expression, columns, schema, database, default_schema)
+
+        elif isinstance(statement, exp.Create) and isinstance(statement.expression, exp.Query):
+            target_node = statement.this
+            explicit = target_node.expressions if isinstance(target_node, exp.Schema) else None
+            target = target_node.this if isinstance(target_node, exp.Schema) else target_node
+            mappings = _select_lineage(statement.expression, [c.name for c in explicit or []],
+                                       schema, database, default_schema)
+
+        elif isinstance(statement, exp.Update):
+            target = statement.this
+            sources = [target] + ([statement.args["from"].this] if statement.args.get("from") else [])
+            assignments = [(eq.this.name, eq.expression) for eq in statement.expressions
+                           if isinstance(eq, exp.EQ) and isinstance(eq.this, exp.Column)]
+            if assignments:
+                select = _assignments_select(assignments, sources)
+                mappings = _select_lineage(select, [n for n, _ in assignments], schema, database, default_schema)
+
+        elif isinstance(statement, exp.Merge):
+            target = statement.this
+            using = statement.args.get("using")
+            assignments = []
+            for when in statement.args["whens"].expressions:
+                then = when.args.get("then")
+                if isinstance(then, exp.Update):
+                    assignments.extend((eq.this.name, eq.expression) for eq in then.expressions
+                                       if isinstance(eq, exp.EQ) and isinstance(eq.this, exp.Column))
+                elif isinstance(then, exp.Insert) and isinstance(then.this, exp.Tuple) \
+                        and isinstance(then.expression, exp.Tuple):
+                    assignments.extend((c.name, v) for c, v in
+                                       zip(then.this.expressions, then.expression.expressions))
+            if assignments:
+                select = _assignments_select(assignments, [target, using])
+                mappings = _select_lineage(select, [n for n, _ in assignments], schema, database, default_schema)
+    except SqlglotError:
+        return []
+
+    if target is None or not isinstance(target, exp.Table):
+        return []
+    target_db, target_schema, target_table = _table_parts(target, database, default_schema)
+
+    edges, seen = [], set()
+    for target_column, source, source_column, transform, text in mappings:
+        source_db, source_schema, source_table = source or ("", "", "")
+        key = (target_column, source_db, source_schema, source_table, source_column)
+        if key in seen:
+            continue
+        seen.add(key)
+        edges.append({
+            "target_database": target_db,
+            "target_schema": target_schema,
+            "target_table": target_table,
+            "target_column": target_column,
+            "source_database": source_db,
+            "source_schema": source_schema,
+            "source_table": source_table,
+            "source_column": source_column,
+            "transform": transform,
+            "expression": text,
+        })
+    return edges
+
+
+# -----------------------------
+# Persisted edge table
+# -----------------------------
+def _edge_schema():
+    import pyarrow as pa
+    return pa.schema([pa.field(name, pa.int32() if name == "statement_index" else pa.string())
+                      for name in EDGE_FIELDS])
+
+
+def store_column_lineage(db_path, edges, object_names, table_name=TABLE_NAME):
+    """
+    Replace the lineage edges of `object_names` in the LanceDB edge table
+    and keep the lookup columns indexed.
+    """
+    import lancedb
+    import pyarrow as pa
+    from embed_and_store import _sql_quote, ensure_scalar_indexes
+
+    db = lancedb.connect(db_path)
+    data = pa.Table.from_pylist([{f: e.get(f) for f in EDGE_FIELDS} for e in edges], schema=_edge_schema())
+    if table_name in db.table_names():
+        tbl = db.open_table(table_name)
+        names = ", ".join(f"'{_sql_quote(n)}'" for n in object_names)
+        if names:
+            tbl.delete(f"object_name IN ({names})")
+        if data.num_rows:
+            tbl.add(data)
+    else:
+        tbl = db.create_table(table_name, data, schema=_edge_schema())
+    if tbl.count_rows():
+        ensure_scalar_indexes(tbl, EDGE_INDEXES)
+    print(f"✅ Stored {len(edges)} column lineage edges for {len(object_names)} objects")
+    return tbl
+
+
+def _lookup(tbl, table, column, direction, schema=None):
+    from embed_and_store import _sql_quote
+    side = "target" if direction == "upstream" else "source"
+    where = f"{side}_table = '{_sql_quote(table.upper())}' AND {side}_column = '{_sql_quote(column.upper())}'"
+    if schema:
+        where += f" AND {side}_schema = '{_sql_quote(schema.upper())}'"
+    return tbl.search().where(where).select(EDGE_FIELDS).limit(None).to_list()
+
+
+def trace_column(tbl, table, column, schema=None, direction="upstream", max_depth=1):
+    """
+    Walk the edge table from `table.column`: "upstream" answers "where does
+    this column come from", "downstream" answers "what is built from it".
+    Each hop is an indexed lookup; returns edges tagged with their depth.
+    """
+    other = "source" if direction == "upstream" else "target"
+    frontier = [(schema, table, column)]
+    seen, found = set(), []
+    for depth in range(1, max_depth + 1):
+        next_frontier = []
+        for node_schema, node_table, node_column in frontier:
+            if (node_schema, node_table, node_column) in seen:
+                continue
+            seen.add((node_schema, node_table, node_column))
+            for edge in _lookup(tbl, node_table, node_column, direction, node_schema):
+                found.append({**edge, "depth": depth})
+                if edge[f"{other}_table"]:
+                    next_frontier.append((edge[f"{other}_schema"] or None, edge[f"{other}_table"],
+                                          edge[f"{other}_column"]))
+        frontier = next_frontier
+        if not frontier:
+            break
+    return found
+
+
+# -----------------------------
+# Build from DDL_METADATA
+# -----------------------------
+def build_lineage(objects, schema=None, database=None, default_schema=None):
+    """Column lineage edges for {"name", "ddl"} objects, tagged with the object name."""
+    from sql_extractor import SQLExtractor
+
+    extractor = SQLExtractor(schema=schema, database=database, default_schema=default_schema)
+    edges = []
+    for obj in objects:
+        result = extractor.extract_all(obj["ddl"] or "")
+        for edge in result["column_lineage"]:
+            edges.append({**edge, "object_name": obj["name"]})
+    return edges
+
+
+def _format_edge(edge, direction):
+    src = ".".join(p for p in (edge["source_schema"], edge["source_table"], edge["source_column"]) if p)
+    tgt = ".".join(p for p in (edge["target_schema"], edge["target_table"], edge["target_column"]) if p)
+    arrow = f"{tgt} ← {src or '(constant)'}" if direction == "upstream" else f"{src} → {tgt}"
+    return f"{'  ' * (edge['depth'] - 1)}{arrow}  [{edge['transform']}] {edge['expression'][:80]}  ({edge['object_name']})"
+
+
+def main():
+    # Options every subcommand takes after its name
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--db", default=DB_PATH)
+    common.add_argument("--table", default=TABLE_NAME)
+
+    parser = argparse.ArgumentParser(description="Column-level lineage: build the edge table and query it.")
+    sub = parser.add_subparsers(dest="job", required=True)
+    build = sub.add_parser("build", parents=[common],
+                           help="Parse procedures/views from DDL_METADATA and store lineage edges")
+    build.add_argument("--domains", nargs="+", default=["PROCEDURE", "VIEW"])
+    build.add_argument("--refresh-schema", action="store_true", help="Refetch INFORMATION_SCHEMA.COLUMNS")
+    for name in ("upstream", "downstream"):
+        query = sub.add_parser(name, parents=[common],
+                               help=f"{name.title()} lineage of a column, e.g. SALES.ORDERS.AMOUNT")
+        query.add_argument("column", help="[SCHEMA.]TABLE.COLUMN")
+        query.add_argument("--depth", type=int, default=1)
+    args = parser.parse_args()
+
+    if args.job == "build":
+        from dotenv import load_dotenv
+        from agents.mapping_extractor import MappingExtractorAgent
+        from lineage import fetch_objects
+
+        load_dotenv()
+        database, default_schema = os.getenv("SNOWFLAKE_DATABASE"), os.getenv("SNOWFLAKE_SCHEMA")
+        agent = MappingExtractorAgent()
+        schema = make_schema(fetch_column_schema(agent, database, refresh=args.refresh_schema))
+        objects = [o for d in args.domains for o in fetch_objects(agent, database, default_schema, d)]
+        print(f"🧬 Extracting column lineage from {len(objects)} objects...")
+        edges = build_lineage(objects, schema, database, default_schema)
+        store_column_lineage(args.db, edges, [o["name"] for o in objects], args.table)
+        return
+
+    import lancedb
+    parts = args.column.split(".")
+    if len(parts) < 2:
+        parser.error("column must be [SCHEMA.]TABLE.COLUMN")
+    schema = parts[-3] if len(parts) >= 3 else None
+    tbl = lancedb.connect(args.db).open_table(args.table)
+    edges = trace_column(tbl, parts[-2], parts[-1], schema, args.job, args.depth)
+    if not edges:
+        print(f"❌ No {args.job} lineage recorded for {args.column}")
+    for edge in edges:
+        print(_format_edge(edge, args.job))
+
+
+if __name__ == "__main__":
+    main()
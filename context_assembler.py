@@ -0,0 +1,149 @@
+import re
+from sql_minify import CONTEXT_MINIFY, MINIFY_MIN_TOKENS, minify_many
+from utils.tokenizer import get_tokenizer
+
+TOKENIZER_PATH = "models/all-MiniLM-L6-v2"
+SEPARATOR = "\n\n---\n\n"
+
+# Two chunks whose word-shingle Jaccard similarity reaches this are treated as duplicates
+DUPLICATE_THRESHOLD = 0.9
+
+_tokenizer = None
+
+
+def count_tokens(text):
+    """Token count using the local embedding model's tokenizer."""
+    global _tokenizer
+    if _tokenizer is None:
+        _tokenizer = get_tokenizer(TOKENIZER_PATH)
+        # Only counting, never feeding the model: silence the 512-token length warning
+        _tokenizer.model_max_length = 10 ** 9
+    return len(_tokenizer.encode(text, add_special_tokens=False))
+
+
+def _shingles(text, size=3):
+    words = re.findall(r"\w+", text.lower())
+    if len(words) <= size:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def _jaccard(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def dedup_chunks(chunks, threshold=DUPLICATE_THRESHOLD):
+    """
+    Drop chunks that repeat an earlier (better ranked) chunk, either exactly
+    or with a shingle overlap above `threshold`.
+    """
+    kept = []
+    kept_shingles = []
+    for chunk in chunks:
+        shingles = _shingles(chunk["text"])
+        if any(_jaccard(shingles, s) >= threshold for s in kept_shingles):
+            continue
+        kept.append(chunk)
+        kept_shingles.append(shingles)
+    return kept
+
+
+def merge_adjacent(chunks):
+    """
+    Merge overlapping or neighbouring blocks of the same object into one
+    contiguous span using their start_block/end_block line ranges.
+    Each span keeps the rank of its best member. Chunks without a block
+    range are passed through untouched.
+    """
+    groups = {}
+    loose = []
+    for rank, chunk in enumerate(chunks):
+        start, end = chunk.get("start_block") or 0, chunk.get("end_block") or 0
+        if start <= 0 or end < start:
+            loose.append({**chunk, "rank": rank})
+            continue
+        groups.setdefault(chunk.get("object_name") or "", []).append({**chunk, "rank": rank})
+
+    spans = []
+    for object_name, members in groups.items():
+        members.sort(key=lambda c: c["start_block"])
+        current = None
+        for chunk in members:
+            if current and chunk["start_block"] <= current["end_block"] + 1:
+                # Only append the lines the current span does not already cover
+                lines = chunk["text"].split("\n")
+                overlap = current["end_block"] - chunk["start_block"] + 1
+                if chunk["end_block"] > current["end_block"]:
+                    current["text"] += "\n" + "\n".join(lines[max(overlap, 0):])
+                    current["end_block"] = chunk["end_block"]
+                current["rank"] = min(current["rank"], chunk["rank"])
+                current["merged"] += 1
+            else:
+                current = {**chunk, "merged": 1}
+                spans.append(current)
+
+    spans.extend({**c, "merged": 1} for c in loose)
+    spans.sort(key=lambda s: s["rank"])
+    return spans
+
+
+def _render(span, text=None):
+    text = span["text"] if text is None else text
+    if span.get("object_name") and span.get("start_block"):
+        header = f"-- {span['object_name']} lines {span['start_block']}-{span['end_block']}\n"
+        return header + text
+    return text
+
+
+def assemble_context(chunks, max_tokens=2000, token_counter=count_tokens, minify_over=MINIFY_MIN_TOKENS):
+    """
+    Build an LLM context from ranked search hits (best first).
+
+    Near-duplicates are dropped, adjacent blocks are merged into spans, and
+    spans are packed greedily in rank order while they fit in `max_tokens`.
+    When the spans come to more than `minify_over` tokens their SQL is
+    minified (see sql_minify) before packing, so more of them fit; None
+    turns that off. Returns (context, stats).
+    """
+    chunks = [c for c in chunks if str(c.get("text") or "").strip()]
+    unique = dedup_chunks(chunks)
+    spans = merge_adjacent(unique)
+
+    raw = [_render(span) for span in spans]
+    raw_tokens = [token_counter(text) for text in raw]
+    texts = raw
+    minify = CONTEXT_MINIFY and minify_over is not None and sum(raw_tokens) > minify_over
+    if minify:
+        # Each span on its own to pick what fits; the packed ones again together below
+        texts = [_render(span, minify_many([span["text"]])[0]) for span in spans]
+
+    sep_tokens = token_counter(SEPARATOR)
+    packed = []
+    used = 0
+    for i, text in enumerate(texts):
+        cost = token_counter(text) + (sep_tokens if packed else 0)
+        if used + cost > max_tokens:
+            continue
+        packed.append(i)
+        used += cost
+
+    raw_used = sum(raw_tokens[i] for i in packed) + sep_tokens * max(len(packed) - 1, 0)
+    parts = [raw[i] for i in packed]
+    if minify and packed:
+        # Together, so SQL repeated across the packed spans is only spelled out once
+        bodies = minify_many([spans[i]["text"] for i in packed])
+        parts = [_render(spans[i], body) for i, body in zip(packed, bodies)]
+        used = sum(token_counter(p) for p in parts) + sep_tokens * (len(parts) - 1)
+
+    stats = {
+        "chunks_in": len(chunks),
+        "chunks_unique": len(unique),
+        "spans": len(spans),
+        "spans_packed": len(parts),
+        "minified": minify,
+        "context_tokens_raw": raw_used,
+        "context_tokens": used,
+    }
+    return SEPARATOR.join(parts), stats
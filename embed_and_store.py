@@ -1,50 +1,465 @@
 import os
-import lancedb
-from sentence_transformers import SentenceTransformer
-from tqdm import tqdm
+import json
+import hashlib
+import time
+import numpy as np
+import pyarrow as pa
+from utils.tracing import span, traced
+from quantized_store import (
+    INT8_SCALE_KEY, detect_storage, embedding_columns, int8_scale, quantized_search, read_int8_scale, storage_fields,
+)
 
 # Load the local embedding model once
 _model = None
 
+EMBED_DIM = 384
 
-def load_model(model_path="models/all-MiniLM-L6-v2"):
+# Metadata columns stored next to every chunk so searches can be scoped
+# ("only within procedure X") without scanning the whole corpus.
+CHUNK_SCHEMA = pa.schema([
+    pa.field("chunk_id", pa.int64()),
+    pa.field("object_name", pa.string()),
+    pa.field("schema_name", pa.string()),
+    pa.field("object_domain", pa.string()),
+    pa.field("block_id", pa.string()),
+    pa.field("block_type", pa.string()),
+    pa.field("start_block", pa.int32()),
+    pa.field("end_block", pa.int32()),
+    pa.field("content_hash", pa.string()),
+    # Canonical names (see sql_extractor.canonical_table) of the tables the
+    # chunk references / writes, for exact table lookups (table_index.py)
+    pa.field("tables", pa.list_(pa.string())),
+    pa.field("targets", pa.list_(pa.string())),
+    pa.field("text", pa.string()),
+    pa.field("embedding", pa.list_(pa.float32(), EMBED_DIM)),
+])
+
+# column -> LanceDB scalar index type
+SCALAR_INDEXES = {
+    "object_name": "BTREE",
+    "schema_name": "BITMAP",
+    "object_domain": "BITMAP",
+    "block_type": "BITMAP",
+    "start_block": "BTREE",
+    "content_hash": "BTREE",
+    "tables": "LABEL_LIST",
+    "targets": "LABEL_LIST",
+}
+
+# List columns filled by chunk_table_refs; tables created before they existed are written without them
+REF_COLUMNS = ("tables", "targets")
+
+# Default projection for searches: everything except the vector payload
+SEARCH_COLUMNS = [f.name for f in CHUNK_SCHEMA if f.name != "embedding"]
+
+# fp32 | fp16 | int8 | binary, see quantized_store.py
+EMBED_STORAGE = os.getenv("EMBED_STORAGE", "fp32")
+
+MODEL_PATH = "models/all-MiniLM-L6-v2"
+
+# The model truncates longer inputs (max_seq_length in sentence_bert_config.json)
+MAX_SEQ_TOKENS = 256
+
+# Padded tokens per encode batch: short chunks get large batches, long ones
+# small, so a batch is never padded out to one outlier's length
+EMBED_BATCH_TOKENS = int(os.getenv("EMBED_BATCH_TOKENS", 16384))
+EMBED_MAX_BATCH = int(os.getenv("EMBED_MAX_BATCH", 256))
+
+# torch intra-op threads for in-process encoding (0 = torch's default)
+EMBED_THREADS = int(os.getenv("EMBED_THREADS", 0))
+
+# Worker processes for the encode pool (0 or 1 = encode in this process)
+EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", 0))
+
+# Rows per Arrow record batch written to LanceDB; bounds ingest memory
+WRITE_BATCH_ROWS = int(os.getenv("LANCEDB_WRITE_BATCH_ROWS", 2048))
+
+_length_tokenizer = None
+
+
+def load_model(model_path=MODEL_PATH):
     global _model
     if _model is None:
         print(f"📦 Loading local embedding model from: {model_path}")
-        _model = SentenceTransformer(model_path)
+        with span("embed.load_model", model=model_path):
+            from sentence_transformers import SentenceTransformer
+            _model = SentenceTransformer(model_path)
     return _model
 
 
-def embed_texts(texts):
+def set_torch_threads(threads):
+    """Set torch's intra-op thread count; returns the previous value (None without torch)."""
+    try:
+        import torch
+    except ImportError:
+        return None
+    previous = torch.get_num_threads()
+    if threads and threads > 0:
+        torch.set_num_threads(threads)
+    return previous
+
+
+def token_lengths(texts, model_path=MODEL_PATH):
+    """Tokens per text as the model will see them, capped at MAX_SEQ_TOKENS."""
+    global _length_tokenizer
+    if _length_tokenizer is None:
+        from utils.tokenizer import get_tokenizer
+        _length_tokenizer = get_tokenizer(model_path)
+    if not texts:
+        return np.zeros(0, dtype=np.int64)
+    # Only the first MAX_SEQ_TOKENS tokens count. SQL averages 3-4 chars a
+    # token, so 8 chars per token of prefix is plenty and keeps this cheap
+    head = [t[:MAX_SEQ_TOKENS * 8] for t in texts]
+    ids = _length_tokenizer(head, truncation=True, max_length=MAX_SEQ_TOKENS)["input_ids"]
+    return np.array([len(i) for i in ids], dtype=np.int64)
+
+
+def length_buckets(lengths, batch_tokens=EMBED_BATCH_TOKENS, max_batch=EMBED_MAX_BATCH):
+    """
+    Group text indices into batches of similar length, shortest first.
+    A batch grows while (size x its longest text) stays within batch_tokens.
+    """
+    order = np.argsort(lengths, kind="stable")
+    batches, current = [], []
+    for i in order:
+        longest = max(int(lengths[i]), 1)
+        if current and ((len(current) + 1) * longest > batch_tokens or len(current) >= max_batch):
+            batches.append(current)
+            current = []
+        current.append(int(i))
+    if current:
+        batches.append(current)
+    return batches
+
+
+def _encode_batches(model, texts, batches):
+    vectors = None
+    for batch in batches:
+        out = model.encode([texts[i] for i in batch], batch_size=len(batch), convert_to_numpy=True)
+        if vectors is None:
+            vectors = np.empty((len(texts), out.shape[1]), dtype=out.dtype)
+        vectors[batch] = out
+    return vectors
+
+
+# -----------------------------
+# Multi-process encode pool
+# -----------------------------
+_worker_model = None
+
+
+def _pool_init(model_path, threads):
+    global _worker_model
+    set_torch_threads(threads)
+    from sentence_transformers import SentenceTransformer
+    _worker_model = SentenceTransformer(model_path)
+
+
+def _pool_encode(texts):
+    return _worker_model.encode(texts, batch_size=len(texts), convert_to_numpy=True)
+
+
+class EncodePool:
+    """
+    Worker processes that each hold a copy of the model and split the
+    cores between them (threads per worker = cores // workers). Use as a
+    context manager and pass to embed_texts(pool=...) to reuse it.
+    """
+
+    def __init__(self, workers=None, model_path=MODEL_PATH, threads_per_worker=None):
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+
+        self.workers = workers or os.cpu_count() or 1
+        self.threads_per_worker = threads_per_worker or max(1, (os.cpu_count() or 1) // self.workers)
+        print(f"🧵 Starting encode pool: {self.workers} workers x {self.threads_per_worker} threads")
+        # spawn: fork after torch has started its thread pools can deadlock
+        self._executor = ProcessPoolExecutor(
+            self.workers, mp_context=multiprocessing.get_context("spawn"),
+            initializer=_pool_init, initargs=(model_path, self.threads_per_worker))
+
+    def encode(self, texts, batches):
+        futures = [(batch, self._executor.submit(_pool_encode, [texts[i] for i in batch])) for batch in batches]
+        vectors = None
+        for batch, future in futures:
+            out = future.result()
+            if vectors is None:
+                vectors = np.empty((len(texts), out.shape[1]), dtype=out.dtype)
+            vectors[batch] = out
+        return vectors
+
+    def close(self):
+        self._executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def embed_texts(texts, batch_tokens=EMBED_BATCH_TOKENS, threads=EMBED_THREADS, workers=EMBED_WORKERS, pool=None):
     """
     Generate embeddings using the local SentenceTransformer model.
+
+    Texts are encoded in length-sorted batches (see length_buckets) and
+    returned in their original order. With `pool`, or workers > 1, the
+    batches are spread over an EncodePool instead of this process.
     """
-    model = load_model()
+    texts = list(texts)
+    if not texts:
+        return np.zeros((0, EMBED_DIM), dtype=np.float32)
     print(f"🧠 Generating {len(texts)} embeddings...")
-    vectors = model.encode(texts, show_progress_bar=True, convert_to_numpy=True)
+    with span("embed.encode", texts=len(texts)) as s:
+        lengths = token_lengths(texts)
+        batches = length_buckets(lengths, batch_tokens)
+        s.set(batches=len(batches), tokens=int(lengths.sum()))
+        start = time.perf_counter()
+        if pool is not None or workers > 1:
+            own_pool = pool is None
+            pool = pool or EncodePool(workers)
+            try:
+                vectors = pool.encode(texts, batches)
+            finally:
+                if own_pool:
+                    pool.close()
+        else:
+            model = load_model()
+            previous = set_torch_threads(threads)
+            try:
+                vectors = _encode_batches(model, texts, batches)
+            finally:
+                if threads:
+                    set_torch_threads(previous)
+        elapsed = time.perf_counter() - start
+    print(f"✅ {len(texts)} embeddings in {len(batches)} batches, {elapsed:.1f}s "
+          f"({len(texts) / elapsed if elapsed else 0:.0f} chunks/s)")
     return vectors
 
 
-def store_embeddings_lancedb(db_path, table_name, chunks, vectors):
+def content_hash(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def _sql_quote(value):
+    return str(value).replace("'", "''")
+
+
+def build_where(object_name=None, schema_name=None, object_domain=None, block_type=None):
+    """
+    Build a LanceDB SQL filter from the metadata columns.
+    Names are stored upper-case, so values are matched upper-case too.
+    """
+    clauses = []
+    for column, value in (
+        ("object_name", object_name),
+        ("schema_name", schema_name),
+        ("object_domain", object_domain),
+        ("block_type", block_type),
+    ):
+        if value:
+            clauses.append(f"{column} = '{_sql_quote(value.upper())}'")
+    return " AND ".join(clauses) or None
+
+
+def search_chunks(tbl, query_vector, top_k=5, where=None, columns=None):
+    """
+    Vector search with an optional metadata prefilter and column projection.
+    The embedding column is left out of the results unless asked for.
+    int8/binary tables get a quantized first pass plus exact fp32 rescoring.
+    """
+    if columns is None:
+        columns = SEARCH_COLUMNS
+    available = set(tbl.schema.names)
+    columns = [c for c in columns if c in available]
+    with span("lancedb.search", top_k=top_k, where=where or "") as s:
+        results = quantized_search(tbl, query_vector, top_k=top_k, where=where, columns=columns)
+        s.set(rows=len(results))
+    return results
+
+
+def hybrid_search_chunks(tbl, query_vector, query_text, top_k=5, where=None, columns=None):
+    """
+    Vector search plus full-text (BM25) search on the chunk text, fused by
+    reciprocal rank. Needs the index from ensure_fts_index. Results carry
+    _relevance_score (higher is better) instead of _distance.
+    """
+    if columns is None:
+        columns = SEARCH_COLUMNS
+    available = set(tbl.schema.names)
+    columns = [c for c in columns if c in available]
+    query_vector = np.asarray(query_vector, dtype=np.float32)
+    if detect_storage(tbl.schema) == "fp16":
+        query_vector = query_vector.astype(np.float16)
+    with span("lancedb.hybrid_search", top_k=top_k, where=where or "") as s:
+        query = tbl.search(query_type="hybrid", vector_column_name="embedding").vector(query_vector).text(query_text)
+        if where:
+            query = query.where(where, prefilter=True)
+        results = query.select(columns).limit(top_k).to_pandas()
+        s.set(rows=len(results))
+    return results
+
+
+def ensure_fts_index(tbl, column="text"):
+    """Create the full-text index used by hybrid_search_chunks if it is missing."""
+    if not any(idx.index_type == "FTS" for idx in tbl.list_indices()):
+        print(f"🗂️  Building FTS index on '{column}'...")
+        tbl.create_fts_index(column, use_tantivy=False)
+
+
+def ensure_scalar_indexes(tbl, indexes=SCALAR_INDEXES):
+    """Create any missing scalar indexes on the metadata columns."""
+    indexed = {col for idx in tbl.list_indices() for col in idx.columns}
+    for column, index_type in indexes.items():
+        if column not in indexed and column in tbl.schema.names:
+            print(f"🗂️  Building {index_type} index on '{column}'...")
+            tbl.create_scalar_index(column, index_type=index_type)
+
+
+def next_chunk_id(tbl):
+    """One past the largest chunk_id in the table, so appended chunks never reuse an id."""
+    import pyarrow.compute as pc
+
+    ids = tbl.search().select(["chunk_id"]).limit(None).to_arrow().column("chunk_id")
+    top = pc.max(ids).as_py() if len(ids) else None
+    return 0 if top is None else top + 1
+
+
+def chunk_schema(storage="fp32", scale=None, table_refs=True):
+    """CHUNK_SCHEMA with the embedding column(s) for the given storage mode (and REF_COLUMNS unless not `table_refs`)."""
+    skip = {"embedding"} if table_refs else {"embedding", *REF_COLUMNS}
+    fields = [f for f in CHUNK_SCHEMA if f.name not in skip] + storage_fields(storage, EMBED_DIM)
+    metadata = {INT8_SCALE_KEY: json.dumps(scale.tolist())} if scale is not None else None
+    return pa.schema(fields, metadata=metadata)
+
+
+def chunk_table_refs(chunks):
+    """
+    (tables, targets) lists per chunk: the chunk's own "tables" / "targets"
+    keys if it has them, else SQLExtractor.table_refs of its text.
+    """
+    from sql_extractor import SQLExtractor
+
+    extractor = SQLExtractor()
+    tables, targets = [], []
+    for c in chunks:
+        refs = c if "tables" in c else extractor.table_refs(c["text"])
+        tables.append(list(refs["tables"]))
+        targets.append(list(refs.get("targets", [])))
+    return tables, targets
+
+
+def _metadata_columns(chunks, start, object_name, schema_name, object_domain, table_refs=True, first_id=0):
+    """Arrow arrays for the non-vector columns of chunks[i], chunk_id = first_id + start + i."""
+    chunks = [{"text": c} if isinstance(c, str) else c for c in chunks]
+    n = len(chunks)
+    texts = [c["text"] for c in chunks]
+    refs = {}
+    if table_refs:
+        with span("ingest.table_refs", chunks=n):
+            tables, targets = chunk_table_refs(chunks)
+        refs = {"tables": pa.array(tables, pa.list_(pa.string())),
+                "targets": pa.array(targets, pa.list_(pa.string()))}
+    return {
+        **refs,
+        "chunk_id": pa.array(np.arange(first_id + start, first_id + start + n), pa.int64()),
+        "object_name": pa.array([object_name.upper()] * n, pa.string()),
+        "schema_name": pa.array([schema_name.upper()] * n, pa.string()),
+        "object_domain": pa.array([object_domain.upper()] * n, pa.string()),
+        "block_id": pa.array([str(c.get("block_id", start + i + 1)) for i, c in enumerate(chunks)], pa.string()),
+        "block_type": pa.array([c.get("block_type", "").upper() for c in chunks], pa.string()),
+        "start_block": pa.array([int(c.get("start_block", 0)) for c in chunks], pa.int32()),
+        "end_block": pa.array([int(c.get("end_block", 0)) for c in chunks], pa.int32()),
+        "content_hash": pa.array([content_hash(t) for t in texts], pa.string()),
+        "text": pa.array(texts, pa.string()),
+    }
+
+
+def record_batches(chunks, vectors, object_name="", schema_name="", object_domain="PROCEDURE",
+                   storage=EMBED_STORAGE, scale=None, batch_rows=WRITE_BATCH_ROWS, table_refs=True, first_id=0):
+    """
+    Stream chunks as Arrow record batches of at most `batch_rows` rows.
+
+    `vectors` is either the embedding matrix, whose row slices are wrapped
+    as FixedSizeList arrays without copying, or a callable such as
+    embed_texts that is called per batch, so only one batch of vectors
+    exists at a time. Returns (schema, batch iterator); for a new int8
+    table the quantization scale comes from the whole matrix, or from the
+    first batch when embedding batch by batch. `table_refs` adds the
+    REF_COLUMNS; chunk ids are numbered from `first_id`.
+    """
+    encode = vectors if callable(vectors) else None
+
+    def columns(i):
+        part = chunks[i:i + batch_rows]
+        if encode:
+            vecs = encode([c if isinstance(c, str) else c["text"] for c in part])
+        else:
+            vecs = vectors[i:i + batch_rows]
+        return _metadata_columns(part, i, object_name, schema_name, object_domain, table_refs, first_id), vecs
+
+    first = columns(0) if chunks else None
+    if storage == "int8" and scale is None and first is not None:
+        scale = int8_scale(np.asarray(first[1] if encode else vectors, dtype=np.float32))
+    schema = chunk_schema(storage, scale, table_refs)
+
+    def batches():
+        for i in range(0, len(chunks), batch_rows):
+            meta, vecs = first if i == 0 else columns(i)
+            embedded, _ = embedding_columns(vecs, storage, scale)
+            yield pa.RecordBatch.from_arrays([{**meta, **embedded}[name] for name in schema.names], schema=schema)
+
+    return schema, batches()
+
+
+@traced("lancedb.store")
+def store_embeddings_lancedb(db_path, table_name, chunks, vectors,
+                             object_name="", schema_name="", object_domain="PROCEDURE",
+                             storage=EMBED_STORAGE, batch_rows=WRITE_BATCH_ROWS):
+    """
+    Write chunks and their embeddings in bounded record batches. `vectors`
+    may be the embedding matrix or an embed function (see record_batches).
+    """
     import lancedb
 
     db = lancedb.connect(db_path)
-
-    # Build valid row-wise data for LanceDB
-    data = []
-    for i, (text, embedding) in enumerate(zip(chunks, vectors)):
-        data.append({
-            "chunk_id": i,
-            "text": text,
-            "embedding": embedding
-        })
+    chunks = list(chunks)
+    if not callable(vectors) and len(vectors) != len(chunks):
+        raise ValueError(f"{len(chunks)} chunks but {len(vectors)} vectors")
 
     if table_name in db.table_names():
-        print("🟡 Table exists — appending...")
         tbl = db.open_table(table_name)
-        tbl.add(data)
+        if "object_name" not in tbl.schema.names:
+            raise ValueError(
+                f"Table '{table_name}' uses the old chunk_id/text/embedding layout. "
+                "Drop it and re-run ingestion to rebuild it with metadata columns."
+            )
+        existing = detect_storage(tbl.schema)
+        if existing != storage:
+            raise ValueError(f"Table '{table_name}' stores {existing} embeddings, not {storage}.")
+        print("🟡 Table exists — appending...")
+        table_refs = all(c in tbl.schema.names for c in REF_COLUMNS)
+        if not table_refs:
+            print("⚠️  Table has no tables/targets columns; re-ingest into a new table for exact table lookups.")
+        first_id = next_chunk_id(tbl)
+        schema, batches = record_batches(chunks, vectors, object_name, schema_name, object_domain,
+                                         storage, read_int8_scale(tbl.schema), batch_rows, table_refs, first_id)
+        if chunks:
+            tbl.add(pa.RecordBatchReader.from_batches(schema, batches))
+        if object_name:
+            # Re-ingesting an object replaces its previous blocks, only once the new
+            # ones are committed: a failed embed or add leaves the old blocks in place
+            tbl.delete(f"object_name = '{_sql_quote(object_name.upper())}' AND chunk_id < {first_id}")
+        if chunks:
+            # Appended rows are scanned, not indexed, until the indexes are updated;
+            # optimize also compacts the small fragments each append leaves
+            print("🗂️  Adding appended rows to the indexes...")
+            tbl.optimize()
     else:
-        print("🟢 Creating new table...")
-        db.create_table(table_name, data)
+        print(f"🟢 Creating new table ({storage} embeddings)...")
+        schema, batches = record_batches(chunks, vectors, object_name, schema_name, object_domain,
+                                         storage, None, batch_rows)
+        tbl = db.create_table(table_name, pa.RecordBatchReader.from_batches(schema, batches))
 
+    ensure_scalar_indexes(tbl)
     print("✅ Stored successfully in LanceDB")
@@ -0,0 +1,294 @@
+import json
+import math
+import os
+
+# Graphs up to this many nodes open fully expanded; larger ones open with each
+# schema / domain collapsed into one super-node (except the selected object's)
+GRAPH_EXPAND_ALL_MAX = int(os.getenv("GRAPH_EXPAND_ALL_MAX", 150))
+
+# Schema / domain groups bigger than this are split, so expanding one
+# super-node never puts more than this many nodes in the browser
+CLUSTER_MAX_NODES = int(os.getenv("GRAPH_CLUSTER_MAX_NODES", 400))
+
+# Clusters up to this many nodes get a force-directed layout of their own;
+# bigger ones a sunflower spiral ordered by degree, so hubs sit in the middle
+SPRING_MAX_NODES = 300
+
+# Pixels per node; a cluster's radius grows with the square root of its size
+NODE_SPACING = 45
+
+# Characters of each DDL snippet shown in a node's tooltip
+TITLE_CHARS = 600
+
+# Domain of nodes that are only referenced, i.e. not in DDL_METADATA
+REFERENCED = "REFERENCED"
+
+DOMAIN_COLORS = {"PROCEDURE": "#9467bd", "VIEW": "#2ca02c", "TABLE": "#1f77b4", REFERENCED: "#7f7f7f"}
+
+
+def node_schema(name, default_schema=""):
+    """SCHEMA of DB.SCHEMA.NAME or SCHEMA.NAME; unqualified names are in `default_schema`."""
+    parts = name.replace('"', "").split(".")
+    if len(parts) >= 3:
+        return parts[-2].upper()
+    if len(parts) == 2:
+        return parts[0].upper()
+    return (default_schema or "").upper() or "DEFAULT"
+
+
+def _bfs_order(graph, nodes):
+    """`nodes` in breadth-first order over their undirected subgraph, hubs first, so neighbours stay close."""
+    sub = graph.subgraph(nodes).to_undirected(as_view=True)
+    order, seen = [], set()
+    for start in sorted(nodes, key=lambda n: (-sub.degree(n), n)):
+        if start in seen:
+            continue
+        seen.add(start)
+        queue = [start]
+        for node in queue:
+            order.append(node)
+            for nxt in sorted(sub.neighbors(node)):
+                if nxt not in seen:
+                    seen.add(nxt)
+                    queue.append(nxt)
+    return order
+
+
+def cluster_nodes(lineage, default_schema="", max_size=CLUSTER_MAX_NODES):
+    """
+    Group the nodes of a LineageGraph by schema and domain. Groups over
+    `max_size` are cut into parts of connected neighbours. Returns
+    ({node: cluster}, {cluster: {"schema", "domain", "part"}}).
+    """
+    groups = {}
+    for node in lineage.graph.nodes:
+        obj = lineage.objects.get(node)
+        # Same default as LineageGraph.objects_by_domain
+        domain = (obj.get("domain") or "TABLE") if obj else REFERENCED
+        groups.setdefault((node_schema(node, default_schema), domain), []).append(node)
+
+    cluster_of, info = {}, {}
+    for (schema, domain), nodes in sorted(groups.items()):
+        if len(nodes) > max_size:
+            nodes = _bfs_order(lineage.graph, nodes)
+        parts = [nodes[i:i + max_size] for i in range(0, len(nodes), max_size)]
+        for k, part in enumerate(parts, 1):
+            cluster = f"{schema}/{domain}" if len(parts) == 1 else f"{schema}/{domain}/{k}"
+            info[cluster] = {"schema": schema, "domain": domain, "part": k if len(parts) > 1 else None}
+            for node in part:
+                cluster_of[node] = cluster
+    return cluster_of, info
+
+
+def _spring(graph, nodes, seed, weight=None):
+    """Force-directed positions in [-1, 1]."""
+    import networkx as nx
+
+    if len(nodes) == 1:
+        return {nodes[0]: (0.0, 0.0)}
+    pos = nx.spring_layout(graph.subgraph(nodes).to_undirected(as_view=True), weight=weight, seed=seed)
+    return {node: (float(x), float(y)) for node, (x, y) in pos.items()}
+
+
+def _sunflower(nodes):
+    """Evenly spread positions in the unit disc, first node in the middle; O(n)."""
+    golden = math.pi * (3 - math.sqrt(5))
+    positions = {}
+    for i, node in enumerate(nodes):
+        r = math.sqrt((i + 0.5) / len(nodes))
+        positions[node] = (r * math.cos(i * golden), r * math.sin(i * golden))
+    return positions
+
+
+def _cluster_centers(radius, weights, seed):
+    """Spring layout of the cluster graph, spread out until no two cluster discs overlap."""
+    import networkx as nx
+    import numpy as np
+
+    names = sorted(radius)
+    if len(names) == 1:
+        return {names[0]: (0.0, 0.0)}
+    graph = nx.Graph()
+    graph.add_nodes_from(names)
+    for (a, b), n in weights.items():
+        w = graph.get_edge_data(a, b, {}).get("weight", 0)
+        graph.add_edge(a, b, weight=w + n)
+    pos = _spring(graph, names, seed, weight="weight") if len(names) <= SPRING_MAX_NODES else _sunflower(names)
+
+    xy = np.array([pos[n] for n in names])
+    r = np.array([radius[n] for n in names])
+    dist = np.linalg.norm(xy[:, None, :] - xy[None, :, :], axis=2)
+    need = (r[:, None] + r[None, :] + 2 * NODE_SPACING) / np.maximum(dist, 1e-6)
+    np.fill_diagonal(need, 0)
+    scale = float(need.max())
+    return {n: (float(x) * scale, float(y) * scale) for n, (x, y) in zip(names, xy)}
+
+
+def compute_layout(lineage, default_schema="", seed=0):
+    """
+    Fixed positions for every node of a LineageGraph, computed once so the
+    browser doesn't run physics. Nodes are grouped as in cluster_nodes;
+    each group gets a disc (a spring layout, or a spiral for big groups)
+    and the discs are placed by a spring layout of the group graph.
+    """
+    graph = lineage.graph
+    clusters, info = cluster_nodes(lineage, default_schema)
+    members = {}
+    for node, cluster in clusters.items():
+        members.setdefault(cluster, []).append(node)
+    for nodes in members.values():
+        nodes.sort(key=lambda n: (-graph.degree(n), n))
+    radius = {c: NODE_SPACING * math.sqrt(len(nodes)) for c, nodes in members.items()}
+
+    weights = {}
+    for a, b in graph.edges:
+        ca, cb = clusters[a], clusters[b]
+        if ca != cb:
+            weights[(ca, cb)] = weights.get((ca, cb), 0) + 1
+
+    centers = _cluster_centers(radius, weights, seed) if members else {}
+    positions = {}
+    for cluster, nodes in members.items():
+        local = _spring(graph, nodes, seed) if len(nodes) <= SPRING_MAX_NODES else _sunflower(nodes)
+        (cx, cy), r = centers[cluster], radius[cluster]
+        for node, (x, y) in local.items():
+            positions[node] = (round(cx + x * r), round(cy + y * r))
+
+    return {
+        "fingerprint": lineage.fingerprint(),
+        "cluster_of": clusters,
+        "clusters": {c: {**info[c], "x": round(centers[c][0]), "y": round(centers[c][1]), "size": len(nodes)}
+                     for c, nodes in members.items()},
+        "positions": positions,
+        "cluster_edges": weights,
+    }
+
+
+def initial_expanded(layout, selected=None, expand_all_max=GRAPH_EXPAND_ALL_MAX):
+    """Clusters shown expanded on first render: all of them for small graphs, else the selected object's."""
+    if len(layout["positions"]) <= expand_all_max:
+        return set(layout["clusters"])
+    cluster = layout["cluster_of"].get(selected)
+    return {cluster} if cluster else set()
+
+
+def _node_record(node, layout, sql_ids, selected):
+    x, y = layout["positions"][node]
+    domain = layout["clusters"][layout["cluster_of"][node]]["domain"]
+    record = {"id": node, "label": node, "x": x, "y": y, "color": DOMAIN_COLORS.get(domain, DOMAIN_COLORS[REFERENCED])}
+    if sql_ids:
+        record["sql"] = sql_ids
+    if node == selected:
+        record.update(color="orange", size=25)
+    return record
+
+
+def _cluster_record(cluster, info):
+    domain = info["domain"]
+    part = f" #{info['part']}" if info["part"] else ""
+    return {"id": cluster, "label": f"{info['schema']}\n{domain}{part} ({info['size']})", "x": info["x"], "y": info["y"],
+            "shape": "dot", "size": 12 + 6 * math.log2(1 + info["size"]),
+            "color": DOMAIN_COLORS.get(domain, DOMAIN_COLORS[REFERENCED]),
+            "title": f"{info['size']} objects - click to expand", "font": {"multi": True}}
+
+
+# Keeps the vis DataSets to what is visible: expanded clusters as their
+# members, the rest as one super-node, edges aggregated between them.
+# Click a super-node to expand it, double-click an object to collapse its cluster.
+_CLUSTER_JS = """
+<script type="text/javascript">
+(function () {
+  var data = %s;
+  var expanded = new Set(data.expanded);
+  var clusterOf = {};
+  Object.keys(data.members).forEach(function (c) {
+    data.members[c].forEach(function (node) {
+      clusterOf[node.id] = c;
+      node.title = (node.sql || []).map(function (i) { return data.snippets[i]; }).join("\\n\\n");
+      delete node.sql;
+    });
+  });
+  function visibleId(node) {
+    return expanded.has(clusterOf[node]) ? node : clusterOf[node];
+  }
+  function render() {
+    var shown = [];
+    Object.keys(data.clusters).forEach(function (c) {
+      if (expanded.has(c)) { shown.push.apply(shown, data.members[c]); } else { shown.push(data.clusters[c]); }
+    });
+    var merged = {};
+    data.edges.forEach(function (e) {
+      var from = data.names[e[0]], to = data.names[e[1]];
+      var a = visibleId(from), b = visibleId(to);
+      if (a === b && a !== from) { return; }
+      var key = a + "\\u0000" + b;
+      var edge = merged[key] || (merged[key] = {id: key, from: a, to: b, arrows: "to", n: 0});
+      edge.n += 1;
+      if (from === data.selected || to === data.selected) { edge.color = "red"; edge.width = 3; }
+    });
+    var shownEdges = Object.keys(merged).map(function (key) {
+      var edge = merged[key];
+      if (edge.n > 1) { edge.title = edge.n + " references"; edge.width = edge.width || Math.min(1 + Math.log2(edge.n), 8); }
+      return edge;
+    });
+    nodes.clear();
+    edges.clear();
+    nodes.add(shown);
+    edges.add(shownEdges);
+  }
+  network.on("click", function (params) {
+    var id = params.nodes.length === 1 ? params.nodes[0] : null;
+    if (id !== null && data.clusters[id] && !expanded.has(id)) { expanded.add(id); render(); }
+  });
+  network.on("doubleClick", function (params) {
+    var c = params.nodes.length === 1 ? clusterOf[params.nodes[0]] : null;
+    if (c && expanded.has(c)) { expanded.delete(c); render(); }
+  });
+  render();
+})();
+</script>
+"""
+
+
+def network_html(lineage, layout, selected=None, expanded=None, physics=False, height="650px"):
+    """
+    pyvis page for the graph at its precomputed positions, physics off by
+    default. Only expanded clusters' members and the other clusters'
+    super-nodes are put in the browser's DataSets.
+    """
+    from pyvis.network import Network
+
+    if expanded is None:
+        expanded = initial_expanded(layout, selected)
+    # Each DDL is shipped once and referenced by index from every node it mentions
+    snippets, snippet_ids = [], {}
+    members = {}
+    for node in layout["positions"]:
+        sql_ids = []
+        for ddl in lineage.node_sql_map.get(node, [])[:3]:
+            if ddl not in snippet_ids:
+                snippet_ids[ddl] = len(snippets)
+                snippets.append(ddl if len(ddl) <= TITLE_CHARS else ddl[:TITLE_CHARS] + " ...")
+            sql_ids.append(snippet_ids[ddl])
+        members.setdefault(layout["cluster_of"][node], []).append(_node_record(node, layout, sql_ids, selected))
+    names = list(layout["positions"])
+    index = {node: i for i, node in enumerate(names)}
+    data = {
+        "clusters": {c: _cluster_record(c, info) for c, info in layout["clusters"].items()},
+        "members": members,
+        "snippets": snippets,
+        "names": names,
+        "edges": [[index[a], index[b]] for a, b in lineage.graph.edges],
+        "expanded": sorted(expanded),
+        "selected": selected,
+    }
+
+    # Nodes and edges are added by _CLUSTER_JS, so pyvis only provides the page
+    net = Network(height=height, width="100%", directed=True)
+    net.toggle_physics(physics)
+    net.options.edges.smooth.enabled = False
+    if physics:
+        net.show_buttons(filter_=["physics"])
+    html = net.generate_html()
+    script = _CLUSTER_JS % json.dumps(data, separators=(",", ":")).replace("</", "<\\/")
+    return html.replace("</body>", script + "</body>", 1)
@@ -0,0 +1,127 @@
+import re
+from collections import deque
+
+import numpy as np
+
+# Hops around the mentioned objects, in both directions
+DEFAULT_HOPS = 2
+
+_NAME_TOKEN = re.compile(r'[A-Za-z_"][A-Za-z0-9_$."]*')
+
+
+def _short_name(name):
+    return name.replace('"', "").rstrip(".").rsplit(".", 1)[-1].upper()
+
+
+def build_catalog(names):
+    """{NAME or SHORT_NAME: {full names}} so DB.SCHEMA.T, SCHEMA.T and T all resolve."""
+    catalog = {}
+    for name in names:
+        catalog.setdefault(name.replace('"', "").upper(), set()).add(name)
+        catalog.setdefault(_short_name(name), set()).add(name)
+    return catalog
+
+
+def resolve_mentions(question, catalog):
+    """Catalog objects named in the question, exact qualified names first, else by short name."""
+    found = set()
+    for token in _NAME_TOKEN.findall(question or ""):
+        key = token.replace('"', "").rstrip(".").upper()
+        if key in catalog:
+            found |= catalog[key]
+        elif _short_name(key) in catalog:
+            found |= catalog[_short_name(key)]
+    return sorted(found)
+
+
+def k_hop_neighborhood(graph, seeds, hops=DEFAULT_HOPS):
+    """{node: distance} for nodes within `hops` edges of any seed, upstream or downstream."""
+    distance = {s: 0 for s in seeds if s in graph}
+    queue = deque(distance)
+    while queue:
+        node = queue.popleft()
+        if distance[node] >= hops:
+            continue
+        for nxt in list(graph.successors(node)) + list(graph.predecessors(node)):
+            if nxt not in distance:
+                distance[nxt] = distance[node] + 1
+                queue.append(nxt)
+    return distance
+
+
+def context_lines(objects, crud_matrix):
+    """(node, text) pairs: one per object DDL and one per CRUD summary."""
+    lines = []
+    for obj_type in ["PROCEDURE", "VIEW", "TABLE"]:
+        for obj in objects.get(obj_type, []):
+            lines.append((obj["name"], f"{obj_type} {obj['name']} DDL:\n{obj['ddl']}\n"))
+    for obj_name, ops in crud_matrix.items():
+        lines.append((obj_name, f"Object {obj_name} CRUD:\n{ops}\n"))
+    return lines
+
+
+class NodeIndex:
+    """
+    Embeddings of every context line, computed once per loaded schema and
+    grouped by graph node, so a search can be limited to a set of nodes.
+    """
+
+    def __init__(self, nodes, texts, vectors):
+        self.nodes = nodes
+        self.texts = texts
+        self.vectors = np.asarray(vectors, dtype=np.float32)
+        self.rows = {}
+        for i, node in enumerate(nodes):
+            self.rows.setdefault(node, []).append(i)
+        self.catalog = build_catalog(self.rows)
+
+    @classmethod
+    def build(cls, objects, crud_matrix, encode):
+        """`encode(texts)` returns one vector per text, e.g. SentenceTransformer.encode."""
+        lines = context_lines(objects, crud_matrix)
+        texts = [text for _, text in lines]
+        vectors = encode(texts) if texts else np.zeros((0, 0), dtype=np.float32)
+        return cls([node for node, _ in lines], texts, vectors)
+
+    def rows_for(self, nodes):
+        return np.array(sorted(i for n in nodes for i in self.rows.get(n, [])), dtype=np.int64)
+
+    def search(self, query_vec, rows=None, top_k=5):
+        """[(row, score)] by dot product, over `rows` only when given."""
+        if rows is None:
+            rows = np.arange(len(self.texts))
+        if len(rows) == 0:
+            return []
+        scores = self.vectors[rows] @ np.asarray(query_vec, dtype=np.float32)
+        k = min(top_k, len(rows))
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best])]
+        return [(int(rows[i]), float(scores[i])) for i in best]
+
+
+def retrieve(question, query_vec, index, graph, hops=DEFAULT_HOPS, top_k=5):
+    """
+    Resolve objects named in the question, then vector-search only the
+    context lines of their k-hop lineage neighborhood. Falls back to the
+    whole schema when nothing in the question matches the catalog.
+    """
+    seeds = resolve_mentions(question, index.catalog)
+    if seeds:
+        distance = k_hop_neighborhood(graph, seeds, hops) if graph is not None else {}
+        for s in seeds:
+            distance.setdefault(s, 0)
+        rows = index.rows_for(distance)
+        mode = "neighborhood"
+    else:
+        distance, rows, mode = {}, None, "full"
+    hits = index.search(query_vec, rows, top_k)
+    return {
+        "mode": mode,
+        "seeds": seeds,
+        "candidates": len(index.texts) if rows is None else len(rows),
+        "total": len(index.texts),
+        "hits": [
+            {"node": index.nodes[i], "text": index.texts[i], "score": score, "hops": distance.get(index.nodes[i])}
+            for i, score in hits
+        ],
+    }
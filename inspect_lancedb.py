@@ -1,11 +1,25 @@
-import lancedb
+import argparse
+import os
+from datetime import timedelta
 
 DB_PATH = "lancedb_db"
 
-def main():
-    print("📁 Connecting to LanceDB…")
-    db = lancedb.connect(DB_PATH)
+# Never delete versions younger than this, so readers that opened the table
+# just before a scheduled run keep a consistent snapshot.
+MIN_VERSION_AGE = timedelta(hours=1)
+
+# IndexConfig.index_type -> create_scalar_index / create_index type name
+SCALAR_INDEX_TYPES = {"BTree": "BTREE", "Bitmap": "BITMAP", "LabelList": "LABEL_LIST"}
+VECTOR_INDEX_TYPES = {
+    "IvfFlat": "IVF_FLAT",
+    "IvfPq": "IVF_PQ",
+    "IvfRq": "IVF_RQ",
+    "IvfHnswSq": "IVF_HNSW_SQ",
+    "IvfHnswPq": "IVF_HNSW_PQ",
+}
 
+
+def select_table(db, table_name=None):
     tables = db.table_names()
     print("\n📋 Tables inside the database:")
     for name in tables:
@@ -13,7 +27,13 @@ def main():
 
     if not tables:
         print("\n❌ No tables found in the database.")
-        return
+        return None
+
+    if table_name:
+        if table_name not in tables:
+            print("❌ Table not found!")
+            return None
+        return table_name
 
     # If only one table exists, auto-select it
     if len(tables) == 1:
@@ -23,17 +43,183 @@ def main():
         table_name = input("\nEnter table name to preview rows: ").strip()
         if not table_name:
             print("❌ Please enter a valid table name next time.")
-            return
+            return None
         if table_name not in tables:
             print("❌ Table not found!")
-            return
+            return None
+    return table_name
 
-    table = db.open_table(table_name)
 
+def _dir_size(path):
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            total += os.path.getsize(os.path.join(dirpath, name))
+    return total
+
+
+def _fmt_bytes(n):
+    for unit in ("B", "KB", "MB", "GB"):
+        if n < 1024:
+            return f"{n:.1f} {unit}"
+        n /= 1024
+    return f"{n:.1f} TB"
+
+
+def _dataset(table):
+    # Dataset-level ops commit new versions behind the table handle's back
+    table.checkout_latest()
+    return table.to_lance()
+
+
+# -----------------------------
+# Jobs
+# -----------------------------
+def preview(table, table_name):
     print(f"\n🔍 Previewing first 5 rows from '{table_name}':\n")
-    for row in table.head(5):
-        print(row)
+    for row in table.head(5).to_pylist():
+        print({k: (f"<{len(v)}-d vector>" if k == "embedding" else v) for k, v in row.items()})
         print("---")
 
+
+def report_stats(table, db_path, table_name):
+    table.checkout_latest()
+    stats = table.stats()
+    fragments = stats["fragment_stats"]
+    versions = table.list_versions()
+    on_disk = _dir_size(os.path.join(db_path, f"{table_name}.lance"))
+
+    print(f"\n📊 Stats for '{table_name}' (version {table.version})")
+    print(f"   Rows:            {stats['num_rows']}")
+    print(f"   Fragments:       {fragments['num_fragments']} ({fragments['num_small_fragments']} small)")
+    print(f"   Live data size:  {_fmt_bytes(stats['total_bytes'])}")
+    print(f"   On-disk size:    {_fmt_bytes(on_disk)} (all retained versions)")
+    print(f"   Versions kept:   {len(versions)}")
+
+    indices = list(table.list_indices())
+    if not indices:
+        print("   Indexes:         none")
+    for idx in indices:
+        idx_stats = table.index_stats(idx.name)
+        indexed = idx_stats.num_indexed_rows if idx_stats else 0
+        unindexed = idx_stats.num_unindexed_rows if idx_stats else 0
+        total = indexed + unindexed
+        coverage = 100.0 * indexed / total if total else 100.0
+        print(f"   Index {idx.name:<22} {idx.index_type:<10} {coverage:5.1f}% covered "
+              f"({unindexed} rows unindexed)")
+
+    return {
+        "rows": stats["num_rows"],
+        "fragments": fragments["num_fragments"],
+        "small_fragments": fragments["num_small_fragments"],
+        "live_bytes": stats["total_bytes"],
+        "on_disk_bytes": on_disk,
+        "versions": len(versions),
+    }
+
+
+def compact(table):
+    print("\n🧱 Compacting small fragments...")
+    metrics = _dataset(table).optimize.compact_files()
+    print(f"   Removed {metrics.fragments_removed} fragments, added {metrics.fragments_added}")
+
+
+def optimize_indexes(table):
+    """Fold rows appended since the last build into the existing indexes."""
+    print("\n🗂️  Optimizing indexes (incremental)...")
+    _dataset(table).optimize.optimize_indices()
+
+
+def rebuild_indexes(table):
+    """Retrain every index from scratch over the current data."""
+    for idx in table.list_indices():
+        column = idx.columns[0]
+        if idx.index_type in SCALAR_INDEX_TYPES:
+            print(f"\n🗂️  Rebuilding {idx.index_type} index on '{column}'...")
+            table.create_scalar_index(column, index_type=SCALAR_INDEX_TYPES[idx.index_type],
+                                      replace=True, name=idx.name)
+        elif idx.index_type in VECTOR_INDEX_TYPES:
+            print(f"\n🗂️  Rebuilding {idx.index_type} vector index on '{column}'...")
+            table.create_index(vector_column_name=column, index_type=VECTOR_INDEX_TYPES[idx.index_type],
+                               replace=True, name=idx.name)
+        else:
+            print(f"\n⚠️ Skipping index {idx.name}: unsupported type {idx.index_type}")
+
+
+def prune_versions(table, older_than_days=None, keep_versions=None, min_age=MIN_VERSION_AGE):
+    """
+    Delete files only reachable from old versions, by age and/or by keeping
+    the newest `keep_versions`. The latest version is always kept, and
+    nothing younger than `min_age` is removed.
+    """
+    cutoffs = [min_age]
+    if older_than_days is not None:
+        cutoffs.append(timedelta(days=older_than_days))
+    if keep_versions:
+        versions = table.list_versions()
+        if len(versions) <= keep_versions:
+            print(f"\n🧹 Only {len(versions)} versions, nothing to prune.")
+            return
+    elif older_than_days is None:
+        print("\n🧹 Pass --older-than-days and/or --keep-versions to prune.")
+        return
+
+    # The most conservative cutoff wins. The newest `keep_versions` are kept by
+    # count (retain_versions), not by a cutoff computed from their timestamps:
+    # the clock moves on before cleanup reads it and would drop the Nth newest
+    older_than = max(cutoffs)
+    kept = f", keeping the newest {keep_versions}" if keep_versions else ""
+    print(f"\n🧹 Removing versions older than {older_than}{kept}...")
+    stats = _dataset(table).cleanup_old_versions(older_than=older_than, retain_versions=keep_versions or None)
+    print(f"   Removed {stats.old_versions} versions, freed {_fmt_bytes(stats.bytes_removed)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect and maintain LanceDB vector tables.")
+    parser.add_argument("job", nargs="?", default="preview",
+                        choices=["preview", "stats", "compact", "prune", "optimize-indexes",
+                                 "rebuild-indexes", "maintain"],
+                        help="'maintain' = compact + optimize-indexes + prune + stats, for scheduled runs")
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--table", default=None)
+    parser.add_argument("--older-than-days", type=float, default=None, help="prune: drop versions older than this")
+    parser.add_argument("--keep-versions", type=int, default=None, help="prune: keep only the newest N versions")
+    parser.add_argument("--min-age-minutes", type=float, default=MIN_VERSION_AGE.total_seconds() / 60,
+                        help="prune: never drop versions younger than this (protects active readers)")
+    args = parser.parse_args()
+
+    import lancedb
+
+    print("📁 Connecting to LanceDB…")
+    db = lancedb.connect(args.db)
+    table_name = select_table(db, args.table)
+    if not table_name:
+        return
+    table = db.open_table(table_name)
+    min_age = timedelta(minutes=args.min_age_minutes)
+
+    if args.job == "preview":
+        preview(table, table_name)
+    elif args.job == "stats":
+        report_stats(table, args.db, table_name)
+    elif args.job == "compact":
+        compact(table)
+    elif args.job == "prune":
+        prune_versions(table, args.older_than_days, args.keep_versions, min_age)
+    elif args.job == "optimize-indexes":
+        optimize_indexes(table)
+    elif args.job == "rebuild-indexes":
+        rebuild_indexes(table)
+    elif args.job == "maintain":
+        before = report_stats(table, args.db, table_name)
+        compact(table)
+        optimize_indexes(table)
+        older_than_days = args.older_than_days if args.older_than_days is not None else 7
+        prune_versions(table, older_than_days, args.keep_versions, min_age)
+        after = report_stats(table, args.db, table_name)
+        print(f"\n✅ Fragments {before['fragments']} → {after['fragments']}, "
+              f"on-disk {_fmt_bytes(before['on_disk_bytes'])} → {_fmt_bytes(after['on_disk_bytes'])}")
+
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,387 @@
+import hashlib
+import os
+import re
+from datetime import datetime, timedelta
+
+DOMAINS = ("PROCEDURE", "VIEW", "TABLE")
+
+# Names per IN (...) list when fetching changed DDL
+FETCH_BATCH_SIZE = 1000
+
+# -----------------------------
+# Fetch objects from DB
+# -----------------------------
+def fetch_objects(agent, database, schema, obj_type):
+    if not agent or not agent.conn:
+        return []
+    query = f"""
+        SELECT OBJECT_NAME, DDL_TEXT
+        FROM "{database}"."{schema}"."DDL_METADATA"
+        WHERE OBJECT_DOMAIN = '{obj_type}'
+    """
+    cur = agent.conn.cursor()
+    cur.execute(query)
+    rows = cur.fetchall()
+    cur.close()
+    return [{"name": r[0].upper(), "ddl": r[1], "domain": obj_type} for r in rows]
+
+def fetch_object_hashes(agent, database, schema, domains=DOMAINS):
+    """
+    {name: (domain, sha1 of DDL_TEXT)} for every object, hashed in Snowflake
+    so change detection moves a few bytes per object instead of the DDL.
+    """
+    if not agent or not agent.conn:
+        return {}
+    in_list = ", ".join(f"'{d}'" for d in domains)
+    query = f"""
+        SELECT OBJECT_NAME, OBJECT_DOMAIN, SHA1(DDL_TEXT)
+        FROM "{database}"."{schema}"."DDL_METADATA"
+        WHERE OBJECT_DOMAIN IN ({in_list})
+    """
+    cur = agent.conn.cursor()
+    cur.execute(query)
+    rows = cur.fetchall()
+    cur.close()
+    return {r[0].upper(): (r[1], r[2]) for r in rows}
+
+def fetch_objects_by_name(agent, database, schema, names):
+    """DDL for just the named objects, in batches of FETCH_BATCH_SIZE."""
+    if not agent or not agent.conn or not names:
+        return []
+    names = sorted(names)
+    objects = []
+    cur = agent.conn.cursor()
+    for i in range(0, len(names), FETCH_BATCH_SIZE):
+        batch = ", ".join("'" + n.replace("'", "''") + "'" for n in names[i:i + FETCH_BATCH_SIZE])
+        cur.execute(f"""
+            SELECT OBJECT_NAME, DDL_TEXT, OBJECT_DOMAIN
+            FROM "{database}"."{schema}"."DDL_METADATA"
+            WHERE UPPER(OBJECT_NAME) IN ({batch})
+        """)
+        objects.extend({"name": r[0].upper(), "ddl": r[1], "domain": r[2]} for r in cur.fetchall())
+    cur.close()
+    return objects
+
+def ddl_hash(ddl_text):
+    """Same digest as Snowflake's SHA1(DDL_TEXT)."""
+    return hashlib.sha1((ddl_text or "").encode("utf-8")).hexdigest()
+
+def extract_objects_from_ddl(ddl_text):
+    if not ddl_text:
+        return []
+    ddl_text = re.sub(r"--.*", "", ddl_text)
+    ddl_text = re.sub(r"\s+", " ", ddl_text)
+    return [t.upper() for t in re.findall(r"(?:FROM|JOIN|INSERT INTO|UPDATE|DELETE FROM)\s+([^\s(]+)", ddl_text, re.IGNORECASE)]
+
+# -----------------------------
+# Build object-level graph
+# -----------------------------
+def build_graph(objects_list):
+    lineage = LineageGraph()
+    lineage.apply(objects_list)
+    return lineage.graph, lineage.node_sql_map
+
+class LineageGraph:
+    """
+    Object-level lineage graph that can be updated in place.
+
+    Keeps, per object, its DDL hash and extracted references, so a changed,
+    added or dropped object only touches its own edges and node_sql_map
+    entries. `graph` and `node_sql_map` are the same shapes build_graph
+    returns and stay the same objects across updates; `version` counts the
+    updates and fingerprint() identifies the content, so anything derived
+    from the graph can be cached per fingerprint.
+    """
+
+    def __init__(self):
+        import networkx as nx
+
+        self.graph = nx.DiGraph()
+        self.node_sql_map = {}
+        # name -> {"name", "ddl", "domain", "hash", "refs"}
+        self.objects = {}
+        self.version = 0
+        self._fingerprint = None  # (version, digest)
+
+    def _remove(self, name):
+        obj = self.objects.pop(name, None)
+        if obj is None:
+            return
+        ddl = obj["ddl"]
+        touched = {name}
+        for ref in obj["refs"]:
+            if self.graph.has_edge(name, ref):
+                self.graph.remove_edge(name, ref)
+            touched.add(ref)
+        for node in touched:
+            # Identity, not equality: another object may have the same DDL text
+            remaining = [d for d in self.node_sql_map.get(node, []) if d is not ddl]
+            if remaining:
+                self.node_sql_map[node] = remaining
+            else:
+                self.node_sql_map.pop(node, None)
+            if node in self.graph and self.graph.degree(node) == 0:
+                self.graph.remove_node(node)
+
+    def _add(self, obj):
+        name, ddl = obj["name"], obj["ddl"]
+        # Objects read back from lineage_batch output carry their references already
+        refs = obj["refs"] if obj.get("refs") is not None else extract_objects_from_ddl(ddl)
+        self.objects[name] = {**obj, "hash": obj.get("hash") or ddl_hash(ddl), "refs": refs}
+        for ref in refs:
+            self.graph.add_edge(name, ref)
+            self.node_sql_map.setdefault(ref, []).append(ddl)
+            self.node_sql_map.setdefault(name, []).append(ddl)
+
+    def apply(self, upserts=(), dropped=()):
+        """Replace the edges of `upserts` objects and remove `dropped` names."""
+        changed = False
+        for name in dropped:
+            self._remove(name)
+            changed = True
+        for obj in upserts:
+            self._remove(obj["name"])
+            self._add(obj)
+            changed = True
+        if changed:
+            self.version += 1
+
+    def diff(self, hashes):
+        """Compare {name: (domain, hash)} with what the graph was built from."""
+        added = [n for n in hashes if n not in self.objects]
+        changed = [n for n, (_, h) in hashes.items() if n in self.objects and self.objects[n]["hash"] != h]
+        dropped = [n for n in self.objects if n not in hashes]
+        return added, changed, dropped
+
+    def refresh(self, agent, database, schema, domains=DOMAINS):
+        """
+        Pull DDL hashes, re-fetch and re-extract only added or changed
+        objects, and apply the deltas in place.
+        """
+        hashes = fetch_object_hashes(agent, database, schema, domains)
+        added, changed, dropped = self.diff(hashes)
+        upserts = fetch_objects_by_name(agent, database, schema, added + changed)
+        for obj in upserts:
+            obj["hash"] = hashes.get(obj["name"], (None, None))[1]
+        self.apply(upserts, dropped)
+        return {"added": len(added), "changed": len(changed), "dropped": len(dropped),
+                "objects": len(self.objects)}
+
+    def copy(self):
+        """Independent copy, to update a graph that other readers still hold."""
+        other = LineageGraph()
+        other.graph = self.graph.copy()
+        other.node_sql_map = {node: list(ddls) for node, ddls in self.node_sql_map.items()}
+        other.objects = dict(self.objects)
+        other.version = self.version
+        other._fingerprint = self._fingerprint
+        return other
+
+    def fingerprint(self):
+        """
+        Digest of the object names and DDL hashes. Unlike `version`, which
+        restarts with every load, equal fingerprints mean equal graphs, so
+        it can key what is derived from the graph across loads and sessions.
+        """
+        if self._fingerprint is None or self._fingerprint[0] != self.version:
+            digest = hashlib.sha1()
+            for name in sorted(self.objects):
+                digest.update(f"{name}\0{self.objects[name]['hash']}\n".encode())
+            self._fingerprint = (self.version, digest.hexdigest())
+        return self._fingerprint[1]
+
+    def objects_by_domain(self):
+        by_domain = {d: [] for d in DOMAINS}
+        for obj in self.objects.values():
+            by_domain.setdefault(obj.get("domain") or "TABLE", []).append(obj)
+        return by_domain
+
+# -----------------------------
+# Fetch CRUD usage with timestamps
+# -----------------------------
+# regex | parse (sqlglot); each distinct query template is classified once
+CRUD_CLASSIFIER = os.getenv("CRUD_CLASSIFIER", "regex")
+
+# Comments, string literals and numbers in one scan, so quotes inside
+# comments (and comment markers inside strings) are read correctly. Every
+# branch starts with one of [-/'0-9], which lets the regex engine skip
+# plain text quickly; a lone '-' or '/' matches with no suffix.
+_FINGERPRINT_TOKEN = re.compile(r"""
+    [-/'0-9]
+    (?: (?<=-)-[^\n]*
+      | (?<=/)/[^\n]*
+      | (?<=/)\*.*?(?:\*/|\Z)
+      | (?<=')(?:[^'\\]+|\\.|'')*(?:'|\Z)
+      | (?<=\d)\d*(?:\.\d+)?(?:[eE][+-]?\d+)?
+    )?""", re.S | re.X)
+_PLACEHOLDER_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+
+
+def _normalize_token(m):
+    token = m.group()
+    first = token[0]
+    if first == "'":
+        return "?"
+    if first in "-/":
+        return token if len(token) == 1 else " "
+    # Digits inside an identifier (TBL_01, T171T) are part of the name
+    start = m.start()
+    if start and (m.string[start - 1].isalnum() or m.string[start - 1] in "_$."):
+        return token
+    return "?"
+
+
+def query_template(query_text):
+    """
+    QUERY_TEXT with comments dropped, literals replaced by ?, IN lists
+    collapsed and whitespace squeezed, upper-cased: runs of the same
+    scheduled statement with different literals share one template.
+    """
+    template = " ".join(_FINGERPRINT_TOKEN.sub(_normalize_token, query_text or "").split())
+    return _PLACEHOLDER_LIST.sub("(?)", template).upper()
+
+
+def template_hash(template):
+    return hashlib.sha1(template.encode("utf-8")).hexdigest()[:16]
+
+
+def fingerprint_rows(rows):
+    """
+    Group (QUERY_TEXT, START_TIME[, TOTAL_ELAPSED_TIME ms]) rows by template.
+    Returns {hash: {"template", "count", "timestamps", "elapsed_ms"}}.
+    """
+    templates = {}
+    by_text = {}
+    for query_text, ts, *rest in rows:
+        key = by_text.get(query_text)
+        if key is None:
+            template = query_template(query_text)
+            key = by_text[query_text] = template_hash(template)
+            if key not in templates:
+                templates[key] = {"template": template, "count": 0, "timestamps": [], "elapsed_ms": 0.0}
+        entry = templates[key]
+        entry["count"] += 1
+        entry["timestamps"].append(ts)
+        if rest and rest[0] is not None:
+            entry["elapsed_ms"] += float(rest[0])
+    return templates
+
+
+def classify_regex(template):
+    """{table: set of C/U/D/R} with the original CRUD regexes."""
+    ops = {}
+    for t in re.findall(r"INSERT INTO\s+([^\s(]+)", template): ops.setdefault(t, []).append("C")
+    for t in re.findall(r"UPDATE\s+([^\s,]+)", template): ops.setdefault(t, []).append("U")
+    for t in re.findall(r"DELETE FROM\s+([^\s,]+)", template): ops.setdefault(t, []).append("D")
+    for t in re.findall(r"FROM\s+([^\s,;]+)", template) + re.findall(r"JOIN\s+([^\s,;]+)", template):
+        ops.setdefault(t, []).append("R")
+    return ops
+
+
+def classify_parsed(template):
+    """
+    Same shape as classify_regex from a sqlglot parse: the target of
+    INSERT/UPDATE/DELETE/MERGE gets C/U/D/U, every other table R.
+    Falls back to the regexes when the template does not parse.
+    """
+    import sqlglot
+    from sqlglot import exp
+    from sqlglot.errors import ParseError, TokenError
+
+    try:
+        statements = [s for s in sqlglot.parse(template, read="snowflake") if s is not None]
+    except (ParseError, TokenError):
+        return classify_regex(template)
+
+    def name(table):
+        return ".".join(p.name for p in table.parts).upper()
+
+    write_op = {exp.Insert: "C", exp.Update: "U", exp.Delete: "D", exp.Merge: "U"}
+    ops = {}
+    for statement in statements:
+        target = None
+        op = write_op.get(type(statement))
+        if op:
+            target = statement.this.this if isinstance(statement.this, exp.Schema) else statement.this
+            if isinstance(target, exp.Table):
+                ops.setdefault(name(target), []).append(op)
+        for table in statement.find_all(exp.Table):
+            if table is not target:
+                ops.setdefault(name(table), []).append("R")
+    return ops
+
+
+def classify_templates(templates, classifier=CRUD_CLASSIFIER):
+    """Classify each distinct template once; cost scales with templates, not rows."""
+    classify = classify_parsed if classifier == "parse" else classify_regex
+    for entry in templates.values():
+        if "ops" not in entry:
+            entry["ops"] = classify(entry["template"])
+    return templates
+
+
+def fetch_query_templates(agent, database, schema, lookback_days=30, classifier=CRUD_CLASSIFIER):
+    if not agent or not agent.conn:
+        return {}
+    start_time = datetime.utcnow() - timedelta(days=lookback_days)
+    query = f"""
+        SELECT QUERY_TEXT, START_TIME, TOTAL_ELAPSED_TIME
+        FROM SNOWFLAKE.ACCOUNT_USAGE.QUERY_HISTORY
+        WHERE DATABASE_NAME = '{database}'
+          AND SCHEMA_NAME = '{schema}'
+          AND START_TIME >= '{start_time.strftime('%Y-%m-%d %H:%M:%S')}'
+        ORDER BY START_TIME DESC
+    """
+    cur = agent.conn.cursor()
+    cur.execute(query)
+    rows = cur.fetchall()
+    cur.close()
+    return classify_templates(fingerprint_rows(rows), classifier)
+
+def fetch_crud_usage(agent, database, schema, lookback_days=30):
+    return crud_from_templates(fetch_query_templates(agent, database, schema, lookback_days))
+
+def crud_from_templates(templates):
+    """Multiply each template's classification across its occurrences."""
+    crud_matrix = {}
+    for entry in templates.values():
+        for table, ops in entry["ops"].items():
+            for op in ops:
+                crud_matrix.setdefault(table, {}).setdefault(op, []).extend(entry["timestamps"])
+
+    result = {}
+    for obj, ops in crud_matrix.items():
+        result[obj] = {
+            "Object": obj,
+            "C": len(ops.get("C", [])),
+            "U": len(ops.get("U", [])),
+            "D": len(ops.get("D", [])),
+            "R": len(ops.get("R", [])),
+            "Execution Timestamps": {k: ops[k] for k in ops},
+            "Total CRUD": sum(len(v) for v in ops.values())
+        }
+    return result
+
+def aggregate_crud(rows, classifier=CRUD_CLASSIFIER):
+    """Count C/U/D/R operations per object from (QUERY_TEXT, START_TIME) rows."""
+    return crud_from_templates(classify_templates(fingerprint_rows(rows), classifier))
+
+def template_summary(templates, top=20):
+    """Most frequent and most expensive templates, for display."""
+    rows = [
+        {
+            "Template": entry["template"][:300],
+            "Runs": entry["count"],
+            "Total Elapsed (s)": round(entry["elapsed_ms"] / 1000, 1),
+            "Avg Elapsed (ms)": round(entry["elapsed_ms"] / entry["count"], 1),
+            "Objects": ", ".join(sorted(entry.get("ops", {}))),
+            "Hash": key,
+        }
+        for key, entry in templates.items()
+    ]
+    return {
+        "frequent": sorted(rows, key=lambda r: r["Runs"], reverse=True)[:top],
+        "expensive": sorted(rows, key=lambda r: r["Total Elapsed (s)"], reverse=True)[:top],
+        "templates": len(rows),
+        "queries": sum(r["Runs"] for r in rows),
+    }
@@ -0,0 +1,362 @@
+import argparse
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from urllib.parse import quote
+
+from lineage import DOMAINS, LineageGraph, fetch_objects, fetch_query_templates, template_summary
+from utils.tracing import span
+
+# Nightly precompute of lineage and CRUD for many schemas:
+#   <out>/catalog/database=DB/schema=S/*.parquet  one row per object, with its DDL
+#   <out>/edges/database=DB/schema=S/*.parquet    object -> referenced object, fully qualified
+#   <out>/crud/database=DB/schema=S/*.parquet     object x operation x day counts from QUERY_HISTORY
+#   <out>/templates/DB.S.json                     template_summary for the app's expander
+#   <out>/manifest.json                           per-schema run time and counts
+OUT_DIR = os.getenv("LINEAGE_BATCH_DIR", "lineage_out")
+DATASETS = ("catalog", "edges", "crud")
+
+# Schemas scanned at once; each worker thread holds its own Snowflake connection
+DEFAULT_CONCURRENCY = 4
+CRUD_LOOKBACK_DAYS = 30
+
+
+def _schemas():
+    import pyarrow as pa
+
+    catalog = pa.schema([
+        ("database", pa.string()), ("schema", pa.string()), ("name", pa.string()), ("domain", pa.string()),
+        ("hash", pa.string()), ("ddl", pa.large_string()), ("refs", pa.int32()),
+    ])
+    edges = pa.schema([
+        ("database", pa.string()), ("schema", pa.string()), ("name", pa.string()), ("ref", pa.string()),
+        ("ref_database", pa.string()), ("ref_schema", pa.string()), ("ref_name", pa.string()),
+        ("ref_domain", pa.string()), ("resolved", pa.bool_()), ("cross_schema", pa.bool_()),
+    ])
+    crud = pa.schema([
+        ("database", pa.string()), ("schema", pa.string()), ("object", pa.string()),
+        ("ref_database", pa.string()), ("ref_schema", pa.string()), ("ref_name", pa.string()),
+        ("op", pa.string()), ("day", pa.date32()), ("count", pa.int64()),
+    ])
+    return {"catalog": catalog, "edges": edges, "crud": crud}
+
+
+def qualify(name, database, schema):
+    """(DATABASE, SCHEMA, NAME) of a reference made from inside database.schema."""
+    parts = name.replace('"', "").upper().split(".")
+    if len(parts) >= 3:
+        return parts[-3], parts[-2], parts[-1]
+    if len(parts) == 2:
+        return database.upper(), parts[0], parts[1]
+    return database.upper(), schema.upper(), parts[0]
+
+
+# -----------------------------
+# Scan
+# -----------------------------
+def discover_schemas(agent, database):
+    """Schemas of `database` that have a DDL_METADATA table."""
+    cur = agent.conn.cursor()
+    cur.execute(f"""
+        SELECT TABLE_SCHEMA
+        FROM "{database}".INFORMATION_SCHEMA.TABLES
+        WHERE TABLE_NAME = 'DDL_METADATA'
+        ORDER BY TABLE_SCHEMA
+    """)
+    rows = cur.fetchall()
+    cur.close()
+    return [(database.upper(), r[0].upper()) for r in rows]
+
+
+def scan_schema(agent, database, schema, lookback_days=CRUD_LOOKBACK_DAYS, crud=True):
+    """Objects, their raw references and query templates of one schema."""
+    with span("batch.scan", database=database, schema=schema) as s:
+        objects = []
+        for domain in DOMAINS:
+            objects.extend(fetch_objects(agent, database, schema, domain))
+        lineage = LineageGraph()
+        lineage.apply(objects)
+        templates = fetch_query_templates(agent, database, schema, lookback_days) if crud else {}
+        s.set(objects=len(objects), templates=len(templates))
+    return {"database": database.upper(), "schema": schema.upper(), "lineage": lineage, "templates": templates}
+
+
+def scan_all(targets, concurrency=DEFAULT_CONCURRENCY, lookback_days=CRUD_LOOKBACK_DAYS, crud=True,
+             make_agent=None):
+    """
+    scan_schema for every (database, schema) target on `concurrency`
+    threads. Returns (scans, {target: error}); one failing schema doesn't
+    stop the others.
+    """
+    if make_agent is None:
+        from agents.mapping_extractor import MappingExtractorAgent as make_agent
+
+    local = threading.local()
+    agents, agents_lock = [], threading.Lock()
+
+    def agent():
+        if getattr(local, "agent", None) is None:
+            local.agent = make_agent()
+            if not local.agent.conn:
+                local.agent = None
+                raise RuntimeError("Snowflake connection not initialized")
+            with agents_lock:
+                agents.append(local.agent)
+        return local.agent
+
+    scans, failed = [], {}
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        futures = {pool.submit(lambda t: scan_schema(agent(), *t, lookback_days, crud), t): t for t in targets}
+        for future in as_completed(futures):
+            database, schema = futures[future]
+            try:
+                scan = future.result()
+            except Exception as e:
+                failed[(database, schema)] = str(e)
+                print(f"❌ {database}.{schema}: {e}")
+                continue
+            scans.append(scan)
+            print(f"✅ {database}.{schema}: {len(scan['lineage'].objects)} objects, "
+                  f"{len(scan['templates'])} query templates")
+    for a in agents:
+        a.conn.close()
+    return scans, failed
+
+
+# -----------------------------
+# Resolve and write
+# -----------------------------
+def known_objects(out_dir, skip=()):
+    """{(DATABASE, SCHEMA, NAME): domain} from earlier runs' catalogs, except the `skip` schemas."""
+    import pyarrow.dataset as ds
+
+    path = os.path.join(out_dir, "catalog")
+    if not os.path.isdir(path):
+        return {}
+    table = ds.dataset(path, format="parquet", partitioning="hive").to_table(
+        columns=["database", "schema", "name", "domain"])
+    known = {}
+    for r in table.to_pylist():
+        if (r["database"], r["schema"]) not in skip:
+            known[qualify(r["name"], r["database"], r["schema"])] = r["domain"]
+    return known
+
+
+def build_rows(scans, known=None):
+    """
+    Catalog, edge and CRUD rows for all scanned schemas. References are
+    qualified against the referencing object's schema and resolved against
+    the catalogs of this run and `known` (earlier runs), so cross-schema
+    edges get their target's domain.
+    """
+    catalog, domains = [], dict(known or {})
+    for scan in scans:
+        for obj in scan["lineage"].objects.values():
+            db, schema, name = qualify(obj["name"], scan["database"], scan["schema"])
+            domains[(db, schema, name)] = obj.get("domain")
+            catalog.append({"database": scan["database"], "schema": scan["schema"], "name": obj["name"],
+                            "domain": obj.get("domain"), "hash": obj["hash"], "ddl": obj["ddl"],
+                            "refs": len(obj["refs"])})
+
+    edges = []
+    for scan in scans:
+        for obj in scan["lineage"].objects.values():
+            for ref in dict.fromkeys(obj["refs"]):
+                key = qualify(ref, scan["database"], scan["schema"])
+                edges.append({"database": scan["database"], "schema": scan["schema"], "name": obj["name"],
+                              "ref": ref, "ref_database": key[0], "ref_schema": key[1], "ref_name": key[2],
+                              "ref_domain": domains.get(key), "resolved": key in domains,
+                              "cross_schema": key[:2] != (scan["database"], scan["schema"])})
+
+    crud = []
+    for scan in scans:
+        cube = {}
+        for entry in scan["templates"].values():
+            days = {}
+            for ts in entry["timestamps"]:
+                days[ts.date()] = days.get(ts.date(), 0) + 1
+            for table, ops in entry["ops"].items():
+                for op in ops:
+                    for day, n in days.items():
+                        cube[(table, op, day)] = cube.get((table, op, day), 0) + n
+        for (table, op, day), n in cube.items():
+            key = qualify(table, scan["database"], scan["schema"])
+            crud.append({"database": scan["database"], "schema": scan["schema"], "object": table,
+                         "ref_database": key[0], "ref_schema": key[1], "ref_name": key[2],
+                         "op": op, "day": day, "count": n})
+    return {"catalog": catalog, "edges": edges, "crud": crud}
+
+
+def _partition_dir(out_dir, dataset, database, schema):
+    return os.path.join(out_dir, dataset, f"database={quote(database, safe='')}", f"schema={quote(schema, safe='')}")
+
+
+def write_outputs(out_dir, scans, rows, lookback_days=CRUD_LOOKBACK_DAYS):
+    """
+    Replace the scanned schemas' partitions of each dataset, leaving other
+    schemas from earlier runs in place, then update the manifest.
+    """
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    schemas = _schemas()
+    partitioning = ds.partitioning(pa.schema([("database", pa.string()), ("schema", pa.string())]), flavor="hive")
+    for dataset in DATASETS:
+        for scan in scans:
+            shutil.rmtree(_partition_dir(out_dir, dataset, scan["database"], scan["schema"]), ignore_errors=True)
+        if not rows[dataset]:
+            continue
+        with span("batch.write", dataset=dataset, rows=len(rows[dataset])):
+            table = pa.Table.from_pylist(rows[dataset], schema=schemas[dataset])
+            ds.write_dataset(table, os.path.join(out_dir, dataset), format="parquet", partitioning=partitioning,
+                             existing_data_behavior="overwrite_or_ignore",
+                             basename_template=f"part-{int(time.time())}-{{i}}.parquet")
+
+    os.makedirs(os.path.join(out_dir, "templates"), exist_ok=True)
+    manifest = read_manifest(out_dir)
+    run_at = datetime.utcnow().isoformat(timespec="seconds")
+    for scan in scans:
+        target = f"{scan['database']}.{scan['schema']}"
+        with open(os.path.join(out_dir, "templates", f"{target}.json"), "w", encoding="utf-8") as f:
+            json.dump(template_summary(scan["templates"]), f)
+        in_schema = [r for r in rows["edges"] if (r["database"], r["schema"]) == (scan["database"], scan["schema"])]
+        manifest["schemas"][target] = {
+            "run_at": run_at,
+            "lookback_days": lookback_days,
+            "objects": len(scan["lineage"].objects),
+            "edges": len(in_schema),
+            "cross_schema_edges": sum(r["cross_schema"] for r in in_schema),
+            "templates": len(scan["templates"]),
+        }
+    with open(os.path.join(out_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+
+
+def read_manifest(out_dir):
+    path = os.path.join(out_dir, "manifest.json")
+    if not os.path.exists(path):
+        return {"schemas": {}}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+# -----------------------------
+# Read back (app.py)
+# -----------------------------
+def _read(out_dir, dataset, database, schema):
+    import pyarrow.dataset as ds
+
+    path = os.path.join(out_dir, dataset)
+    if not os.path.isdir(_partition_dir(out_dir, dataset, database, schema)):
+        return []
+    data = ds.dataset(path, format="parquet", partitioning="hive")
+    return data.to_table(filter=(ds.field("database") == database) & (ds.field("schema") == schema)).to_pylist()
+
+
+def load_snapshot(out_dir, database, schema):
+    """
+    A schema's precomputed outputs in the shape app.load_schema_snapshot
+    returns, so the app can open them without querying Snowflake.
+    """
+    database, schema = database.upper(), schema.upper()
+    info = read_manifest(out_dir)["schemas"].get(f"{database}.{schema}")
+    if info is None:
+        raise ValueError(f"{database}.{schema} is not in the batch output at {out_dir}")
+
+    objects = {d: [] for d in DOMAINS}
+    edges = {}
+    for r in _read(out_dir, "edges", database, schema):
+        edges.setdefault(r["name"], []).append(r["ref"])
+    for r in _read(out_dir, "catalog", database, schema):
+        objects.setdefault(r["domain"] or "TABLE", []).append(
+            # Stored references, so the DDL isn't parsed again
+            {"name": r["name"], "ddl": r["ddl"], "domain": r["domain"], "hash": r["hash"],
+             "refs": edges.get(r["name"], [])})
+    lineage = LineageGraph()
+    lineage.apply(o for objs in objects.values() for o in objs)
+
+    crud = {}
+    for r in _read(out_dir, "crud", database, schema):
+        day = datetime(r["day"].year, r["day"].month, r["day"].day)
+        crud.setdefault(r["object"], {}).setdefault(r["op"], []).extend([day] * r["count"])
+    crud_matrix = {
+        obj: {"Object": obj, **{op: len(ops.get(op, [])) for op in "CUDR"}, "Execution Timestamps": ops,
+              "Total CRUD": sum(len(v) for v in ops.values())}
+        for obj, ops in crud.items()
+    }
+
+    templates = None
+    templates_path = os.path.join(out_dir, "templates", f"{database}.{schema}.json")
+    if os.path.exists(templates_path):
+        with open(templates_path, encoding="utf-8") as f:
+            templates = json.load(f)
+    return {"lineage": lineage, "objects": lineage.objects_by_domain(), "crud_matrix": crud_matrix,
+            "query_templates": templates, "run_at": info["run_at"]}
+
+
+def run(targets, databases, out_dir=OUT_DIR, concurrency=DEFAULT_CONCURRENCY, lookback_days=CRUD_LOOKBACK_DAYS,
+        crud=True, make_agent=None):
+    """Discover, scan, resolve and write. Returns the targets that failed."""
+    if make_agent is None:
+        from agents.mapping_extractor import MappingExtractorAgent as make_agent
+
+    targets = [tuple(part.upper() for part in t) for t in targets]
+    if databases:
+        agent = make_agent()
+        if not agent.conn:
+            raise RuntimeError("Snowflake connection not initialized")
+        for database in databases:
+            found = discover_schemas(agent, database)
+            print(f"🔎 {database}: {len(found)} schemas with DDL_METADATA")
+            targets.extend(found)
+        agent.conn.close()
+    targets = list(dict.fromkeys(targets))
+    if not targets:
+        raise ValueError("No schemas to scan; pass --schemas DB.SCHEMA ... or --databases DB ...")
+
+    print(f"🚀 Scanning {len(targets)} schemas, {concurrency} at a time")
+    start = time.perf_counter()
+    scans, failed = scan_all(targets, concurrency, lookback_days, crud, make_agent)
+    rows = build_rows(scans, known_objects(out_dir, skip={(s["database"], s["schema"]) for s in scans}))
+    write_outputs(out_dir, scans, rows, lookback_days)
+    cross = sum(r["cross_schema"] for r in rows["edges"])
+    unresolved = sum(not r["resolved"] for r in rows["edges"])
+    print(f"💾 {len(rows['catalog'])} objects, {len(rows['edges'])} edges ({cross} cross-schema, "
+          f"{unresolved} to objects outside the output), {len(rows['crud'])} CRUD cells → {out_dir} "
+          f"in {time.perf_counter() - start:.1f}s")
+    return failed
+
+
+def _target(text):
+    parts = text.split(".")
+    if len(parts) != 2 or not all(parts):
+        raise argparse.ArgumentTypeError(f"expected DATABASE.SCHEMA, got '{text}'")
+    return tuple(parts)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Headless lineage and CRUD precompute for many schemas, written as Parquet.")
+    parser.add_argument("--schemas", type=_target, nargs="+", default=[], metavar="DB.SCHEMA")
+    parser.add_argument("--databases", nargs="+", default=[],
+                        help="Scan every schema of these databases that has a DDL_METADATA table")
+    parser.add_argument("--out", default=OUT_DIR)
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument("--lookback-days", type=int, default=CRUD_LOOKBACK_DAYS)
+    parser.add_argument("--no-crud", action="store_true", help="Skip QUERY_HISTORY")
+    args = parser.parse_args()
+
+    try:
+        failed = run(args.schemas, args.databases, args.out, args.concurrency, args.lookback_days,
+                     crud=not args.no_crud)
+    except (ValueError, RuntimeError) as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    if failed:
+        print(f"⚠️ {len(failed)} schemas failed: {', '.join(f'{d}.{s}' for d, s in failed)}")
+        sys.exit(1)
@@ -0,0 +1,243 @@
+import os
+import random
+import threading
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Backend and model for every LLM call in the project (GROQ_API_KEY /
+# GROQ_BASE_URL are still read by the groq backend)
+LLM_BACKEND = os.getenv("LLM_BACKEND", "groq")
+LLM_MODEL = os.getenv("LLM_MODEL", "llama-3.3-70b-versatile")
+
+# Seconds to connect, and to wait for the response / between stream chunks
+LLM_CONNECT_TIMEOUT_S = float(os.getenv("LLM_CONNECT_TIMEOUT_S", 5))
+LLM_READ_TIMEOUT_S = float(os.getenv("LLM_READ_TIMEOUT_S", 60))
+
+# Retries after the first attempt on connection errors, timeouts, 429 and 5xx,
+# with full-jitter exponential backoff (or the server's Retry-After)
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", 3))
+LLM_RETRY_BASE_DELAY_S = float(os.getenv("LLM_RETRY_BASE_DELAY_S", 1.0))
+LLM_RETRY_MAX_DELAY_S = float(os.getenv("LLM_RETRY_MAX_DELAY_S", 30.0))
+
+# Requests in flight per process (also the keep-alive pool size) and
+# request starts per second (0 = unlimited)
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", 8))
+LLM_RPS = float(os.getenv("LLM_RPS", 0))
+
+
+# -----------------------------
+# Backends
+# -----------------------------
+def _groq_client(is_async, api_key, base_url, timeout, max_connections):
+    import groq
+    import httpx
+
+    limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+    if is_async:
+        cls, http_client = groq.AsyncGroq, groq.DefaultAsyncHttpxClient(limits=limits, timeout=timeout)
+    else:
+        cls, http_client = groq.Groq, groq.DefaultHttpxClient(limits=limits, timeout=timeout)
+    return cls(api_key=api_key or os.getenv("GROQ_API_KEY"), base_url=base_url or os.getenv("GROQ_BASE_URL") or None,
+               timeout=timeout, max_retries=0, http_client=http_client)
+
+
+def _groq_errors():
+    import groq
+    return (groq.APIConnectionError, groq.APITimeoutError, groq.RateLimitError, groq.InternalServerError)
+
+
+def _openai_client(is_async, api_key, base_url, timeout, max_connections):
+    # Any OpenAI-compatible endpoint (vLLM, Ollama, mock_llm_server.py at <url>/v1); needs `pip install openai`
+    import httpx
+    import openai
+
+    limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+    if is_async:
+        cls, http_client = openai.AsyncOpenAI, openai.DefaultAsyncHttpxClient(limits=limits, timeout=timeout)
+    else:
+        cls, http_client = openai.OpenAI, openai.DefaultHttpxClient(limits=limits, timeout=timeout)
+    return cls(api_key=api_key or os.getenv("OPENAI_API_KEY") or "none",
+               base_url=base_url or os.getenv("OPENAI_BASE_URL") or None,
+               timeout=timeout, max_retries=0, http_client=http_client)
+
+
+def _openai_errors():
+    import openai
+    return (openai.APIConnectionError, openai.APITimeoutError, openai.RateLimitError, openai.InternalServerError)
+
+
+# name -> (make_client(is_async, api_key, base_url, timeout, max_connections), retryable_errors())
+BACKENDS = {
+    "groq": (_groq_client, _groq_errors),
+    "openai": (_openai_client, _openai_errors),
+}
+
+
+def register_backend(name, make_client, retryable_errors):
+    """Add a backend whose clients expose the OpenAI-style chat.completions.create()."""
+    BACKENDS[name] = (make_client, retryable_errors)
+
+
+def _backend(name):
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown LLM backend '{name}', expected one of {sorted(BACKENDS)}")
+    return BACKENDS[name]
+
+
+def retryable_errors(backend=LLM_BACKEND):
+    """Errors worth another attempt; anything else fails the call immediately."""
+    return _backend(backend)[1]()
+
+
+def make_timeout(connect=LLM_CONNECT_TIMEOUT_S, read=LLM_READ_TIMEOUT_S):
+    import httpx
+    return httpx.Timeout(read, connect=connect)
+
+
+def make_async_client(backend=LLM_BACKEND, api_key=None, base_url=None, max_connections=LLM_MAX_CONCURRENCY,
+                      connect_timeout=LLM_CONNECT_TIMEOUT_S, read_timeout=LLM_READ_TIMEOUT_S):
+    """An async SDK client with the same timeouts and pool limits, for one event loop (see batch_chat)."""
+    return _backend(backend)[0](True, api_key, base_url, make_timeout(connect_timeout, read_timeout),
+                                max_connections)
+
+
+# -----------------------------
+# Retries and limits
+# -----------------------------
+def retry_after(error):
+    """Seconds from a Retry-After header on the error's response, if any."""
+    response = getattr(error, "response", None)
+    value = response.headers.get("retry-after") if response is not None else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def backoff_delay(attempt, base_delay=LLM_RETRY_BASE_DELAY_S, max_delay=LLM_RETRY_MAX_DELAY_S, error=None):
+    """Full-jitter exponential backoff for retry number `attempt` (0-based), at least the server's Retry-After."""
+    delay = random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+    server = retry_after(error) if error is not None else None
+    return min(max_delay, max(delay, server or 0.0))
+
+
+class RateLimiter:
+    """
+    Spaces request starts at least 1/rps seconds apart across all threads,
+    or all tasks of an event loop with wait_async().
+    """
+
+    def __init__(self, rps):
+        self.interval = 1.0 / rps if rps and rps > 0 else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def _reserve(self):
+        """Take the next start slot; returns the seconds to wait for it."""
+        if not self.interval:
+            return 0.0
+        # Held only to book the slot, never while sleeping, so it doesn't block an event loop
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        return delay
+
+    def wait(self):
+        delay = self._reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+    async def wait_async(self):
+        import asyncio
+
+        delay = self._reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class LLMClient:
+    """
+    One SDK client over a keep-alive connection pool, shared by every thread
+    in the process. Calls wait for a concurrency slot and the rate limiter,
+    time out per LLM_*_TIMEOUT_S and are retried on transient errors.
+    """
+
+    def __init__(self, backend=LLM_BACKEND, api_key=None, base_url=None,
+                 connect_timeout=LLM_CONNECT_TIMEOUT_S, read_timeout=LLM_READ_TIMEOUT_S,
+                 max_retries=LLM_MAX_RETRIES, retry_base_delay=LLM_RETRY_BASE_DELAY_S,
+                 max_concurrency=LLM_MAX_CONCURRENCY, rps=LLM_RPS):
+        make_client, errors = _backend(backend)
+        self.backend = backend
+        self.client = make_client(False, api_key, base_url, make_timeout(connect_timeout, read_timeout),
+                                  max_concurrency)
+        self.retryable = errors()
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self._slots = threading.BoundedSemaphore(max(1, max_concurrency))
+        self._limiter = RateLimiter(rps)
+        self._stats_lock = threading.Lock()
+        self.stats = {"requests": 0, "retries": 0, "failures": 0}
+
+    def _count(self, key):
+        with self._stats_lock:
+            self.stats[key] += 1
+
+    def _create(self, **kwargs):
+        attempt = 0
+        while True:
+            self._limiter.wait()
+            self._count("requests")
+            try:
+                return self.client.chat.completions.create(**kwargs)
+            except self.retryable as e:
+                if attempt >= self.max_retries:
+                    self._count("failures")
+                    raise
+                self._count("retries")
+                time.sleep(backoff_delay(attempt, self.retry_base_delay, error=e))
+                attempt += 1
+
+    def complete(self, messages, model=LLM_MODEL, temperature=0.1, **kwargs):
+        """Non-streaming chat completion; returns the SDK response."""
+        with self._slots:
+            return self._create(model=model, temperature=temperature, messages=messages, **kwargs)
+
+    def stream(self, messages, model=LLM_MODEL, temperature=0.1, **kwargs):
+        """
+        Yield the raw stream chunks. Only opening the stream is retried; an
+        error after the first chunk is raised, never replayed. The
+        concurrency slot is held until the stream is exhausted or closed.
+        """
+        with self._slots:
+            stream = self._create(model=model, temperature=temperature, messages=messages, stream=True, **kwargs)
+            try:
+                yield from stream
+            finally:
+                close = getattr(stream, "close", None)
+                if close:
+                    close()
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(backend=LLM_BACKEND, api_key=None, base_url=None):
+    """The process-wide LLMClient for this backend / key / endpoint, created on first use."""
+    key = (backend, api_key, base_url)
+    with _clients_lock:
+        if key not in _clients:
+            _clients[key] = LLMClient(backend, api_key, base_url)
+        return _clients[key]
+
+
+def ask(prompt, system_prompt, model=LLM_MODEL, temperature=0.1, client=None):
+    """Answer text for one system + user prompt."""
+    resp = (client or get_client()).complete(
+        [{"role": "system", "content": system_prompt}, {"role": "user", "content": prompt}],
+        model=model, temperature=temperature,
+    )
+    return resp.choices[0].message.content
@@ -0,0 +1,67 @@
+import time
+
+from llm_client import LLM_MODEL, get_client
+
+
+def _usage_from_chunk(chunk):
+    """Groq reports usage on the last chunk under x_groq; OpenAI-style servers use `usage`."""
+    x_groq = getattr(chunk, "x_groq", None)
+    usage = getattr(x_groq, "usage", None) if x_groq is not None else None
+    if isinstance(x_groq, dict):
+        usage = x_groq.get("usage")
+    return usage or getattr(chunk, "usage", None)
+
+
+def _get(obj, key):
+    return obj.get(key) if isinstance(obj, dict) else getattr(obj, key, None)
+
+
+def stream_chat(messages, model=LLM_MODEL, temperature=0.1, metrics=None, api_key=None, base_url=None, client=None):
+    """
+    Stream a chat completion, yielding content deltas as they arrive.
+
+    If a `metrics` dict is given it is filled with ttft_s (time to first
+    token), total_s, prompt_tokens and completion_tokens once the stream
+    is exhausted. Uses the process-wide pooled client (llm_client.py)
+    unless `client` is given; `base_url` (or GROQ_BASE_URL) can point at
+    mock_llm_server.py for offline runs.
+    """
+    client = client or get_client(api_key=api_key, base_url=base_url)
+    metrics = metrics if metrics is not None else {}
+
+    start = time.perf_counter()
+    metrics.update({"model": model, "ttft_s": None, "total_s": None,
+                    "prompt_tokens": None, "completion_tokens": 0})
+    stream = client.stream(messages, model=model, temperature=temperature)
+
+    deltas = 0
+    usage = None
+    for chunk in stream:
+        usage = _usage_from_chunk(chunk) or usage
+        if not chunk.choices:
+            continue
+        text = chunk.choices[0].delta.content
+        if not text:
+            continue
+        if metrics["ttft_s"] is None:
+            metrics["ttft_s"] = time.perf_counter() - start
+        deltas += 1
+        yield text
+
+    metrics["total_s"] = time.perf_counter() - start
+    if usage is not None:
+        metrics["prompt_tokens"] = _get(usage, "prompt_tokens")
+        metrics["completion_tokens"] = _get(usage, "completion_tokens")
+    else:
+        # No usage block from the server: one delta is roughly one token
+        metrics["completion_tokens"] = deltas
+
+
+def format_metrics(metrics):
+    ttft = metrics.get("ttft_s")
+    total = metrics.get("total_s") or 0
+    return (
+        f"TTFT {ttft:.2f}s · total {total:.2f}s · "
+        f"prompt {metrics.get('prompt_tokens')} tok · completion {metrics.get('completion_tokens')} tok"
+        if ttft is not None else f"no tokens received · total {total:.2f}s"
+    )
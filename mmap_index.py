@@ -0,0 +1,262 @@
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+import numpy as np
+import pyarrow as pa
+
+from utils.tracing import span
+
+# Exact search over a memory-mapped copy of a LanceDB chunk table:
+#   <table>.mmap/vectors.npy  L2-normalized embeddings, n x dim, float32 or float16
+#   <table>.mmap/rows.arrow   chunk_id, metadata and text (Arrow IPC, memory-mapped;
+#                             the text column is the id -> text offset sidecar)
+#   <table>.mmap/meta.json    shape, dtype and the LanceDB version it was exported from
+DTYPES = {"float32": np.float32, "float16": np.float16}
+
+# Rows scored per matmul; bounds the (queries x rows) score matrix
+BLOCK_ROWS = 131_072
+
+# Rows per batch when exporting from LanceDB
+EXPORT_BATCH_ROWS = 8192
+
+FILTER_COLUMNS = ("object_name", "schema_name", "object_domain", "block_type")
+
+
+def index_dir(db_path, table_name):
+    return os.path.join(db_path, f"{table_name}.mmap")
+
+
+def build_filters(object_name=None, schema_name=None, object_domain=None, block_type=None):
+    """Same filters as embed_and_store.build_where, as {column: UPPER value}."""
+    values = dict(zip(FILTER_COLUMNS, (object_name, schema_name, object_domain, block_type)))
+    return {column: value.upper() for column, value in values.items() if value} or None
+
+
+def export_index(tbl, out_dir, dtype="float32", batch_rows=EXPORT_BATCH_ROWS):
+    """Stream a LanceDB chunk table into the memory-mapped layout, batch by batch."""
+    n = tbl.count_rows()
+    columns = [c for c in tbl.schema.names if not c.startswith("embedding")]
+    dim = tbl.schema.field("embedding").type.list_size
+    tmp_dir = out_dir + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    print(f"📤 Exporting {n} rows x {dim} dims ({dtype}) to {out_dir}")
+
+    with span("mmap.export", rows=n, dtype=dtype):
+        vectors = np.lib.format.open_memmap(os.path.join(tmp_dir, "vectors.npy"), mode="w+",
+                                            dtype=DTYPES[dtype], shape=(n, dim))
+        reader = tbl.search().select(columns + ["embedding"]).limit(None).to_batches(batch_rows)
+        row_schema = pa.schema([tbl.schema.field(c) for c in columns])
+        pos = 0
+        with pa.OSFile(os.path.join(tmp_dir, "rows.arrow"), "wb") as sink, \
+                pa.ipc.new_file(sink, row_schema) as writer:
+            for batch in reader:
+                emb = batch.column("embedding")
+                block = np.asarray(emb.flatten(), dtype=np.float32).reshape(len(emb), dim)
+                norms = np.linalg.norm(block, axis=1, keepdims=True)
+                norms[norms == 0] = 1.0
+                vectors[pos:pos + len(block)] = block / norms
+                pos += len(block)
+                writer.write_batch(pa.RecordBatch.from_arrays(
+                    [batch.column(c) for c in columns], schema=row_schema))
+        vectors.flush()
+        del vectors
+        with open(os.path.join(tmp_dir, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({"rows": pos, "dim": dim, "dtype": dtype, "version": tbl.version}, f)
+
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.replace(tmp_dir, out_dir)
+    print(f"✅ Exported {pos} rows")
+
+
+class MmapIndex:
+    """Exact cosine top-k over the memory-mapped matrix; many queries per matmul."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+        self.rows = pa.ipc.open_file(pa.memory_map(os.path.join(path, "rows.arrow"))).read_all()
+
+    def __len__(self):
+        return len(self.vectors)
+
+    def mask(self, filters):
+        """
+        Row ids matching every {column: value} filter, or None for all rows.
+        A list value matches rows whose list column holds any of its values.
+        """
+        if not filters:
+            return None
+        import pyarrow.compute as pc
+
+        keep = None
+        for column, value in filters.items():
+            if isinstance(value, (list, tuple)):
+                values = self.rows.column(column).combine_chunks()
+                hit = np.zeros(len(values), dtype=bool)
+                found = pc.is_in(pc.list_flatten(values), pa.array(value, pa.string()))
+                hit[np.asarray(pc.list_parent_indices(values))[found.to_numpy(zero_copy_only=False)]] = True
+                match = pa.array(hit)
+            else:
+                match = pc.equal(self.rows.column(column), value)
+            keep = match if keep is None else pc.and_(keep, match)
+        return np.flatnonzero(keep.to_numpy(zero_copy_only=False))
+
+    def search_batch(self, queries, top_k=5, rows=None, block_rows=BLOCK_ROWS):
+        """
+        Top-k row ids and cosine scores for each query (ids/scores are
+        nq x k, best first). `rows` restricts the search to those row ids.
+        """
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        n = len(self) if rows is None else len(rows)
+        k = min(top_k, n)
+        if k == 0:
+            return np.zeros((len(queries), 0), dtype=np.int64), np.zeros((len(queries), 0), dtype=np.float32)
+
+        best_ids, best_scores = None, None
+        for start in range(0, n, block_rows):
+            stop = min(start + block_rows, n)
+            ids = np.arange(start, stop) if rows is None else np.asarray(rows[start:stop])
+            block = self.vectors[start:stop] if rows is None else self.vectors[ids]
+            scores = queries @ np.asarray(block, dtype=np.float32).T
+            kk = min(k, stop - start)
+            part = np.argpartition(-scores, kk - 1, axis=1)[:, :kk]
+            ids, scores = ids[part], np.take_along_axis(scores, part, axis=1)
+            if best_ids is not None:
+                ids = np.concatenate([best_ids, ids], axis=1)
+                scores = np.concatenate([best_scores, scores], axis=1)
+                part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+                ids, scores = np.take_along_axis(ids, part, axis=1), np.take_along_axis(scores, part, axis=1)
+            best_ids, best_scores = ids, scores
+
+        order = np.argsort(-best_scores, axis=1)
+        return np.take_along_axis(best_ids, order, axis=1), np.take_along_axis(best_scores, order, axis=1)
+
+    def results(self, ids, scores):
+        """One query's hits as a DataFrame shaped like search_chunks output."""
+        df = self.rows.take(pa.array(ids, pa.int64())).to_pandas()
+        # Squared L2 between unit vectors, so lower is better like LanceDB's _distance
+        df["_distance"] = 2.0 - 2.0 * np.asarray(scores, dtype=np.float32)
+        return df
+
+    def search_chunks(self, query_vector, top_k=5, filters=None):
+        with span("mmap.search", top_k=top_k, filters=str(filters or "")) as s:
+            ids, scores = self.search_batch(query_vector, top_k, self.mask(filters))
+            s.set(rows=ids.shape[1])
+        return self.results(ids[0], scores[0])
+
+    def search_many(self, query_vectors, top_k=5, filters=None):
+        """search_chunks for many queries sharing one filter, in one pass over the matrix."""
+        with span("mmap.search_batch", queries=len(query_vectors), top_k=top_k):
+            ids, scores = self.search_batch(query_vectors, top_k, self.mask(filters))
+        return [self.results(i, s) for i, s in zip(ids, scores)]
+
+
+def open_index(db_path, table_name, dtype="float32", rebuild=False):
+    """Open the index for a LanceDB table, (re-)exporting it if missing or older than the table."""
+    import lancedb
+
+    path = index_dir(db_path, table_name)
+    tbl = lancedb.connect(db_path).open_table(table_name)
+    meta_path = os.path.join(path, "meta.json")
+    if not rebuild and os.path.exists(meta_path):
+        with open(meta_path, encoding="utf-8") as f:
+            meta = json.load(f)
+        rebuild = meta["version"] != tbl.version or meta["dtype"] != dtype
+        if rebuild:
+            print(f"🔄 {table_name} changed since the last export (v{meta['version']} → v{tbl.version})")
+    else:
+        rebuild = True
+    if rebuild:
+        export_index(tbl, path, dtype)
+    return MmapIndex(path)
+
+
+# -----------------------------
+# Benchmark against LanceDB
+# -----------------------------
+def benchmark(sizes=(10_000, 50_000, 200_000), dim=384, n_queries=200, top_k=10, batch=64, seed=0):
+    """
+    For each corpus size: LanceDB flat search per query vs mmap per query
+    and mmap with `batch` queries per matmul, plus recall@k against LanceDB.
+    """
+    import lancedb
+    from embed_and_store import store_embeddings_lancedb, search_chunks
+
+    rng = np.random.default_rng(seed)
+    rows = []
+    for n in sizes:
+        vectors = rng.standard_normal((n, dim), dtype=np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        picks = rng.choice(n, size=n_queries, replace=False)
+        queries = vectors[picks] + rng.normal(0, 0.05, size=(n_queries, dim)).astype(np.float32)
+        tmp = tempfile.mkdtemp(prefix="mmap_bench_")
+        try:
+            chunks = [{"text": f"chunk {i}"} for i in range(n)]
+            store_embeddings_lancedb(tmp, "bench", chunks, vectors, object_name="BENCH", schema_name="BENCH",
+                                     storage="fp32")
+            tbl = lancedb.connect(tmp).open_table("bench")
+            start = time.perf_counter()
+            index = open_index(tmp, "bench")
+            export_s = time.perf_counter() - start
+
+            lance_ms, lance_ids = [], []
+            for q in queries:
+                t0 = time.perf_counter()
+                found = search_chunks(tbl, q, top_k=top_k, columns=["chunk_id"])
+                lance_ms.append(1000 * (time.perf_counter() - t0))
+                lance_ids.append(set(found["chunk_id"].tolist()))
+
+            mmap_ms, hits = [], 0
+            for q, expected in zip(queries, lance_ids):
+                t0 = time.perf_counter()
+                found = index.search_chunks(q, top_k=top_k)
+                mmap_ms.append(1000 * (time.perf_counter() - t0))
+                hits += len(expected & set(found["chunk_id"].tolist()))
+
+            t0 = time.perf_counter()
+            for i in range(0, n_queries, batch):
+                index.search_many(queries[i:i + batch], top_k=top_k)
+            batched_ms = 1000 * (time.perf_counter() - t0) / n_queries
+
+            rows.append({
+                "rows": n,
+                "export_s": export_s,
+                "lancedb_p50_ms": float(np.percentile(lance_ms, 50)),
+                "mmap_p50_ms": float(np.percentile(mmap_ms, 50)),
+                f"mmap_batch{batch}_ms_per_q": batched_ms,
+                f"recall@{top_k}": hits / (top_k * n_queries),
+            })
+            del index
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Memory-mapped exact-search index over a LanceDB chunk table.")
+    parser.add_argument("job", choices=["export", "bench"])
+    parser.add_argument("--db", default="lancedb_db")
+    parser.add_argument("--table", default="sp_blocks_vectors")
+    parser.add_argument("--dtype", choices=list(DTYPES), default="float32")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 50_000, 200_000],
+                        help="bench: corpus sizes to compare at")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--batch", type=int, default=64, help="bench: queries per matmul")
+    args = parser.parse_args()
+
+    if args.job == "export":
+        open_index(args.db, args.table, args.dtype, rebuild=True)
+    else:
+        results = benchmark(args.sizes, n_queries=args.queries, top_k=args.top_k, batch=args.batch)
+        header = list(results[0].keys())
+        print(" | ".join(f"{h:>20}" for h in header))
+        for row in results:
+            print(" | ".join(f"{v:>20.3f}" if isinstance(v, float) else f"{v:>20}" for v in row.values()))
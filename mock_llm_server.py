@@ -0,0 +1,189 @@
+"""
+Local OpenAI/Groq-compatible chat completions server for offline testing.
+
+    python mock_llm_server.py --port 8765 --ttft 0.5 --token-delay 0.02
+    GROQ_BASE_URL=http://127.0.0.1:8765 python 5-chat.py --query "..."
+    LLM_BACKEND=openai OPENAI_BASE_URL=http://127.0.0.1:8765/v1 python 5-chat.py --query "..."
+
+Serves POST /openai/v1/chat/completions (Groq SDK path) and
+/v1/chat/completions, streamed as server-sent events when "stream": true.
+Failure paths for llm_client.py's timeouts and retries:
+
+    --error-rate 0.2 --error-status 429   20% of requests rejected (with Retry-After)
+    --stall-rate 0.1 --stall 30           10% of requests hang before answering
+
+GET /stats returns request, connection, error and stall counts, so
+connection reuse can be checked (connections << requests).
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PATHS = {"/openai/v1/chat/completions", "/v1/chat/completions"}
+
+ERROR_MESSAGES = {429: "Rate limit reached", 500: "Internal server error", 503: "Service unavailable"}
+
+
+def build_answer(messages):
+    question = messages[-1]["content"] if messages else ""
+    question = question.split("QUESTION:")[-1].strip()
+    return f"Mock answer for: {question[:200]}. The context mentions the requested SQL objects."
+
+
+class Faults:
+    """Per-request latency jitter, errors and stalls, plus the /stats counters."""
+
+    def __init__(self, ttft_jitter=0.0, error_rate=0.0, error_status=503, retry_after=1.0,
+                 stall_rate=0.0, stall=30.0, seed=None):
+        self.ttft_jitter = ttft_jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.retry_after = retry_after
+        self.stall_rate = stall_rate
+        self.stall = stall
+        self.stats = {"requests": 0, "connections": 0, "errors": 0, "stalls": 0}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def draw(self):
+        """(extra seconds before answering, error status or None) for one request."""
+        with self._lock:
+            self.stats["requests"] += 1
+            if self._random.random() < self.error_rate:
+                self.stats["errors"] += 1
+                return 0.0, self.error_status
+            extra = self._random.uniform(0, self.ttft_jitter)
+            if self._random.random() < self.stall_rate:
+                self.stats["stalls"] += 1
+                extra += self.stall
+            return extra, None
+
+
+def make_handler(ttft, token_delay, faults=None):
+    faults = faults or Faults()
+
+    class Handler(BaseHTTPRequestHandler):
+        # Keep-alive for JSON responses; streams close the connection when done
+        protocol_version = "HTTP/1.1"
+
+        def setup(self):
+            super().setup()
+            faults.count("connections")
+
+        def log_message(self, fmt, *args):
+            pass
+
+        def do_GET(self):
+            if self.path == "/stats":
+                self._send_json(faults.stats)
+            elif self.path in ("/v1/models", "/openai/v1/models"):
+                self._send_json({"object": "list", "data": [{"id": "mock", "object": "model"}]})
+            else:
+                self.send_error(404)
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            if self.path not in PATHS:
+                self.send_error(404)
+                return
+            extra, status = faults.draw()
+            if status is not None:
+                self._send_error_json(status)
+                return
+            messages = body.get("messages", [])
+            model = body.get("model", "mock")
+            answer = build_answer(messages)
+            tokens = answer.split(" ")
+            usage = {
+                "prompt_tokens": sum(len(m.get("content", "").split()) for m in messages),
+                "completion_tokens": len(tokens),
+            }
+            usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+            completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+            created = int(time.time())
+
+            time.sleep(ttft + extra)
+            if not body.get("stream"):
+                self._send_json({
+                    "id": completion_id, "object": "chat.completion", "created": created, "model": model,
+                    "choices": [{"index": 0, "finish_reason": "stop",
+                                 "message": {"role": "assistant", "content": answer}}],
+                    "usage": usage,
+                })
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.close_connection = True
+            for i, token in enumerate(tokens):
+                self._send_event({
+                    "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                    "choices": [{"index": 0, "finish_reason": None,
+                                 "delta": {"content": token if i == 0 else " " + token}}],
+                })
+                time.sleep(token_delay)
+            self._send_event({
+                "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                "choices": [{"index": 0, "finish_reason": "stop", "delta": {}}],
+                "x_groq": {"id": completion_id, "usage": usage},
+            })
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+
+        def _send_error_json(self, status):
+            message = ERROR_MESSAGES.get(status, "Mock failure")
+            headers = {"Retry-After": f"{faults.retry_after:g}"} if status == 429 else {}
+            self._send_json({"error": {"message": message, "type": "mock_error", "code": status}}, status, headers)
+
+        def _send_json(self, payload, status=200, headers=None):
+            data = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _send_event(self, payload):
+            self.wfile.write(f"data: {json.dumps(payload)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+    return Handler
+
+
+def serve(host="127.0.0.1", port=8765, ttft=0.3, token_delay=0.02, faults=None):
+    server = ThreadingHTTPServer((host, port), make_handler(ttft, token_delay, faults))
+    server.daemon_threads = True
+    print(f"🧪 Mock LLM server on http://{host}:{server.server_port}")
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--ttft", type=float, default=0.3, help="Seconds before the first token")
+    parser.add_argument("--token-delay", type=float, default=0.02, help="Seconds between streamed tokens")
+    parser.add_argument("--ttft-jitter", type=float, default=0.0, help="Up to this many extra seconds before answering")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with an error")
+    parser.add_argument("--error-status", type=int, default=503, help="HTTP status of injected errors (429, 500, 503)")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds sent with 429s")
+    parser.add_argument("--stall-rate", type=float, default=0.0, help="Fraction of requests that hang first")
+    parser.add_argument("--stall", type=float, default=30.0, help="Seconds a stalled request hangs")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+    faults = Faults(args.ttft_jitter, args.error_rate, args.error_status, args.retry_after,
+                    args.stall_rate, args.stall, args.seed)
+    serve(args.host, args.port, args.ttft, args.token_delay, faults).serve_forever()
@@ -0,0 +1,268 @@
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import numpy as np
+import pyarrow as pa
+
+# fp32   - full-precision embedding column (default)
+# fp16   - half-precision embedding column, searched directly
+# int8   - int8 scalar-quantized column for the first pass + fp32 for rescoring
+# binary - 1-bit sign-quantized column (Hamming) for the first pass + fp32 for rescoring
+STORAGE_MODES = ("fp32", "fp16", "int8", "binary")
+
+INT8_COLUMN = "embedding_i8"
+BINARY_COLUMN = "embedding_bin"
+INT8_SCALE_KEY = b"int8_scale"
+
+# First pass keeps top_k * RESCORE_FACTOR candidates for exact rescoring
+RESCORE_FACTOR = 4
+
+# (table name, version, where) -> (row ids, int8 matrix) for the int8 scan;
+# one entry, shared by the search threads of 5-chat.py's batch mode
+_int8_cache = {}
+_int8_lock = threading.Lock()
+
+
+def _fixed_size_list(matrix, value_type):
+    matrix = np.ascontiguousarray(matrix)
+    return pa.FixedSizeListArray.from_arrays(pa.array(matrix.ravel(), type=value_type), matrix.shape[1])
+
+
+def storage_fields(storage, dim):
+    """Arrow fields holding the embedding(s) for a storage mode."""
+    if storage not in STORAGE_MODES:
+        raise ValueError(f"Unknown embedding storage '{storage}', expected one of {STORAGE_MODES}")
+    if storage == "fp16":
+        return [pa.field("embedding", pa.list_(pa.float16(), dim))]
+    fields = [pa.field("embedding", pa.list_(pa.float32(), dim))]
+    if storage == "int8":
+        fields.append(pa.field(INT8_COLUMN, pa.list_(pa.int8(), dim)))
+    elif storage == "binary":
+        fields.append(pa.field(BINARY_COLUMN, pa.list_(pa.uint8(), (dim + 7) // 8)))
+    return fields
+
+
+def detect_storage(schema):
+    names = schema.names
+    if BINARY_COLUMN in names:
+        return "binary"
+    if INT8_COLUMN in names:
+        return "int8"
+    if "embedding" in names and schema.field("embedding").type.value_type == pa.float16():
+        return "fp16"
+    return "fp32"
+
+
+def int8_scale(vectors):
+    """Per-dimension symmetric scale so the largest |value| maps to 127."""
+    scale = np.abs(vectors).max(axis=0).astype(np.float32)
+    scale[scale == 0] = 1.0
+    return scale
+
+
+def quantize_int8(vectors, scale):
+    return np.clip(np.rint(vectors / scale * 127.0), -127, 127).astype(np.int8)
+
+
+def quantize_binary(vectors):
+    return np.packbits(vectors > 0, axis=-1)
+
+
+def read_int8_scale(schema):
+    raw = (schema.metadata or {}).get(INT8_SCALE_KEY)
+    return np.asarray(json.loads(raw), dtype=np.float32) if raw else None
+
+
+def embedding_columns(vectors, storage, scale=None):
+    """
+    Build the Arrow embedding column(s) for `vectors` in the given mode.
+    Returns ({column name: array}, int8 scale or None).
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if storage == "fp16":
+        return {"embedding": _fixed_size_list(vectors.astype(np.float16), pa.float16())}, None
+    columns = {"embedding": _fixed_size_list(vectors, pa.float32())}
+    if storage == "int8":
+        scale = int8_scale(vectors) if scale is None else scale
+        columns[INT8_COLUMN] = _fixed_size_list(quantize_int8(vectors, scale), pa.int8())
+    elif storage == "binary":
+        columns[BINARY_COLUMN] = _fixed_size_list(quantize_binary(vectors), pa.uint8())
+    return columns, scale
+
+
+def _rescore(candidates, query_vector, top_k, keep_embedding):
+    """Exact L2 distance on the fp32 vectors of the first-pass candidates."""
+    if candidates.empty:
+        return candidates
+    matrix = np.stack(candidates["embedding"].to_numpy()).astype(np.float32)
+    diff = matrix - query_vector
+    candidates = candidates.assign(_distance=np.einsum("ij,ij->i", diff, diff))
+    candidates = candidates.sort_values("_distance").head(top_k).reset_index(drop=True)
+    if not keep_embedding:
+        candidates = candidates.drop(columns=["embedding"])
+    return candidates
+
+
+def _int8_matrix(tbl, where):
+    key = (tbl.name, tbl.version, where)
+    with _int8_lock:
+        entry = _int8_cache.get(key)
+    if entry is None:
+        query = tbl.search().select([INT8_COLUMN]).with_row_id(True)
+        if where:
+            query = query.where(where)
+        data = query.limit(None).to_arrow()
+        ids = data["_rowid"].to_numpy()
+        matrix = np.asarray(data[INT8_COLUMN].combine_chunks().flatten(), dtype=np.int8).reshape(len(ids), -1)
+        entry = (ids, matrix)
+        with _int8_lock:
+            _int8_cache.clear()
+            _int8_cache[key] = entry
+    return entry
+
+
+def quantized_search(tbl, query_vector, top_k=5, where=None, columns=None,
+                     storage=None, rescore_factor=RESCORE_FACTOR):
+    """
+    Two-pass search for int8/binary tables: a cheap scan over the quantized
+    column keeps top_k * rescore_factor candidates, which are then rescored
+    against their fp32 vectors. fp32/fp16 tables are searched directly.
+    """
+    storage = storage or detect_storage(tbl.schema)
+    query_vector = np.asarray(query_vector, dtype=np.float32)
+    columns = list(columns or [])
+    keep_embedding = "embedding" in columns
+    fetch = [c for c in columns if c != "embedding"] + ["embedding"]
+    n_candidates = top_k * rescore_factor
+
+    if storage == "binary":
+        query = (
+            tbl.search(quantize_binary(query_vector), vector_column_name=BINARY_COLUMN)
+            .distance_type("hamming")
+        )
+        if where:
+            query = query.where(where, prefilter=True)
+        candidates = query.select(fetch + ["_distance"]).limit(n_candidates).to_pandas()
+        return _rescore(candidates.drop(columns=["_distance"]), query_vector, top_k, keep_embedding)
+
+    if storage == "int8":
+        scale = read_int8_scale(tbl.schema)
+        ids, matrix = _int8_matrix(tbl, where)
+        if not len(ids):
+            return tbl.search().select(fetch).limit(0).to_pandas()
+        # Rows hold x / scale * 127, so the query carries the scale back in:
+        # each dimension is weighted as in the fp32 dot product
+        scores = matrix @ (query_vector * scale)
+        n = min(n_candidates, len(ids))
+        best = np.argpartition(-scores, n - 1)[:n]
+        candidates = tbl.take_row_ids(ids[best].tolist()).select(fetch).to_pandas()
+        return _rescore(candidates, query_vector, top_k, keep_embedding)
+
+    query = tbl.search(query_vector.astype(np.float16) if storage == "fp16" else query_vector,
+                       vector_column_name="embedding")
+    if where:
+        query = query.where(where, prefilter=True)
+    if columns:
+        query = query.select(columns + ["_distance"])
+    return query.limit(top_k).to_pandas()
+
+
+# -----------------------------
+# Footprint / latency / recall benchmark
+# -----------------------------
+def _load_corpus(db_path, table_name, limit):
+    import lancedb
+    tbl = lancedb.connect(db_path).open_table(table_name)
+    data = tbl.search().select(["embedding"]).limit(limit).to_arrow()
+    return np.asarray(data["embedding"].combine_chunks().flatten(), dtype=np.float32).reshape(data.num_rows, -1)
+
+
+def benchmark(vectors, n_queries=100, top_k=10, rescore_factor=RESCORE_FACTOR, seed=0):
+    """
+    Build one table per storage mode from `vectors` and compare disk size,
+    first-pass bytes per row, query latency and recall@k against exact fp32.
+    """
+    import lancedb
+
+    rng = np.random.default_rng(seed)
+    # Re-ingested chunks repeat vectors; duplicates would make recall depend on tie-breaking
+    vectors = np.unique(vectors, axis=0)
+    vectors = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    picks = rng.choice(len(vectors), size=min(n_queries, len(vectors)), replace=False)
+    queries = vectors[picks] + rng.normal(0, 0.02, size=(len(picks), vectors.shape[1])).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    print(f"📐 Benchmarking {len(vectors)} unique vectors, {len(queries)} queries, k={top_k}\n")
+
+    # Exact fp32 ground truth
+    sims = queries @ vectors.T
+    truth = [set(np.argsort(-row)[:top_k]) for row in sims]
+
+    tmp = tempfile.mkdtemp(prefix="quant_bench_")
+    results = []
+    try:
+        db = lancedb.connect(tmp)
+        dim = vectors.shape[1]
+        for storage in STORAGE_MODES:
+            columns, scale = embedding_columns(vectors, storage)
+            fields = [pa.field("chunk_id", pa.int64())] + storage_fields(storage, dim)
+            metadata = {INT8_SCALE_KEY: json.dumps(scale.tolist())} if scale is not None else None
+            data = pa.table({"chunk_id": np.arange(len(vectors)), **columns},
+                            schema=pa.schema(fields, metadata=metadata))
+            tbl = db.create_table(storage, data)
+
+            latencies, hits = [], 0
+            for q, expected in zip(queries, truth):
+                start = time.perf_counter()
+                found = quantized_search(tbl, q, top_k=top_k, columns=["chunk_id"],
+                                         storage=storage, rescore_factor=rescore_factor)
+                latencies.append(time.perf_counter() - start)
+                hits += len(expected & set(found["chunk_id"].tolist()))
+
+            first_pass = {"fp32": 4 * dim, "fp16": 2 * dim, "int8": dim, "binary": (dim + 7) // 8}[storage]
+            disk = sum(os.path.getsize(os.path.join(d, f))
+                       for d, _, files in os.walk(os.path.join(tmp, f"{storage}.lance")) for f in files)
+            results.append({
+                "storage": storage,
+                "disk_bytes": disk,
+                "scan_bytes_per_row": first_pass,
+                "scan_ram_mb": first_pass * len(vectors) / 2 ** 20,
+                "p50_ms": 1000 * float(np.percentile(latencies, 50)),
+                "p99_ms": 1000 * float(np.percentile(latencies, 99)),
+                f"recall@{top_k}": hits / (top_k * len(queries)),
+            })
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare embedding storage modes against fp32.")
+    parser.add_argument("--db", default="lancedb_db")
+    parser.add_argument("--table", default="sp_blocks_vectors")
+    parser.add_argument("--limit", type=int, default=100_000, help="Max corpus vectors to load")
+    parser.add_argument("--synthetic", type=int, default=0, help="Use N random vectors instead of the table")
+    parser.add_argument("--anisotropic", action="store_true",
+                        help="With --synthetic: log-normal per-dimension spread, like real embeddings")
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--rescore-factor", type=int, default=RESCORE_FACTOR)
+    args = parser.parse_args()
+
+    if args.synthetic:
+        rng = np.random.default_rng(1)
+        corpus = rng.standard_normal((args.synthetic, 384)).astype(np.float32)
+        if args.anisotropic:
+            # Isotropic Gaussians give every dimension the same int8 scale and hide scale bugs
+            corpus *= rng.lognormal(0.0, 1.5, size=384).astype(np.float32)
+    else:
+        corpus = _load_corpus(args.db, args.table, args.limit)
+
+    rows = benchmark(corpus, args.queries, args.top_k, args.rescore_factor)
+    header = list(rows[0].keys())
+    print(" | ".join(f"{h:>18}" for h in header))
+    for row in rows:
+        print(" | ".join(f"{v:>18.3f}" if isinstance(v, float) else f"{v:>18}" for v in row.values()))
@@ -1,52 +1,74 @@
+import argparse
+import contextlib
+import functools
 import os
 from agents.mapping_extractor import MappingExtractorAgent
-from embed_and_store import load_model, embed_texts, store_embeddings_lancedb
+from embed_and_store import EMBED_WORKERS, EncodePool, load_model, embed_texts, store_embeddings_lancedb
+from utils.tracing import span, format_trace
 
 from dotenv import load_dotenv
 load_dotenv()
 
 
-def main():
-    print("🔍 Enter the stored procedure name: ", end="")
-    proc_name = input().strip()
-
-    if not proc_name:
-        print("❗ Procedure name is required.")
-        return
-
-    # Load embedding model
-    load_model()
+def ingest_procedure(proc_name):
+    # Load embedding model (the pool workers load their own copy)
+    if EMBED_WORKERS <= 1:
+        load_model()
 
     # Initialize agent
-    agent = MappingExtractorAgent()
-    ddl = agent.fetch_procedure_text(
-        os.getenv("SNOWFLAKE_DATABASE"),
-        os.getenv("SNOWFLAKE_SCHEMA"),
-        proc_name
-    )
+    with span("snowflake.connect"):
+        agent = MappingExtractorAgent()
+    schema = os.getenv("SNOWFLAKE_SCHEMA")
+    with span("snowflake.fetch_ddl", procedure=proc_name):
+        ddl = agent.fetch_procedure_text(
+            os.getenv("SNOWFLAKE_DATABASE"),
+            schema,
+            proc_name
+        )
 
     if not ddl:
         print("❌ No DDL found.")
         return
 
     print("📦 Chunking...")
-    chunks = agent.chunk_sql_text(ddl)
+    with span("ingest.chunk", chars=len(ddl)):
+        chunks = agent.chunk_sql_text(ddl)
     print(f"✅ Generated {len(chunks)} chunks.")
 
-    texts = [c["text"] for c in chunks]
+    # Embeddings are generated batch by batch as they are written; one encode
+    # pool serves every batch instead of starting a new one per batch
+    print("🧮 Embedding and storing in LanceDB...")
+    with EncodePool(EMBED_WORKERS) if EMBED_WORKERS > 1 else contextlib.nullcontext() as pool:
+        store_embeddings_lancedb(
+            db_path="lancedb_db",
+            table_name="sp_blocks_vectors",
+            chunks=chunks,
+            vectors=functools.partial(embed_texts, pool=pool),
+            object_name=proc_name,
+            schema_name=schema or "",
+            object_domain="PROCEDURE"
+        )
 
-    print("🧮 Generating embeddings...")
-    vectors = embed_texts(texts)
+    print("🎉 DONE!")
 
-    print("📁 Storing in LanceDB...")
-    store_embeddings_lancedb(
-        db_path="lancedb_db",
-        table_name="sp_blocks_vectors",
-        chunks=chunks,
-        vectors=vectors
-    )
 
-    print("🎉 DONE!")
+def main():
+    parser = argparse.ArgumentParser(description="Chunk, embed and store one stored procedure in LanceDB.")
+    parser.add_argument("procedure", nargs="?", help="Procedure name (prompted for if omitted)")
+    args = parser.parse_args()
+
+    proc_name = (args.procedure or "").strip()
+    if not proc_name:
+        print("🔍 Enter the stored procedure name: ", end="")
+        proc_name = input().strip()
+
+    if not proc_name:
+        print("❗ Procedure name is required.")
+        return
+
+    with span("ingest.procedure", procedure=proc_name) as root:
+        ingest_procedure(proc_name)
+    print(format_trace(root))
 
 
 if __name__ == "__main__":
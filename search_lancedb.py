@@ -1,6 +1,9 @@
-import lancedb
+import argparse
 import numpy as np
-from sentence_transformers import SentenceTransformer
+from embed_and_store import build_where, search_chunks
+from mmap_index import build_filters
+from table_index import search_index, table_search
+from utils.tracing import span, format_trace
 
 DB_PATH = "lancedb_db"
 TABLE_NAME = "sp_blocks_vectors"
@@ -25,6 +28,24 @@ def normalize_text(value):
 
 
 def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--object", type=str, help="Only search blocks of this object (e.g. a procedure name)")
+    parser.add_argument("--schema", type=str, help="Only search blocks from this schema")
+    parser.add_argument("--domain", type=str, help="Only search this object domain (PROCEDURE, VIEW, ...)")
+    parser.add_argument("--block-type", type=str, help="Only search blocks of this type (SELECT, MERGE, ...)")
+    parser.add_argument("--table", type=str, action="append",
+                        help="Only search blocks that reference this table (repeatable; VBAK or SAPABAP1.VBAK)")
+    parser.add_argument("--writes", action="store_true", help="With --table: only blocks that write the table")
+    parser.add_argument("--backend", choices=["lancedb", "mmap"], default="lancedb",
+                        help="mmap: exact search over a memory-mapped export of the table")
+    args = parser.parse_args()
+    where = build_where(args.object, args.schema, args.domain, args.block_type)
+    filters = build_filters(args.object, args.schema, args.domain, args.block_type)
+
+    # Heavy imports only once the arguments are valid
+    import lancedb
+    from sentence_transformers import SentenceTransformer
+
     print("📁 Connecting to LanceDB...")
     db = lancedb.connect(DB_PATH)
 
@@ -34,32 +55,45 @@ def main():
         return
 
     table = db.open_table(TABLE_NAME)
+    if args.backend == "mmap":
+        from mmap_index import open_index
+        index = open_index(DB_PATH, TABLE_NAME)
+    tables_index = search_index(DB_PATH, TABLE_NAME, required=bool(args.table))
 
     question = input("💬 Enter your question about the SQL logic: ")
 
     print("📦 Loading embedding model...")
-    model = SentenceTransformer(MODEL)
-    query_vector = model.encode(question, convert_to_numpy=True).astype(np.float32)
-
-    print("🔍 Running vector search...")
-
-    try:
-        results = (
-            table.search(query_vector)
-            .limit(5)
-            .to_list()
-        )
-    except Exception as e:
-        print("❌ Search error:", e)
-        print("\n🔍 Dumping a sample problematic row for debugging:")
-        sample = table.head(1)[0]
-        print(sample)
-        return
+    with span("search.query") as root:
+        with span("embed.load_model"):
+            model = SentenceTransformer(MODEL)
+        with span("embed.query"):
+            query_vector = model.encode(question, convert_to_numpy=True).astype(np.float32)
+
+        print("🔍 Running vector search...")
+
+        try:
+            if args.backend == "mmap":
+                run, base = (lambda restriction, k: index.search_chunks(query_vector, top_k=k, filters=restriction),
+                             filters)
+            else:
+                run, base = (lambda restriction, k: search_chunks(table, query_vector, top_k=k, where=restriction),
+                             where)
+            found, names = table_search(run, tables_index, question, args.table, args.writes, base, 5, args.backend)
+            results = found.to_dict("records")
+            if names:
+                print(f"📋 Tables: {', '.join(names)}" + ("" if args.table else " (boosted)"))
+        except Exception as e:
+            print("❌ Search error:", e)
+            print("\n🔍 Dumping a sample problematic row for debugging:")
+            sample = table.head(1)[0]
+            print(sample)
+            return
 
     print("\n=== Top Results ===")
     for r in results:
         print("\n---")
         print(normalize_text(r.get("text", "")))  # safe access + normalize
+    print(f"\n{format_trace(root)}")
 
 
 if __name__ == "__main__":
@@ -1,115 +1,254 @@
 import re
 import sqlglot
-from sqlglot.expressions import Table, Column, Identifier
-from sqlglot.errors import ParseError
+from sqlglot import exp
+from sqlglot.expressions import Table, Column
+from sqlglot.errors import ParseError, TokenError
+from sqlglot.dialects.dialect import Dialect
+from column_lineage import make_schema, statement_lineage
+from sql_splitter import split_statements
+from utils.tracing import span
+from table_index import canonical_table
+
+# Token types after which a table name follows, and whether it is written
+_TABLE_KEYWORDS = {"FROM": False, "JOIN": False, "USING": False,
+                   "INTO": True, "UPDATE": True, "TABLE": True, "VIEW": True}
+_NAME_TOKENS = {"VAR", "IDENTIFIER"}
+_NAME_PATTERN = r'([A-Za-z_"][\w$"]*(?:\.[A-Za-z_"][\w$"]*)*)'
+_READ_REGEX = re.compile(r"\b(?:FROM|JOIN)\s+" + _NAME_PATTERN, re.I)
+_WRITE_REGEX = re.compile(r"\b(?:INTO|UPDATE|TABLE|VIEW)\s+" + _NAME_PATTERN, re.I)
+# Comments, including one the text ends inside of
+_COMMENT_REGEX = re.compile(r"--[^\n]*|/\*.*?(?:\*/|$)", re.S)
+
+
+def _write_target(statement):
+    if isinstance(statement, (exp.Insert, exp.Update, exp.Delete, exp.Merge)) or (
+            isinstance(statement, exp.Create) and str(statement.args.get("kind", "")).upper() in ("TABLE", "VIEW")):
+        target = statement.this
+        return target.this if isinstance(target, exp.Schema) else target
+    return None
+
+
+def _parsed_table_refs(statements):
+    tables, targets = set(), set()
+    for statement in statements:
+        ctes = {cte.alias_or_name.upper() for cte in statement.find_all(exp.CTE)}
+        target = _write_target(statement)
+        for table in statement.find_all(Table):
+            if not table.name or (not table.db and table.name.upper() in ctes):
+                continue
+            name = canonical_table(".".join(p for p in (table.catalog, table.db, table.name) if p))
+            tables.add(name)
+            if table is target:
+                targets.add(name)
+    return tables, targets
+
+
+def _regex_table_refs(sql_text):
+    """Last resort for text that doesn't tokenize, e.g. a chunk that ends inside a string."""
+    from sqlglot.tokens import Tokenizer
+
+    text = _COMMENT_REGEX.sub(" ", sql_text)
+    targets = {canonical_table(m) for m in _WRITE_REGEX.findall(text)}
+    tables = {canonical_table(m) for m in _READ_REGEX.findall(text)} | targets
+    keywords = {name for name in (*tables, *targets) if name in Tokenizer.KEYWORDS}
+    return tables - keywords, targets - keywords
+
+
+def _token_table_refs(tokens):
+    """Tables after FROM/JOIN/INTO/UPDATE/... in a token stream that may start or end mid-statement."""
+    types = [t.token_type.name for t in tokens]
+    n = len(tokens)
+
+    def read_name(j):
+        parts = []
+        while j < n and types[j] in _NAME_TOKENS:
+            parts.append(tokens[j].text)
+            if j + 1 < n and types[j + 1] == "DOT":
+                j += 2
+            else:
+                j += 1
+                break
+        return ".".join(parts), j
+
+    # WITH x AS (...), y AS (...): CTE names, not tables
+    ctes = {tokens[i].text.upper() for i in range(n - 2)
+            if types[i] in _NAME_TOKENS and types[i + 1] == "ALIAS" and types[i + 2] == "L_PAREN"}
+    tables, targets = set(), set()
+    for i, kind in enumerate(types):
+        if kind not in _TABLE_KEYWORDS:
+            continue
+        written = _TABLE_KEYWORDS[kind] or (kind == "FROM" and i > 0 and types[i - 1] == "DELETE")
+        j = i + 1
+        while j < n and types[j] in ("IF", "NOT", "EXISTS"):
+            j += 1
+        while True:
+            name, j = read_name(j)
+            if not name:
+                break
+            name = canonical_table(name)
+            if "." in name or name not in ctes:
+                tables.add(name)
+                if written:
+                    targets.add(name)
+            # FROM a x, b y: keep going after an alias and a comma
+            if kind != "FROM" or written:
+                break
+            if j < n and types[j] == "ALIAS":
+                j += 1
+            if j < n and types[j] in _NAME_TOKENS:
+                j += 1
+            if j + 1 < n and types[j] == "COMMA" and types[j + 1] in _NAME_TOKENS:
+                j += 1
+            else:
+                break
+    return tables, targets
 
 
 class SQLExtractor:
-    def __init__(self):
-        pass
+    def __init__(self, schema=None, database=None, default_schema=None):
+        """
+        `schema` is the {database: {schema: {table: {column: type}}}} mapping
+        from column_lineage.fetch_column_schema; with it, unqualified columns
+        and INSERTs without a column list resolve to their tables.
+        """
+        self.schema = make_schema(schema) if isinstance(schema, dict) else schema
+        self.database = database
+        self.default_schema = default_schema
 
     # -------------------------------------------------
     # CLEAN SNOWFLAKE PROCEDURE TEXT (supports JS/SP)
     # -------------------------------------------------
-    def extract_sql_blocks(self, text):
+    def split_statements(self, text):
         """
-        Extract all SQL statements even if procedure is JavaScript.
+        Extract all SQL statements even if procedure is JavaScript, each
+        exactly once, as {"text", "start", "end"} with offsets into `text`.
         Covers:
         - EXECUTE IMMEDIATE
-        - $$ ... $$
-        - BEGIN ... END
+        - $$ ... $$ and unquoted Snowflake Scripting bodies
+        - BEGIN ... END / IF ... THEN blocks
         - Semi-colon SQL statements
+        See sql_splitter.split_statements.
         """
+        statements = split_statements(text)
 
-        sql_blocks = []
-
-        # 1. Extract SQL within EXECUTE IMMEDIATE '...'
-        exec_sql = re.findall(r"EXECUTE\s+IMMEDIATE\s+'(.*?)'", text, flags=re.S | re.I)
-        sql_blocks.extend(exec_sql)
+        # If nothing found, assume the text itself is SQL
+        if not statements and text.strip():
+            start = len(text) - len(text.lstrip())
+            statements = [{"text": text.strip(), "start": start, "end": start + len(text.strip())}]
+        return statements
 
-        # 2. Extract SQL inside $$ ... $$
-        dollar_sql = re.findall(r"\$\$(.*?)\$\$", text, flags=re.S)
-        sql_blocks.extend(dollar_sql)
-
-        # 3. Extract simple SQL commands (fallback)
-        basic_sql = re.findall(r"(SELECT.*?;|INSERT.*?;|UPDATE.*?;|DELETE.*?;|MERGE.*?;)",
-                               text, flags=re.S | re.I)
-        sql_blocks.extend(basic_sql)
-
-        # 4. If nothing found, assume the text itself is SQL
-        if not sql_blocks:
-            sql_blocks = [text]
-
-        return [block.strip() for block in sql_blocks]
+    def extract_sql_blocks(self, text):
+        return [statement["text"] for statement in self.split_statements(text)]
 
     # -------------------------------------------------
     # PARSE SQL AND EXTRACT TABLES + COLUMNS
     # -------------------------------------------------
     def parse_sql(self, sql_text):
         try:
-            parsed = sqlglot.parse_one(sql_text, read="snowflake")
-        except ParseError:
+            # parse, not parse_one: a block holding several statements keeps all of them
+            expressions = [e for e in sqlglot.parse(sql_text, read="snowflake") if e is not None]
+        except (ParseError, TokenError):
             return {
                 "tables": [],
                 "columns_read": [],
                 "columns_written": [],
+                "column_lineage": [],
                 "statements": []
             }
 
         tables = []
         columns_read = []
-        columns_written = []
+        lineage = []
 
-        # Extract tables
-        for table in parsed.find_all(Table):
-            tables.append(table.sql())
+        for parsed in expressions:
+            # Extract tables
+            for table in parsed.find_all(Table):
+                tables.append(table.sql())
 
-        # Extract columns
-        for col in parsed.find_all(Column):
-            columns_read.append(col.sql())
-
-        # Detect writes (INSERT, UPDATE, MERGE)
-        if parsed.find("Insert"):
+            # Extract columns
             for col in parsed.find_all(Column):
-                columns_written.append(col.sql())
+                columns_read.append(col.sql())
 
-        if parsed.find("Update"):
-            for col in parsed.find_all(Identifier):
-                columns_written.append(col.sql())
+            # Written columns are the lineage targets, not every identifier in the statement
+            lineage.extend(statement_lineage(parsed, self.schema, self.database, self.default_schema))
 
-        if parsed.find("Merge"):
-            for col in parsed.find_all(Identifier):
-                columns_written.append(col.sql())
+        columns_written = [
+            ".".join(p for p in (e["target_schema"], e["target_table"], e["target_column"]) if p)
+            for e in lineage
+        ]
 
         return {
             "tables": list(set(tables)),
             "columns_read": list(set(columns_read)),
             "columns_written": list(set(columns_written)),
-            "statements": [parsed.sql()]
+            "column_lineage": lineage,
+            "statements": [parsed.sql() for parsed in expressions]
         }
 
+    # -------------------------------------------------
+    # TABLES READ / WRITTEN (chunk metadata)
+    # -------------------------------------------------
+    def table_refs(self, sql_text):
+        """
+        {"tables": every table referenced, "targets": the ones written},
+        as canonical_table names, for whole statements or a fragment of
+        one such as an ingest chunk. Parsed with sqlglot when possible,
+        otherwise read off the token stream (or, for text that does not
+        even tokenize, matched with regexes). CTE names are left out.
+        """
+        try:
+            statements = [e for e in sqlglot.parse(sql_text, read="snowflake") if e is not None]
+            tables, targets = _parsed_table_refs(statements)
+        except (ParseError, TokenError):
+            tables, targets = set(), set()
+        if not tables:
+            try:
+                tables, targets = _token_table_refs(Dialect.get_or_raise("snowflake").tokenize(sql_text))
+            except TokenError:
+                tables, targets = _regex_table_refs(sql_text)
+        return {"tables": sorted(tables), "targets": sorted(targets)}
+
     # -------------------------------------------------
     # MAIN FUNCTION: FULL EXTRACTION
     # -------------------------------------------------
     def extract_all(self, raw_text):
-        sql_blocks = self.extract_sql_blocks(raw_text)
+        with span("sql.extract_all", chars=len(raw_text)) as s:
+            result = self._extract_all(raw_text)
+            s.set(statements=len(result["statements"]), tables=len(result["tables"]))
+        return result
+
+    def _extract_all(self, raw_text):
+        with span("sql.split_statements") as s:
+            sql_blocks = self.split_statements(raw_text)
+            s.set(statements=len(sql_blocks))
 
         all_tables = set()
         all_read = set()
         all_written = set()
+        column_lineage = []
         statements = []
+        offsets = []
+        # Procedures often repeat a statement verbatim; parse each distinct text once
+        parsed_by_text = {}
 
-        for block in sql_blocks:
-            parsed = self.parse_sql(block)
+        for index, block in enumerate(sql_blocks):
+            offsets.append([block["start"], block["end"]])
+            parsed = parsed_by_text.get(block["text"])
+            if parsed is None:
+                with span("sql.parse", chars=len(block["text"])):
+                    parsed = parsed_by_text[block["text"]] = self.parse_sql(block["text"])
 
             all_tables.update(parsed["tables"])
             all_read.update(parsed["columns_read"])
             all_written.update(parsed["columns_written"])
+            column_lineage.extend({**edge, "statement_index": index} for edge in parsed["column_lineage"])
             statements.extend(parsed["statements"])
 
         return {
             "tables": list(all_tables),
             "columns_read": list(all_read),
             "columns_written": list(all_written),
-            "statements": statements
+            "column_lineage": column_lineage,
+            "statements": statements,
+            "statement_offsets": offsets
         }
@@ -0,0 +1,280 @@
+import os
+
+# Retrieved SQL is minified before prompting once the context's raw token
+# count exceeds CONTEXT_MINIFY_MIN_TOKENS; CONTEXT_MINIFY=0 turns it off
+CONTEXT_MINIFY = os.getenv("CONTEXT_MINIFY", "1") != "0"
+MINIFY_MIN_TOKENS = int(os.getenv("CONTEXT_MINIFY_MIN_TOKENS", 400))
+
+DIALECT = "snowflake"
+
+# Literal lists longer than MAX_LITERALS keep their first KEEP_LITERALS values:
+#   IN ('ZC','WE','RE','RG','YU','ZP','ZS') -> IN ('ZC','WE','RE',...4 more)
+MAX_LITERALS = 6
+KEEP_LITERALS = 3
+
+# More than MAX_ROWS literal tuples in a row (VALUES (...),(...),...) keep the first KEEP_ROWS
+MAX_ROWS = 3
+KEEP_ROWS = 2
+
+# A run of at least this many tokens already seen in the context (a repeated
+# column list, a copied CASE block) is replaced by a reference to the first copy
+MIN_REPEAT_TOKENS = 24
+
+_LITERALS = {"STRING", "NUMBER", "NULL", "TRUE", "FALSE", "NATIONAL_STRING", "RAW_STRING",
+             "HEX_STRING", "BIT_STRING", "BYTE_STRING", "PLACEHOLDER"}
+_NO_SPACE_BEFORE = {"COMMA", "L_PAREN", "R_PAREN", "SEMICOLON", "DOT", "R_BRACKET", "DCOLON"}
+_NO_SPACE_AFTER = {"COMMA", "L_PAREN", "DOT", "L_BRACKET", "DCOLON"}
+
+
+class _Tok:
+    __slots__ = ("text", "type", "start", "end")
+
+    def __init__(self, text, type_, start=None, end=None):
+        self.text = text
+        self.type = type_
+        self.start = start
+        self.end = end
+
+
+def _placeholder(text):
+    return _Tok(text, "MINIFIED")
+
+
+def _tokenize(text, dialect):
+    """Tokens with their exact source text (quotes and case kept), or None if the text doesn't tokenize."""
+    from sqlglot.dialects.dialect import Dialect
+    from sqlglot.errors import TokenError
+
+    # The generic dialect covers scripts the main one rejects, e.g. MySQL's DELIMITER $$
+    for name in dict.fromkeys((dialect, "")):
+        d = Dialect.get_or_raise(name)
+        try:
+            tokens = d.tokenize(text)
+        except TokenError:
+            continue
+        return _with_commands(text, tokens, {t.name for t in d.tokenizer_class.COMMANDS})
+    # e.g. a chunk that starts or ends inside a quote or block comment
+    return None
+
+
+def _with_commands(text, tokens, commands):
+    """
+    _Toks for sqlglot tokens. A command (CALL, EXECUTE IMMEDIATE, FETCH...)
+    is followed by one token holding the rest of the statement with wrong
+    offsets, so the command is kept verbatim up to its semicolon instead.
+    """
+    out, i = [], 0
+    while i < len(tokens):
+        t = tokens[i]
+        if t.token_type.name not in commands:
+            out.append(_Tok(text[t.start:t.end + 1], t.token_type.name, t.start, t.end))
+            i += 1
+            continue
+        j = i + 1
+        while j < len(tokens) and tokens[j].token_type.name != "SEMICOLON":
+            j += 1
+        end = tokens[j].start if j < len(tokens) else len(text)
+        verbatim = text[t.start:end].rstrip()
+        out.append(_Tok(verbatim, "COMMAND", t.start, t.start + len(verbatim) - 1))
+        i = j
+    return out
+
+
+def _literal(toks, i):
+    """Index after the literal at i (-1.5 counts as one), or None."""
+    if i < len(toks) and toks[i].type == "DASH" and i + 1 < len(toks) and toks[i + 1].type == "NUMBER":
+        return i + 2
+    if i < len(toks) and toks[i].type in _LITERALS:
+        return i + 1
+    return None
+
+
+def _literal_list(toks, i):
+    """For "(" at i followed only by literals: ([end of each literal], index of ")"), else None."""
+    ends, j = [], i + 1
+    while True:
+        end = _literal(toks, j)
+        if end is None or end >= len(toks):
+            return None
+        ends.append(end)
+        if toks[end].type == "R_PAREN":
+            return ends, end
+        if toks[end].type != "COMMA":
+            return None
+        j = end + 1
+
+
+def _collapse_literals(toks):
+    out, i = [], 0
+    while i < len(toks):
+        found = _literal_list(toks, i) if toks[i].type == "L_PAREN" else None
+        if found and len(found[0]) > MAX_LITERALS:
+            ends, close = found
+            out.extend(toks[i:ends[KEEP_LITERALS - 1]])
+            out += [_Tok(",", "COMMA"), _placeholder(f"...{len(ends) - KEEP_LITERALS} more"), toks[close]]
+            i = close + 1
+            continue
+        out.append(toks[i])
+        i += 1
+    return out
+
+
+def _collapse_rows(toks):
+    out, i = [], 0
+    while i < len(toks):
+        rows = []
+        j = i
+        while j < len(toks) and toks[j].type == "L_PAREN":
+            found = _literal_list(toks, j)
+            if not found:
+                break
+            rows.append((j, found[1] + 1))
+            j = found[1] + 1
+            if j < len(toks) and toks[j].type == "COMMA" and j + 1 < len(toks) and toks[j + 1].type == "L_PAREN":
+                j += 1
+            else:
+                break
+        if len(rows) > MAX_ROWS:
+            out.extend(toks[i:rows[KEEP_ROWS - 1][1]])
+            out += [_Tok(",", "COMMA"), _placeholder(f"...{len(rows) - KEEP_ROWS} more rows")]
+            i = rows[-1][1]
+            continue
+        if rows:
+            out.extend(toks[i:rows[-1][1]])
+            i = rows[-1][1]
+            continue
+        out.append(toks[i])
+        i += 1
+    return out
+
+
+def _find_repeats(streams, min_tokens):
+    """
+    Greedy left-to-right search, across all streams, for runs of at least
+    `min_tokens` tokens equal to an earlier run that is still emitted.
+    Returns {(stream, pos): (src_stream, src_pos, length)}.
+    """
+    seen, keys, repeats = {}, {}, {}
+    starts = {}  # stream -> positions where a repeat starts (a source can't run into one)
+    for s, toks in enumerate(streams):
+        if toks is None:
+            continue
+        texts = [t.text for t in toks]
+        i = 0
+        while i + min_tokens <= len(texts):
+            key = tuple(texts[i:i + min_tokens])
+            hit = seen.get(key)
+            if hit and (hit[0] != s or hit[1] + min_tokens <= i):
+                hs, hp = hit
+                src = [t.text for t in streams[hs]]
+                limit = min([p for p in starts.get(hs, []) if p > hp] + [len(src)])
+                if hs == s:
+                    limit = min(limit, i)
+                length = min_tokens
+                while i + length < len(texts) and hp + length < limit and src[hp + length] == texts[i + length]:
+                    length += 1
+                repeats[(s, i)] = (hs, hp, length)
+                starts.setdefault(s, []).append(i)
+                # Earlier windows overlapping the replaced run can't be sources any more
+                for p in range(max(0, i - min_tokens + 1), i):
+                    if seen.get(keys.get((s, p))) == (s, p):
+                        del seen[keys[(s, p)]]
+                i += length
+                continue
+            if key not in seen:
+                seen[key] = (s, i)
+                keys[(s, i)] = key
+            i += 1
+    return repeats
+
+
+def _render(toks):
+    parts, prev = [], None
+    for tok in toks:
+        if prev is not None:
+            if prev.type == "SEMICOLON":
+                parts.append("\n")
+            elif prev.end is not None and tok.start is not None and prev.end + 1 == tok.start:
+                pass
+            elif prev.type not in _NO_SPACE_AFTER and tok.type not in _NO_SPACE_BEFORE:
+                parts.append(" ")
+        parts.append(tok.text)
+        prev = tok
+    return "".join(parts)
+
+
+def _squeeze_lines(text):
+    lines = (line.strip() for line in text.splitlines())
+    return "\n".join(line for line in lines if line and not line.startswith("--"))
+
+
+def minify_many(texts, dialect=DIALECT, min_repeat_tokens=MIN_REPEAT_TOKENS):
+    """
+    Minify SQL texts that go into one prompt, tokenized with sqlglot:
+    comments and redundant whitespace are dropped, long literal lists and
+    VALUES rows are cut to their first few entries, and runs repeated from
+    earlier in any of the texts become "/*same as #n*/" references to a
+    first copy marked /*#n:*/ ... /*:#n*/. Identifiers and literals that
+    are kept are emitted exactly as written. Text that doesn't tokenize
+    (a chunk cut inside a quote) only has blank lines and indentation removed.
+    """
+    streams = []
+    for text in texts:
+        toks = _tokenize(text, dialect)
+        streams.append(_collapse_rows(_collapse_literals(toks)) if toks else toks)
+    repeats = _find_repeats(streams, min_repeat_tokens) if min_repeat_tokens else {}
+
+    labels, opens, closes = {}, {}, {}
+    for key, (hs, hp, length) in sorted(repeats.items()):
+        n = labels[key] = len(labels) + 1
+        opens.setdefault((hs, hp), []).append(n)
+        closes.setdefault((hs, hp + length - 1), []).append(n)
+
+    out = []
+    for s, (text, toks) in enumerate(zip(texts, streams)):
+        if toks is None:
+            out.append(_squeeze_lines(text))
+            continue
+        emitted, i = [], 0
+        while i < len(toks):
+            for n in opens.get((s, i), []):
+                emitted.append(_placeholder(f"/*#{n}:*/"))
+            if (s, i) in repeats:
+                emitted.append(_placeholder(f"/*same as #{labels[(s, i)]}*/"))
+                i += repeats[(s, i)][2]
+                continue
+            emitted.append(toks[i])
+            for n in reversed(closes.get((s, i), [])):
+                emitted.append(_placeholder(f"/*:#{n}*/"))
+            i += 1
+        out.append(_render(emitted))
+    return out
+
+
+def minify_sql(text, dialect=DIALECT):
+    return minify_many([text], dialect)[0]
+
+
+def minify_context(parts, min_tokens=MINIFY_MIN_TOKENS, token_counter=None, keep_header=False):
+    """
+    Minify prompt parts together when their raw total is over `min_tokens`
+    (always with min_tokens=0, never when CONTEXT_MINIFY=0). With
+    `keep_header`, each part's first line is a label kept as is.
+    Returns (parts, {"minified", "tokens_before", "tokens_after"}).
+    """
+    if token_counter is None:
+        from context_assembler import count_tokens as token_counter
+
+    before = sum(token_counter(p) for p in parts)
+    stats = {"minified": False, "tokens_before": before, "tokens_after": before}
+    if not parts or not CONTEXT_MINIFY or before <= min_tokens:
+        return list(parts), stats
+
+    if keep_header:
+        heads, bodies = zip(*[(p.split("\n", 1) + [""])[:2] for p in parts])
+        parts = [f"{head}\n{body}" for head, body in zip(heads, minify_many(bodies))]
+    else:
+        parts = minify_many(parts)
+    stats.update(minified=True, tokens_after=sum(token_counter(p) for p in parts))
+    return parts, stats
+
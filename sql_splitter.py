@@ -0,0 +1,206 @@
+import re
+
+# Refuse inputs larger than this instead of tokenizing them
+MAX_SQL_CHARS = 5_000_000
+
+# Procedure bodies nested deeper than this are not expanded further
+MAX_BODY_DEPTH = 8
+
+# Statements are emitted from the first of these keywords
+STATEMENT_KEYWORDS = {"SELECT", "WITH", "INSERT", "UPDATE", "DELETE", "MERGE", "CREATE", "TRUNCATE", "CALL"}
+
+# Snowflake Scripting words after which a new statement may begin
+# (`BEGIN INSERT ...`, `IF (...) THEN UPDATE ...`, `ELSE DELETE ...`,
+# `c CURSOR FOR SELECT ...`, `RETURN TABLE(SELECT ...)`); a statement may
+# also begin after `:=` or `(`, as in `LET x := (SELECT ...)`
+CONTROL_KEYWORDS = {"BEGIN", "THEN", "ELSE", "DO", "LOOP", "EXCEPTION", "DECLARE", "END", "FOR", "RETURN", "TABLE"}
+
+# Only the header of a statement is needed to classify it
+MAX_HEADER_WORDS = 256
+
+# One alternative per token kind. Unterminated quotes/comments run to the end
+# of the text, so no branch can fail after consuming input (no backtracking).
+_SKIP_PATTERN = r"""
+    (?P<comment>(?:--|//)[^\n]*|/\*(?:[^*]+|\*(?!/))*(?:\*/|\Z))
+  | (?P<dollar>\$\$)
+  | (?P<string>'(?:[^'\\]+|\\.?|'')*(?:'|\Z))
+  | (?P<ident>"(?:[^"]+|"")*(?:"|\Z))
+  | (?P<semi>;)
+"""
+_TOKEN = re.compile(_SKIP_PATTERN + r"""
+  | (?P<word>[A-Za-z_][A-Za-z0-9_$]*)
+  | (?P<assign>:=)
+  | (?P<paren>\()
+""", re.S | re.X)
+
+# Same scanner without words and punctuation, for the body of a statement
+# already classified; _PLAIN jumps over the text between candidate tokens
+# in one C-level step
+_SKIP = re.compile(_SKIP_PATTERN, re.S | re.X)
+_PLAIN = re.compile(r"[^-/$'\";]*")
+
+# String literals inside JavaScript / Python procedure bodies
+_HOST_STRING = re.compile(r"""`(?:[^`\\]|\\.)*`|'(?:[^'\\\n]|\\.)*'|"(?:[^"\\\n]|\\.)*\"""", re.S)
+_LANGUAGE = re.compile(r"\bLANGUAGE\s+(\w+)", re.I)
+_LEADING_KEYWORD = re.compile(r"\s*([A-Za-z]+)")
+
+
+def _unquote(literal):
+    body = literal[1:-1] if len(literal) > 1 and literal[-1] == literal[0] else literal[1:]
+    return body.replace("''", "'").replace("\\'", "'")
+
+
+class _Statement:
+    __slots__ = ("start", "words", "can_start", "keyword", "keyword_pos", "prev_word", "body", "parens",
+                 "keyword_parens")
+
+    def __init__(self):
+        self.start = None
+        self.words = []
+        self.can_start = True
+        self.keyword = None
+        self.keyword_pos = None
+        self.prev_word = None
+        self.body = None
+        self.parens = 0  # "(" right before the current word
+        self.keyword_parens = 0
+
+    def needs_words(self):
+        """Words matter until the statement is classified, and for CREATE headers that may hold a body."""
+        if self.keyword is None:
+            return True
+        return self.keyword == "CREATE" and (
+            len(self.words) < 8 or "PROCEDURE" in self.words or "FUNCTION" in self.words)
+
+    def word(self, word, pos):
+        upper = word.upper()
+        if self.start is None:
+            self.start = pos
+        if len(self.words) < MAX_HEADER_WORDS:
+            self.words.append(upper)
+        if upper in ("DECLARE", "BEGIN") and self.prev_word == "AS" and (
+                "PROCEDURE" in self.words or "FUNCTION" in self.words):
+            # Unquoted Snowflake Scripting body (`... AS DECLARE ... BEGIN ...`):
+            # drop the CREATE header, what follows are the body's statements
+            self.keyword, self.keyword_pos = None, None
+        if self.keyword_pos is None:
+            if self.can_start and upper in STATEMENT_KEYWORDS:
+                self.keyword, self.keyword_pos, self.keyword_parens = upper, pos, self.parens
+            else:
+                self.can_start = upper in CONTROL_KEYWORDS
+        self.prev_word = upper
+        self.parens = 0
+
+    def punct(self, kind, pos):
+        """`:=` or `(` before the statement keyword: `LET x := (SELECT ...)`."""
+        if self.keyword_pos is None:
+            if self.start is None:
+                self.start = pos
+            self.can_start = True
+            self.parens += kind == "paren"
+
+
+def _emit_body(text, body_start, body_end, header, base, depth, out):
+    """Split a procedure / EXECUTE IMMEDIATE body, SQL or host-language."""
+    language = _LANGUAGE.search(header)
+    if language and language.group(1).upper() not in ("SQL",):
+        # JavaScript / Python: SQL only lives in string literals
+        for m in _HOST_STRING.finditer(text, body_start, body_end):
+            content = m.group(0)[1:-1]
+            keyword = _LEADING_KEYWORD.match(content)
+            if keyword and keyword.group(1).upper() in STATEMENT_KEYWORDS:
+                _split(content, base + m.start() + 1, depth + 1, out)
+        return
+    _split(text[body_start:body_end], base + body_start, depth + 1, out)
+
+
+def _finish(text, stmt, end, base, depth, out):
+    if stmt.start is None:
+        return
+    header = " ".join(stmt.words)
+    if stmt.body is not None and depth < MAX_BODY_DEPTH and (
+            "PROCEDURE" in stmt.words or "FUNCTION" in stmt.words or "IMMEDIATE" in stmt.words):
+        kind, body_start, body_end = stmt.body
+        if kind == "dollar":
+            _emit_body(text, body_start, body_end, header, base, depth, out)
+        else:
+            # Quoted body: unescape first; offsets inside it are approximate
+            _split(_unquote(text[body_start:body_end]), base + body_start + 1, depth + 1, out)
+        return
+    if stmt.keyword_pos is None:
+        return
+    sql = text[stmt.keyword_pos:end].rstrip()
+    # `LET x := (SELECT ...);`: drop the parentheses closed after the statement
+    for _ in range(stmt.keyword_parens):
+        if sql.endswith(")") and sql.count(")") > sql.count("("):
+            sql = sql[:-1].rstrip()
+    out.append({"text": sql, "start": base + stmt.keyword_pos, "end": base + stmt.keyword_pos + len(sql)})
+
+
+def _split(text, base, depth, out):
+    stmt = _Statement()
+    pos = 0
+    while True:
+        if stmt.needs_words():
+            m = _TOKEN.search(text, pos)
+            if m is None:
+                break
+        else:
+            pos = _PLAIN.match(text, pos).end()
+            if pos >= len(text):
+                break
+            m = _SKIP.match(text, pos)
+            if m is None:
+                # A lone '-', '/' or '$'
+                pos += 1
+                continue
+        kind = m.lastgroup
+        pos = m.end()
+        if kind == "comment":
+            continue
+        if kind == "semi":
+            _finish(text, stmt, m.start(), base, depth, out)
+            stmt = _Statement()
+            continue
+        if kind == "word":
+            stmt.word(m.group(), m.start())
+            continue
+        if kind in ("assign", "paren"):
+            stmt.punct(kind, m.start())
+            continue
+
+        if stmt.start is None:
+            stmt.start = m.start()
+        body_follows_as = stmt.prev_word in ("AS", "IMMEDIATE") and stmt.body is None
+        if kind == "dollar":
+            close = text.find("$$", pos)
+            close = len(text) if close < 0 else close
+            if body_follows_as:
+                stmt.body = ("dollar", pos, close)
+            pos = min(close + 2, len(text))
+        elif kind == "string" and body_follows_as:
+            stmt.body = ("string", m.start(), m.end())
+        stmt.prev_word = None
+    _finish(text, stmt, len(text), base, depth, out)
+
+
+def split_statements(text, max_chars=MAX_SQL_CHARS):
+    """
+    Split SQL / procedure text into statements in one linear pass.
+
+    Quotes ('...', "..."), comments (--, //, /* */) and $$ bodies are
+    tokenized, so semicolons inside them never split. Procedure and
+    EXECUTE IMMEDIATE bodies are expanded into their own statements
+    instead of being returned whole; Snowflake Scripting control words
+    (BEGIN, IF ... THEN, END ...) are stripped. For JavaScript/Python
+    procedures, SQL is taken from the host language's string literals.
+
+    Returns [{"text", "start", "end"}] with character offsets into `text`,
+    each statement exactly once, in source order.
+    """
+    if len(text) > max_chars:
+        raise ValueError(f"SQL text is {len(text)} characters, over the {max_chars} limit")
+    out = []
+    _split(text, 0, 0, out)
+    return out
+
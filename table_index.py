@@ -0,0 +1,208 @@
+import argparse
+import json
+import os
+import re
+import time
+
+from utils.tracing import span
+
+# Exact "which chunks touch table X" lookups over the tables / targets list
+# columns of a LanceDB chunk table (filled at ingest by
+# embed_and_store.chunk_table_refs):
+#   <table>.tables.json   the postings, and the LanceDB version they were built from
+# A name matches every stored name it is a suffix of: VBAK finds SAPABAP1.VBAK
+# and DB.SAPABAP1.VBAK, SAPABAP1.VBAK only the last two.
+
+# Words in a question shorter than this are never taken for table names
+MIN_MENTION_CHARS = 3
+
+_MENTION = re.compile(r'"?[A-Za-z_][\w$]*"?(?:\."?[A-Za-z_][\w$]*"?)*')
+
+
+def canonical_table(name):
+    """Upper-case dotted name without quotes: "Db".sch.T -> DB.SCH.T."""
+    return ".".join(part.strip().upper() for part in name.replace('"', "").split(".") if part.strip())
+
+
+def name_keys(name):
+    """NAME, SCHEMA.NAME and DB.SCHEMA.NAME forms of a canonical table name."""
+    parts = name.split(".")
+    return [".".join(parts[i:]) for i in range(len(parts))]
+
+
+def index_path(db_path, table_name):
+    return os.path.join(db_path, f"{table_name}.tables.json")
+
+
+def _sql_list(values):
+    return ", ".join("'" + v.replace("'", "''") + "'" for v in values)
+
+
+class TableIndex:
+    """Table name -> chunks that reference / write it, all in memory."""
+
+    def __init__(self, rows, reads, writes, version=None):
+        self.rows = rows  # row -> (object_name, chunk_id); chunk_id alone isn't unique
+        self.reads = reads  # full name -> [row]
+        self.writes = writes
+        self.version = version
+        self.keys = {}
+        for name in reads:
+            for key in name_keys(name):
+                self.keys.setdefault(key, []).append(name)
+
+    @classmethod
+    def from_columns(cls, objects, chunk_ids, tables, targets, version=None):
+        reads, writes = {}, {}
+        for row, (read, written) in enumerate(zip(tables, targets)):
+            for name in read or ():
+                reads.setdefault(name, []).append(row)
+            for name in written or ():
+                writes.setdefault(name, []).append(row)
+        return cls([(o, int(c)) for o, c in zip(objects, chunk_ids)], reads, writes, version)
+
+    @classmethod
+    def from_table(cls, tbl):
+        from embed_and_store import REF_COLUMNS
+
+        if not all(c in tbl.schema.names for c in REF_COLUMNS):
+            raise ValueError("The table has no tables/targets columns. Re-ingest it to enable table lookups.")
+        data = tbl.search().select(["object_name", "chunk_id", *REF_COLUMNS]).limit(None).to_arrow()
+        return cls.from_columns(*(data.column(c).to_pylist() for c in ("object_name", "chunk_id", *REF_COLUMNS)),
+                                version=tbl.version)
+
+    def save(self, path):
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"version": self.version, "rows": self.rows, "reads": self.reads, "writes": self.writes}, f)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        return cls([tuple(r) for r in data["rows"]], data["reads"], data["writes"], data["version"])
+
+    def resolve(self, name):
+        """Stored full names that `name` (any qualification, any case) refers to."""
+        return sorted(self.keys.get(canonical_table(name), ()))
+
+    def lookup(self, name, written=False):
+        """(object_name, chunk_id) of every chunk that references `name`, or with `written` writes to it."""
+        postings = self.writes if written else self.reads
+        rows = sorted({row for full in self.resolve(name) for row in postings.get(full, ())})
+        return [self.rows[row] for row in rows]
+
+    def mentions(self, text):
+        """Stored full names of the tables named in free text such as a question."""
+        found = set()
+        for word in _MENTION.findall(text):
+            key = canonical_table(word)
+            if len(key) >= MIN_MENTION_CHARS:
+                found.update(self.keys.get(key, ()))
+        return sorted(found)
+
+    def restriction(self, names, written=False, backend="lancedb"):
+        """
+        Chunks referencing (with `written`, writing) any of the stored full
+        `names`: a LanceDB where clause, or mmap_index filters with
+        backend="mmap". None if `names` is empty.
+        """
+        if not names:
+            return None
+        column = "targets" if written else "tables"
+        if backend == "mmap":
+            return {column: list(names)}
+        return f"array_has_any({column}, [{_sql_list(names)}])"
+
+
+def _combine(base, extra):
+    if base is None or extra is None:
+        return extra if base is None else base
+    if isinstance(base, dict):
+        return {**base, **extra}
+    return f"({base}) AND {extra}"
+
+
+def table_search(search, index, query="", tables=None, written=False, base=None, top_k=5, backend="lancedb"):
+    """
+    search(restriction, k) -> hits DataFrame, run against a TableIndex
+    (None: plain search). With `tables`, only chunks referencing (or with `written`, writing)
+    one of them are searched; otherwise chunks of tables named in `query`
+    come first and the unrestricted search fills the rest. `base` is the
+    metadata where clause / filters both are combined with.
+    Returns (hits, stored names used).
+    """
+    import pandas as pd
+
+    if index is None:
+        return search(base, top_k), []
+    if tables:
+        names = sorted({full for name in tables for full in index.resolve(name)})
+        if not names:
+            return pd.DataFrame(), []
+        return search(_combine(base, index.restriction(names, written, backend)), top_k), names
+
+    names = index.mentions(query) if query else []
+    if not names:
+        return search(base, top_k), []
+    first = search(_combine(base, index.restriction(names, backend=backend)), top_k)
+    if len(first) >= top_k:
+        return first, names
+    rest = search(base, top_k)
+    hits = pd.concat([first, rest], ignore_index=True)
+    hits = hits.drop_duplicates(["object_name", "chunk_id"]).head(top_k).reset_index(drop=True)
+    return hits, names
+
+
+def open_table_index(db_path, table_name, rebuild=False):
+    """The TableIndex of a LanceDB table, rebuilt if missing or older than the table."""
+    import lancedb
+
+    path = index_path(db_path, table_name)
+    tbl = lancedb.connect(db_path).open_table(table_name)
+    index = TableIndex.load(path) if not rebuild and os.path.exists(path) else None
+    if index is not None and index.version != tbl.version:
+        print(f"🔄 {table_name} changed since the table index was built (v{index.version} → v{tbl.version})")
+        index = None
+    if index is None:
+        print(f"🗂️  Building table index for {table_name}...")
+        index = TableIndex.from_table(tbl)
+        index.save(path)
+    return index
+
+
+def search_index(db_path, table_name, required=False):
+    """
+    open_table_index for the search CLIs: None for a table ingested before
+    the tables / targets columns existed, unless `required` (--table).
+    """
+    try:
+        with span("table_index.open"):
+            return open_table_index(db_path, table_name)
+    except ValueError as e:
+        if required:
+            raise
+        print(f"⚠️  {e}")
+        return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Exact table name -> chunk lookups over a LanceDB chunk table.")
+    parser.add_argument("job", choices=["build", "lookup"])
+    parser.add_argument("names", nargs="*", help="lookup: table names, any qualification (VBAK, SAPABAP1.VBAK)")
+    parser.add_argument("--writes", action="store_true", help="lookup: only chunks that write the table")
+    parser.add_argument("--db", default="lancedb_db")
+    parser.add_argument("--table", default="sp_blocks_vectors")
+    args = parser.parse_args()
+
+    index = open_table_index(args.db, args.table, rebuild=args.job == "build")
+    print(f"✅ {len(index.reads)} tables over {len(index.rows)} chunks")
+    for name in args.names:
+        start = time.perf_counter()
+        hits = index.lookup(name, written=args.writes)
+        took_us = (time.perf_counter() - start) * 1e6
+        print(f"\n🔎 {name} → {', '.join(index.resolve(name)) or 'unknown table'}: "
+              f"{len(hits)} chunks in {took_us:.0f} µs")
+        for object_name, chunk_id in hits:
+            print(f"  {object_name} #{chunk_id}")
@@ -0,0 +1,16 @@
+import pytest
+
+from sql_minify import minify_sql
+
+
+@pytest.mark.parametrize("text, expected", [
+    # sqlglot tokenizes CALL / EXECUTE as COMMAND + one mis-spanned string: kept verbatim
+    ("CALL SAPABAP1.LOAD_VBAK(:d);\nSELECT 1;", "CALL SAPABAP1.LOAD_VBAK(:d);"),
+    ("EXECUTE IMMEDIATE :stmt USING (v);", "EXECUTE IMMEDIATE :stmt USING (v);"),
+    ("BEGIN\n  CALL DART_MONITOR_AND_ALERT.P_ADD_PROCEDURE_LOG(:PROJECT_CODE, 'X');\nEND;",
+     "CALL DART_MONITOR_AND_ALERT.P_ADD_PROCEDURE_LOG(:PROJECT_CODE, 'X');"),
+    ("SELECT a -- note\nFROM t WHERE x IN ('A','B','C','D','E','F','G');",
+     "SELECT a FROM t WHERE x IN('A','B','C',...4 more);"),
+])
+def test_minify_keeps(text, expected):
+    assert expected in minify_sql(text)
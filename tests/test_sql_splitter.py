@@ -0,0 +1,23 @@
+import pytest
+
+from sql_splitter import split_statements
+
+
+@pytest.mark.parametrize("text, expected", [
+    # Snowflake Scripting: statements start after FOR, := / ( and RETURN TABLE
+    ("DECLARE c CURSOR FOR SELECT a FROM z; BEGIN INSERT INTO t SELECT 1; END;",
+     ["SELECT a FROM z", "INSERT INTO t SELECT 1"]),
+    ("LET x := (SELECT max(a) FROM y);", ["SELECT max(a) FROM y"]),
+    ("LET c CURSOR FOR SELECT a FROM q;", ["SELECT a FROM q"]),
+    ("LET r RESULTSET := (SELECT a FROM (SELECT a FROM s) t);", ["SELECT a FROM (SELECT a FROM s) t"]),
+    ("RETURN TABLE(SELECT * FROM r);", ["SELECT * FROM r"]),
+    ("IF (x > 0) THEN UPDATE t SET a = 1; END IF;", ["UPDATE t SET a = 1"]),
+    ("SELECT a FROM t FOR UPDATE;", ["SELECT a FROM t FOR UPDATE"]),
+])
+def test_statements(text, expected):
+    assert [s["text"] for s in split_statements(text)] == expected
+
+
+def test_cursors_between_inserts():
+    body = "".join(f"INSERT INTO t{i} VALUES (1);\nc{i} CURSOR FOR SELECT a FROM z{i};\n" for i in range(100))
+    assert len(split_statements(f"BEGIN\n{body}END;")) == 200
@@ -0,0 +1,178 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Jobs running at once per process; more wait in the queue
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 4))
+
+# Finished jobs are kept this long so a rerun (or a late session) can still pick up the result
+JOB_KEEP_SECONDS = float(os.getenv("JOB_KEEP_SECONDS", 15 * 60))
+
+ACTIVE = ("queued", "running")
+
+
+class JobCancelled(Exception):
+    """Raised inside a job by Job.check() once cancel() was requested."""
+
+
+class Job:
+    """
+    One background run of fn(job, *args). The function reports through
+    progress() / partial() and calls check() between steps, which raises
+    JobCancelled after cancel(); everything else reads the public fields.
+    Owners (sessions) attach to the job; with owners, cancel() only takes
+    effect once the last one has let go.
+    """
+
+    def __init__(self, key, name):
+        self.key = key
+        self.name = name
+        self.status = "queued"
+        self.stage = ""
+        self.fraction = 0.0
+        self.message = ""
+        self.partials = {}
+        self.result = None
+        self.error = None
+        self.submitted_at = time.time()
+        self.finished_at = None
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+        self._owners = set()
+
+    @property
+    def active(self):
+        return self.status in ACTIVE
+
+    def progress(self, stage, fraction=None, message=""):
+        with self._lock:
+            self.stage = stage
+            if fraction is not None:
+                self.fraction = max(0.0, min(1.0, fraction))
+            self.message = message
+
+    def partial(self, name, value):
+        """Publish an intermediate result, e.g. the answer streamed so far."""
+        with self._lock:
+            self.partials[name] = value
+
+    def check(self):
+        if self._cancel.is_set():
+            raise JobCancelled(f"{self.name} cancelled")
+
+    def attach(self, owner):
+        with self._lock:
+            self._owners.add(owner)
+
+    def cancel(self, owner=None):
+        """
+        Cancel the job. With `owner`, detach that owner only and cancel once
+        no other owner is attached. Returns whether the job was cancelled.
+        """
+        with self._lock:
+            if owner is not None:
+                self._owners.discard(owner)
+                if self._owners:
+                    return False
+            self._cancel.set()
+        return True
+
+    @property
+    def cancel_requested(self):
+        return self._cancel.is_set()
+
+    def snapshot(self):
+        """Consistent copy of the fields for rendering."""
+        with self._lock:
+            return {
+                "key": self.key, "name": self.name, "status": self.status, "stage": self.stage,
+                "fraction": self.fraction, "message": self.message, "partials": dict(self.partials),
+                "error": self.error, "elapsed_s": (self.finished_at or time.time()) - self.submitted_at,
+                "owners": len(self._owners),
+            }
+
+    def _run(self, fn, args):
+        if self._cancel.is_set():
+            self._finish("cancelled")
+            return
+        self.status = "running"
+        try:
+            result = fn(self, *args)
+        except JobCancelled:
+            self._finish("cancelled")
+        except Exception as e:
+            self._finish("failed", error=f"{type(e).__name__}: {e}")
+        else:
+            self._finish("done", result)
+
+    def _finish(self, status, result=None, error=None):
+        with self._lock:
+            self.result, self.error = result, error
+            self.finished_at = time.time()
+            if status == "done":
+                self.fraction = 1.0
+            self.status = status
+
+
+class JobRunner:
+    """
+    Thread pool for work that must outlive a Streamlit rerun. Jobs are
+    keyed: submitting a key whose job is still queued or running returns
+    that job instead of starting another, so reruns and other sessions
+    attach to it. Threads, not processes, because jobs share the
+    Snowflake connection, the embedder and the shared_cache.
+    """
+
+    def __init__(self, workers=JOB_WORKERS, keep_seconds=JOB_KEEP_SECONDS):
+        self.keep_seconds = keep_seconds
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def _prune(self):
+        now = time.time()
+        for key, job in list(self._jobs.items()):
+            if job.finished_at is not None and now - job.finished_at > self.keep_seconds:
+                del self._jobs[key]
+
+    def submit(self, key, name, fn, *args, owner=None):
+        """
+        The running job for `key`, or a new one running fn(job, *args);
+        `owner` is attached to it either way. Returns (job, started).
+        """
+        with self._lock:
+            self._prune()
+            job = self._jobs.get(key)
+            started = job is None or not job.active
+            if started:
+                job = self._jobs[key] = Job(key, name)
+            if owner is not None:
+                job.attach(owner)
+        if started:
+            self._pool.submit(job._run, fn, args)
+        return job, started
+
+    def get(self, key):
+        with self._lock:
+            return self._jobs.get(key)
+
+    def cancel(self, key, owner=None):
+        """Job.cancel() of the job for `key`; False if there is none."""
+        job = self.get(key)
+        return job is not None and job.cancel(owner)
+
+    def forget(self, key):
+        """Drop a finished job once its result was used."""
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is not None and not job.active:
+                del self._jobs[key]
+
+    def info(self):
+        with self._lock:
+            return [job.snapshot() for job in self._jobs.values()]
+
+
+# One instance per process, like shared_cache: jobs survive reruns and are shared by sessions
+jobs = JobRunner()
@@ -0,0 +1,177 @@
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+# Defaults; override with SHARED_CACHE_TTL_SECONDS / SHARED_CACHE_MAX_MB
+DEFAULT_TTL_SECONDS = 15 * 60
+DEFAULT_MAX_MB = 1024
+
+
+def estimate_size(obj):
+    """Approximate deep size in bytes of containers, strings and plain objects."""
+    seen, total, stack = set(), 0, [obj]
+    while stack:
+        o = stack.pop()
+        if id(o) in seen:
+            continue
+        seen.add(id(o))
+        total += sys.getsizeof(o)
+        if isinstance(o, dict):
+            stack.extend(o.keys())
+            stack.extend(o.values())
+        elif isinstance(o, (list, tuple, set, frozenset)):
+            stack.extend(o)
+        elif hasattr(o, "__dict__"):
+            stack.append(vars(o))
+    return total
+
+
+class _Entry:
+    __slots__ = ("value", "size", "expires_at")
+
+    def __init__(self, value, size, expires_at):
+        self.value = value
+        self.size = size
+        self.expires_at = expires_at
+
+
+class _Flight:
+    """One in-progress load; concurrent callers for the same key wait on it."""
+
+    __slots__ = ("done", "value", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class SharedCache:
+    """
+    Thread-safe process-wide cache with per-entry TTL, a total memory bound
+    (least recently used entries are evicted first) and single-flight loads:
+    concurrent get_or_load calls for the same key run the loader once and
+    all receive its result.
+
+    Cached values are shared between callers and must be treated as
+    read-only; replace an entry with put() instead of mutating it.
+    """
+
+    def __init__(self, ttl_seconds=DEFAULT_TTL_SECONDS, max_bytes=DEFAULT_MAX_MB * 1024 * 1024):
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._flights = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "coalesced": 0, "evictions": 0, "expired": 0}
+
+    def _drop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry.size
+
+    def _lookup(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at <= time.monotonic():
+            self._drop(key)
+            self.stats["expired"] += 1
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _store(self, key, value, size, ttl_seconds):
+        self._drop(key)
+        if size > self.max_bytes:
+            # Larger than the whole budget: hand it out, but don't keep it
+            return
+        while self._entries and self._bytes + size > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._drop(oldest)
+            self.stats["evictions"] += 1
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        self._entries[key] = _Entry(value, size, time.monotonic() + ttl)
+        self._bytes += size
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._lookup(key)
+            return default if entry is None else entry.value
+
+    def put(self, key, value, size=None, ttl_seconds=None):
+        size = estimate_size(value) if size is None else size
+        with self._lock:
+            self._store(key, value, size, ttl_seconds)
+
+    def get_or_load(self, key, loader, size_fn=estimate_size, ttl_seconds=None):
+        """
+        Return the cached value for `key`, or run `loader()` once and cache it.
+        Returns (value, source) with source "hit", "load" or "coalesced".
+        A loader exception is raised to every waiting caller and not cached.
+        """
+        with self._lock:
+            entry = self._lookup(key)
+            if entry is not None:
+                self.stats["hits"] += 1
+                return entry.value, "hit"
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.stats["misses"] += 1
+            else:
+                self.stats["coalesced"] += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value, "coalesced"
+
+        try:
+            flight.value = loader()
+            size = size_fn(flight.value)
+            with self._lock:
+                self._store(key, flight.value, size, ttl_seconds)
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.done.set()
+        return flight.value, "load"
+
+    def invalidate(self, key=None):
+        """Drop one key, or everything when key is None."""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+                self._bytes = 0
+            else:
+                self._drop(key)
+
+    def info(self):
+        with self._lock:
+            now = time.monotonic()
+            return {
+                **self.stats,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "keys": [
+                    {"key": key, "mb": round(e.size / 1024 / 1024, 2), "ttl_left_s": round(e.expires_at - now)}
+                    for key, e in self._entries.items()
+                ],
+            }
+
+
+# One instance per process: every Streamlit session (thread) shares it
+shared_cache = SharedCache(
+    ttl_seconds=float(os.getenv("SHARED_CACHE_TTL_SECONDS", DEFAULT_TTL_SECONDS)),
+    max_bytes=int(float(os.getenv("SHARED_CACHE_MAX_MB", DEFAULT_MAX_MB)) * 1024 * 1024),
+)
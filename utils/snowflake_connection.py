@@ -1,7 +1,5 @@
 import os
 from dotenv import load_dotenv
-import snowflake.connector
-from cryptography.hazmat.primitives import serialization
 
 load_dotenv()
 
@@ -10,6 +8,9 @@ def get_connection():
     Establishes a Snowflake connection using JWT authentication
     based on environment variables.
     """
+    # Imported here so modules that only *may* connect don't pay for the connector
+    import snowflake.connector
+    from cryptography.hazmat.primitives import serialization
 
     user = os.getenv("SNOWFLAKE_USER")
     account = os.getenv("SNOWFLAKE_ACCOUNT")
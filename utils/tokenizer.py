@@ -1,6 +1,6 @@
-from transformers import AutoTokenizer
-
 def get_tokenizer(model_name="bert-base-uncased"):
     """Returns a HuggingFace tokenizer (free alternative to OpenAI tokenizer)."""
+    from transformers import AutoTokenizer
+
     tokenizer = AutoTokenizer.from_pretrained(model_name)
     return tokenizer
@@ -0,0 +1,171 @@
+import contextvars
+import functools
+import json
+import os
+import secrets
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Finished spans kept in memory for the Streamlit diagnostics panel
+BUFFER_SIZE = 5000
+
+_current = contextvars.ContextVar("current_span", default=None)
+_finished = deque(maxlen=BUFFER_SIZE)
+_exporters = []
+_lock = threading.Lock()
+
+
+class Span:
+    """One timed stage. Field names follow the OpenTelemetry span model."""
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_span_id", "start_ns", "end_ns",
+                 "attributes", "status")
+
+    def __init__(self, name, trace_id, parent_span_id, attributes):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_span_id = parent_span_id
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = dict(attributes)
+        self.status = "OK"
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    @property
+    def duration_ms(self):
+        end = self.end_ns if self.end_ns is not None else time.time_ns()
+        return (end - self.start_ns) / 1e6
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_span_id": self.parent_span_id,
+            "name": self.name,
+            "start_time_unix_nano": self.start_ns,
+            "end_time_unix_nano": self.end_ns,
+            "duration_ms": self.duration_ms,
+            "attributes": self.attributes,
+            "status": self.status,
+        }
+
+
+class JsonlExporter:
+    """Appends one OpenTelemetry-shaped JSON object per finished span."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, span):
+        line = json.dumps(span.to_dict(), default=str)
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+def add_exporter(exporter):
+    _exporters.append(exporter)
+
+
+def _finish(span):
+    with _lock:
+        _finished.append(span)
+    for exporter in _exporters:
+        try:
+            exporter.export(span)
+        except Exception as e:
+            print(f"⚠️ Trace export failed: {e}")
+
+
+@contextmanager
+def span(name, **attributes):
+    """
+    Time a block as a span. Nested spans share the outer span's trace;
+    a span opened with no active parent starts a new trace.
+    """
+    parent = _current.get()
+    s = Span(name, parent.trace_id if parent else secrets.token_hex(16),
+             parent.span_id if parent else None, attributes)
+    token = _current.set(s)
+    try:
+        yield s
+    except Exception as e:
+        s.status = "ERROR"
+        s.attributes["error"] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        s.end_ns = time.time_ns()
+        _current.reset(token)
+        _finish(s)
+
+
+def traced(name=None):
+    """Decorator form of span(); defaults to the function's qualified name."""
+    def decorator(fn):
+        span_name = name or fn.__qualname__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def recent_spans():
+    with _lock:
+        return list(_finished)
+
+
+def recent_traces(limit=20):
+    """Most recent traces first, as {"root": span, "spans": [spans by start time]}."""
+    by_trace = {}
+    for s in recent_spans():
+        by_trace.setdefault(s.trace_id, []).append(s)
+    traces = []
+    for spans in by_trace.values():
+        root = next((s for s in spans if s.parent_span_id is None), None)
+        if root is None:
+            continue
+        traces.append({"root": root, "spans": sorted(spans, key=lambda s: s.start_ns)})
+    traces.sort(key=lambda t: t["root"].start_ns, reverse=True)
+    return traces[:limit]
+
+
+def format_trace(root):
+    """Plain-text waterfall of a finished trace, for CLI output."""
+    spans = [s for s in recent_spans() if s.trace_id == root.trace_id]
+    depth = {root.span_id: 0}
+    lines = [f"⏱️  {root.name}: {root.duration_ms:.1f} ms"]
+    for s in sorted(spans, key=lambda s: s.start_ns):
+        if s is root:
+            continue
+        depth[s.span_id] = depth.get(s.parent_span_id, 0) + 1
+        offset = (s.start_ns - root.start_ns) / 1e6
+        lines.append(f"{'   ' * depth[s.span_id]}+{offset:>8.1f} ms  {s.name:<24} {s.duration_ms:>9.1f} ms")
+    return "\n".join(lines)
+
+
+def latency_percentiles(window=500, percentiles=(50, 95, 99)):
+    """Rolling latency percentiles (ms) per span name over the last `window` spans of each name."""
+    by_name = {}
+    for s in recent_spans():
+        by_name.setdefault(s.name, deque(maxlen=window)).append(s.duration_ms)
+    rows = []
+    for name, durations in sorted(by_name.items()):
+        ordered = sorted(durations)
+        row = {"span": name, "count": len(ordered)}
+        for p in percentiles:
+            row[f"p{p}_ms"] = ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+        rows.append(row)
+    return rows
+
+
+# TRACE_FILE=traces.jsonl turns on the local JSONL exporter
+if os.getenv("TRACE_FILE"):
+    add_exporter(JsonlExporter(os.getenv("TRACE_FILE")))